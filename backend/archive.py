@@ -0,0 +1,144 @@
+"""
+Streaming ZIP archives of a job's certificates.
+
+The archive is written entry by entry into a small in-memory buffer that is drained after every write,
+so a response never holds more than the entries currently being fetched (ARCHIVE_FETCH_CONCURRENCY)
+regardless of how many certificates the job has. Entries are STORED — PNG and PDF are already compressed.
+"""
+import os
+import re
+import asyncio
+import zipfile
+import datetime
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+from storage import fetch_stored_file
+
+ARCHIVE_FETCH_CONCURRENCY = int(os.getenv("ARCHIVE_FETCH_CONCURRENCY", "8"))
+ARCHIVE_CHUNK_SIZE = 64 * 1024
+
+
+class _ZipSink:
+    """Non-seekable write target for ZipFile; zipfile then emits data descriptors instead of seeking back."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+        self._offset = 0
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def archive_entry_name(recipient_name: Optional[str], certificate_id: str, ext: str) -> str:
+    safe_name = re.sub(r"[^A-Za-z0-9._-]+", "_", recipient_name or "certificate").strip("_") or "certificate"
+    return f"{safe_name}_{certificate_id}.{ext}"
+
+
+async def zip_stream(entries: AsyncIterator[tuple[str, bytes]]) -> AsyncIterator[bytes]:
+    """Turns (name, bytes) pairs into ZIP file chunks as they arrive."""
+    sink = _ZipSink()
+    now = datetime.datetime.utcnow().timetuple()[:6]
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+        async for name, data in entries:
+            info = zipfile.ZipInfo(name, date_time=now)
+            info.compress_type = zipfile.ZIP_STORED
+            # Known size up front lets zipfile pick zip64 headers without seeking back
+            info.file_size = len(data)
+            with zf.open(info, mode="w") as entry:
+                for start in range(0, len(data), ARCHIVE_CHUNK_SIZE):
+                    entry.write(data[start:start + ARCHIVE_CHUNK_SIZE])
+                    chunk = sink.drain()
+                    if chunk:
+                        yield chunk
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    # Central directory
+    chunk = sink.drain()
+    if chunk:
+        yield chunk
+
+
+async def prefetch_ordered(items: AsyncIterator, fetch: Callable[[object], Awaitable[bytes]],
+                           concurrency: int = ARCHIVE_FETCH_CONCURRENCY) -> AsyncIterator[tuple[object, Optional[bytes], Optional[Exception]]]:
+    """
+    Runs fetch() for up to `concurrency` items ahead of the consumer and yields (item, data, error)
+    in input order, so at most `concurrency` payloads are held in memory at once.
+    """
+    pending: deque = deque()
+    iterator = items.__aiter__()
+    exhausted = False
+
+    async def _fill():
+        nonlocal exhausted
+        while not exhausted and len(pending) < concurrency:
+            try:
+                item = await iterator.__anext__()
+            except StopAsyncIteration:
+                exhausted = True
+                return
+            pending.append((item, asyncio.create_task(fetch(item))))
+
+    await _fill()
+    try:
+        while pending:
+            item, task = pending.popleft()
+            try:
+                data, error = await task, None
+            except Exception as e:
+                data, error = None, e
+            await _fill()
+            yield item, data, error
+    finally:
+        for _, task in pending:
+            task.cancel()
+
+
+async def stored_certificate_entries(rows: AsyncIterator, extra_urls: list[tuple[str, str]] = ()) -> AsyncIterator[tuple[str, bytes]]:
+    """
+    ZIP entries for certificates that were uploaded to storage.
+    rows yields (certificate_id, recipient_name, image_url); certificates whose file could not be
+    fetched are listed in a trailing errors.txt instead of failing the whole download.
+    """
+    errors: list[str] = []
+
+    async def _rows_with_extras():
+        for name, url in extra_urls:
+            yield (None, name, url)
+        async for row in rows:
+            if row[2]:
+                yield row
+
+    import aiohttp
+    async with aiohttp.ClientSession() as session:
+        async def _fetch(row):
+            return await fetch_stored_file(row[2], session)
+
+        async for (certificate_id, recipient_name, image_url), data, error in prefetch_ordered(_rows_with_extras(), _fetch):
+            if error is not None:
+                errors.append(f"{certificate_id or recipient_name}\t{image_url}\t{error}")
+                continue
+            if certificate_id is None:
+                # Job-level file (e.g. the combined PDF); recipient_name holds the entry name
+                yield recipient_name, data
+                continue
+            ext = image_url.rsplit(".", 1)[-1].lower() if "." in image_url.rsplit("/", 1)[-1] else "png"
+            yield archive_entry_name(recipient_name, certificate_id, ext), data
+
+    if errors:
+        yield "errors.txt", ("\n".join(errors) + "\n").encode()
@@ -1,6 +1,7 @@
+import asyncio
+import functools
 from datetime import datetime, timedelta
 from typing import Optional
-from passlib.context import CryptContext
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -8,6 +9,7 @@ from sqlalchemy.future import select
 
 from database import get_db
 from models import User
+from cache import TTLCache
 from pydantic import BaseModel
 import jwt
 import os
@@ -15,8 +17,20 @@ import os
 SECRET_KEY = os.getenv("SECRET_KEY", "super-secret-key-change-in-prod")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24
+# Comma-separated emails allowed to use the /api/admin endpoints
+ADMIN_EMAILS = {e.strip().lower() for e in os.getenv("ADMIN_EMAILS", "").split(",") if e.strip()}
+
+# Authenticated users keyed by token subject, so most requests skip the users lookup.
+# A deleted user can keep working for up to AUTH_CACHE_TTL seconds; 0 disables the cache.
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "30"))
+principal_cache = TTLCache(maxsize=int(os.getenv("AUTH_CACHE_SIZE", "10000")), ttl=AUTH_CACHE_TTL)
+
+@functools.lru_cache(maxsize=None)
+def _pwd_context():
+    # passlib/bcrypt are only needed by login and register, so they load on first use
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
 router = APIRouter(prefix="/auth", tags=["auth"])
@@ -30,10 +44,10 @@ class Token(BaseModel):
     token_type: str
 
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return _pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return _pwd_context().hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -52,20 +66,21 @@ async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    hashed_password = get_password_hash(user.password)
+    # bcrypt takes ~250ms of CPU; keep it off the event loop
+    hashed_password = await asyncio.to_thread(get_password_hash, user.password)
     new_user = User(email=user.email, hashed_password=hashed_password)
     db.add(new_user)
     await db.commit()
     await db.refresh(new_user)
     
-    access_token = create_access_token(data={"sub": new_user.email})
+    access_token = create_access_token(data={"sub": new_user.email, "uid": new_user.id})
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.post("/login", response_model=Token)
 async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     result = await db.execute(select(User).where(User.email == form_data.username))
     user = result.scalars().first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    if not user or not await asyncio.to_thread(verify_password, form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -73,7 +88,7 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSessi
         )
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
+        data={"sub": user.email, "uid": user.id}, expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -85,13 +100,16 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession
     )
     
     if token == "mock_token":
-        result = await db.execute(select(User).where(User.email == "mock@credify.io"))
-        user = result.scalars().first()
-        if not user:
-            user = User(email="mock@credify.io", hashed_password="mock")
-            db.add(user)
-            await db.commit()
-            await db.refresh(user)
+        user = principal_cache.get("mock") if AUTH_CACHE_TTL else None
+        if user is None:
+            result = await db.execute(select(User).where(User.email == "mock@credify.io"))
+            user = result.scalars().first()
+            if not user:
+                user = User(email="mock@credify.io", hashed_password="mock")
+                db.add(user)
+                await db.commit()
+                await db.refresh(user)
+            _cache_principal("mock", user, db)
         return user
         
     try:
@@ -101,9 +119,36 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession
             raise credentials_exception
     except jwt.PyJWTError:
         raise credentials_exception
-        
-    result = await db.execute(select(User).where(User.email == email))
-    user = result.scalars().first()
+
+    user_id = payload.get("uid")
+    cache_key = ("uid", user_id) if user_id is not None else ("sub", email)
+    user = principal_cache.get(cache_key) if AUTH_CACHE_TTL else None
+    # Same check as the database path: a token for a previous owner of this user ID must not match
+    if user is not None and user.email == email:
+        return user
+
+    if user_id is not None:
+        # Primary-key lookup; the email check rejects tokens whose user ID was reassigned
+        user = await db.get(User, user_id)
+        if user is not None and user.email != email:
+            user = None
+    else:
+        # Tokens issued before the uid claim existed
+        result = await db.execute(select(User).where(User.email == email))
+        user = result.scalars().first()
     if user is None:
         raise credentials_exception
+    _cache_principal(cache_key, user, db)
     return user
+
+def _cache_principal(key, user: User, db: AsyncSession):
+    if not AUTH_CACHE_TTL:
+        return
+    # Detach it so requests sharing the cached instance never touch each other's sessions
+    db.expunge(user)
+    principal_cache.set(key, user)
+
+async def get_admin_user(current_user: User = Depends(get_current_user)):
+    if current_user.email.lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return current_user
@@ -0,0 +1,144 @@
+"""
+Authentication latency under concurrent logins.
+
+Runs the app under uvicorn in a child process (fresh SQLite database) and, with and without the principal
+cache (AUTH_CACHE_TTL=0), measures:
+  - authed_get[idle]:   GET /api/projects/?limit=1 from --clients concurrent clients, nothing else running
+  - authed_get[logins]: the same while --logins clients log in back to back (bcrypt on every request)
+  - login[concurrent]:  latency of those logins
+
+    cd backend
+    python benchmarks/bench_auth.py
+    python benchmarks/bench_auth.py --duration 10 --logins 16 --json auth.json
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from harness import BACKEND_DIR, summarize
+
+import aiohttp
+
+EMAIL = "bench@credify.local"
+PASSWORD = "correct horse battery staple"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def summarize_latency(name: str, samples: list[float]) -> dict:
+    result = summarize(name, samples)
+    ordered = sorted(samples)
+    result["p99_ms"] = ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))] * 1000 if ordered else 0.0
+    return result
+
+
+async def _hammer(session: aiohttp.ClientSession, request, stop_at: float, samples: list[float]):
+    while time.perf_counter() < stop_at:
+        started = time.perf_counter()
+        async with request(session) as resp:
+            await resp.read()
+            resp.raise_for_status()
+        samples.append(time.perf_counter() - started)
+
+
+async def run_server_cases(base: str, args, label: str) -> list[dict]:
+    async with aiohttp.ClientSession() as http:
+        async with http.post(f"{base}/auth/register", json={"email": EMAIL, "password": PASSWORD}) as resp:
+            # 400: already registered by the previous server against this database
+            if resp.status != 400:
+                resp.raise_for_status()
+        async with http.post(f"{base}/auth/login", data={"username": EMAIL, "password": PASSWORD}) as resp:
+            resp.raise_for_status()
+            token = (await resp.json())["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        def authed_get(session):
+            return session.get(f"{base}/api/projects/?limit=1", headers=headers)
+
+        def login(session):
+            return session.post(f"{base}/auth/login", data={"username": EMAIL, "password": PASSWORD})
+
+        results = []
+        idle: list[float] = []
+        stop_at = time.perf_counter() + args.duration
+        await asyncio.gather(*(_hammer(http, authed_get, stop_at, idle) for _ in range(args.clients)))
+        results.append(summarize_latency(f"authed_get[idle,{label}]", idle))
+
+        busy: list[float] = []
+        logins: list[float] = []
+        stop_at = time.perf_counter() + args.duration
+        await asyncio.gather(
+            *(_hammer(http, authed_get, stop_at, busy) for _ in range(args.clients)),
+            *(_hammer(http, login, stop_at, logins) for _ in range(args.logins)),
+        )
+        results.append(summarize_latency(f"authed_get[logins,{label}]", busy))
+        results.append(summarize_latency(f"login[concurrent,{label}]", logins))
+        return results
+
+
+async def run_against_server(args, env: dict, label: str) -> list[dict]:
+    port = _free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        async with aiohttp.ClientSession() as http:
+            for _ in range(600):
+                try:
+                    async with http.get(f"{base}/health") as resp:
+                        if resp.status == 200:
+                            break
+                except aiohttp.ClientError:
+                    await asyncio.sleep(0.05)
+        return await run_server_cases(base, args, label)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Authentication latency under concurrent logins")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds per phase")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent authenticated GET clients")
+    parser.add_argument("--logins", type=int, default=8, help="Concurrent login clients")
+    parser.add_argument("--json", help="Also write the raw results to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="credify-auth-")
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": f"sqlite+aiosqlite:///{os.path.join(workdir, 'auth.db')}",
+        "TEMPLATE_STORE_DIR": os.path.join(workdir, "template_store"),
+        "FONT_STORE_DIR": os.path.join(workdir, "font_store"),
+    })
+
+    results = []
+    for label, ttl in (("cache", "30"), ("no_cache", "0")):
+        results += asyncio.run(run_against_server(args, dict(env, AUTH_CACHE_TTL=ttl), label))
+
+    width = max(len(r["name"]) for r in results)
+    print(f"{'case':<{width}}  {'req/s':>8}  {'p50 ms':>9}  {'p95 ms':>9}  {'p99 ms':>9}  {'count':>6}")
+    for r in results:
+        rate = r["iterations"] / args.duration
+        print(f"{r['name']:<{width}}  {rate:>8.1f}  {r['p50_ms']:>9.2f}  {r['p95_ms']:>9.2f}  {r['p99_ms']:>9.2f}  {r['iterations']:>6}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
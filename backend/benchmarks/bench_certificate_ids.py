@@ -0,0 +1,165 @@
+"""
+Certificate ID storage benchmark: on-disk size of the certificates table and its indexes, and primary-key
+lookup latency (the verify/tracking/QR query), for --rows certificates on SQLite in three layouts:
+
+    legacy   36-character text IDs with the old extra index on the primary key
+    string   text IDs, primary key index only (COMPACT_CERTIFICATE_IDS=false)
+    compact  16-byte BLOB IDs (COMPACT_CERTIFICATE_IDS=true; PostgreSQL uses the native 16-byte uuid type)
+
+Each layout is built in a fresh interpreter with the model's own DDL, filled with uuid4 IDs in random order,
+then looked up with the model's column type through SQLAlchemy: once on a new connection (SQLite's page
+cache empty, the OS cache as the build left it) and once more warm. Sizes come from SQLite's dbstat table.
+
+    cd backend
+    python benchmarks/bench_certificate_ids.py                      # 10M rows (several minutes per layout)
+    python benchmarks/bench_certificate_ids.py --rows 1000000 --lookups 50000
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import sqlite3
+import argparse
+import tempfile
+import datetime
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from harness import BACKEND_DIR, percentile
+
+LAYOUTS = ("legacy", "string", "compact")
+INSERT_BATCH = 50_000
+
+
+def build(path: str, layout: str, rows: int, sample_size: int) -> list[str]:
+    """Creates and fills the table; returns a uniform sample of the inserted IDs."""
+    from sqlalchemy import create_engine
+    from models import Certificate
+
+    engine = create_engine(f"sqlite:///{path}")
+    Certificate.__table__.create(engine)
+    engine.dispose()
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA cache_size=-262144")
+    if layout == "legacy":
+        conn.execute("CREATE INDEX ix_certificates_id ON certificates (id)")
+    compact = layout == "compact"
+    rnd = random.Random(0)
+    issued_at = datetime.datetime(2026, 1, 1).isoformat(sep=" ")
+    sample: list[str] = []
+    for start in range(0, rows, INSERT_BATCH):
+        batch = []
+        for i in range(start, min(rows, start + INSERT_BATCH)):
+            cert_id = uuid.UUID(int=rnd.getrandbits(128), version=4)
+            # Reservoir sample, so lookups hit IDs from the whole table
+            if len(sample) < sample_size:
+                sample.append(str(cert_id))
+            elif rnd.random() < sample_size / (i + 1):
+                sample[rnd.randrange(sample_size)] = str(cert_id)
+            batch.append((cert_id.bytes if compact else str(cert_id), 1 + i // 100_000, 1 + i // 1000,
+                          f"recipient{i}@example.com", f"Recipient {i}", issued_at, 0, "Sent"))
+        conn.executemany(
+            "INSERT INTO certificates (id, project_id, job_id, recipient_email, recipient_name, issued_at, "
+            "is_revoked, status) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch)
+        conn.commit()
+    conn.close()
+    return sample
+
+
+def sizes(path: str) -> dict:
+    conn = sqlite3.connect(path)
+    by_name = dict(conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name"))
+    conn.close()
+    pk_index = next(name for name in by_name if name.startswith("sqlite_autoindex_certificates"))
+    return {
+        "table_mb": by_name.get("certificates", 0) / 2**20,
+        "pk_index_mb": by_name[pk_index] / 2**20,
+        "legacy_index_mb": by_name.get("ix_certificates_id", 0) / 2**20,
+        "all_indexes_mb": sum(size for name, size in by_name.items() if name != "certificates") / 2**20,
+        "file_mb": os.path.getsize(path) / 2**20,
+    }
+
+
+def lookups(path: str, ids: list[str]) -> tuple[list[float], list[float]]:
+    """
+    Primary-key lookups as the verify route issues them (the column type converts the bound ID): one pass
+    on a new connection, with SQLite's page cache empty, then the same IDs again.
+    """
+    from sqlalchemy import bindparam, create_engine, select
+    from models import Certificate
+
+    engine = create_engine(f"sqlite:///{path}")
+    query = select(Certificate.__table__).where(Certificate.id == bindparam("cert_id"))
+    passes = []
+    with engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA cache_size=-262144")
+        for _ in range(2):
+            samples = []
+            for cert_id in ids:
+                started = time.perf_counter()
+                row = conn.execute(query, {"cert_id": cert_id}).first()
+                samples.append(time.perf_counter() - started)
+                assert row is not None and row.id == cert_id
+            passes.append(samples)
+    engine.dispose()
+    return passes[0], passes[1]
+
+
+def run_layout(layout: str, rows: int, lookup_count: int) -> dict:
+    path = os.path.join(tempfile.mkdtemp(prefix="credify-ids-"), "certificates.db")
+    started = time.perf_counter()
+    ids = build(path, layout, rows, lookup_count)
+    build_s = time.perf_counter() - started
+    random.Random(1).shuffle(ids)
+    cold, warm = lookups(path, ids)
+    result = {"layout": layout, "rows": rows, "build_s": round(build_s, 1), **sizes(path)}
+    for name, samples in (("cold", cold), ("warm", warm)):
+        result[f"{name}_p50_us"] = percentile(samples, 50) * 1e6
+        result[f"{name}_p95_us"] = percentile(samples, 95) * 1e6
+    os.remove(path)
+    return result
+
+
+def run_child(layout: str, args) -> dict:
+    env = dict(os.environ)
+    env.update({"COMPACT_CERTIFICATE_IDS": "true" if layout == "compact" else "false", "PYTHONPATH": BACKEND_DIR})
+    command = [sys.executable, os.path.abspath(__file__), "--child", layout,
+               "--rows", str(args.rows), "--lookups", str(args.lookups)]
+    out = subprocess.run(command, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000_000, help="Certificates per layout")
+    parser.add_argument("--lookups", type=int, default=20_000, help="Primary-key lookups per pass")
+    parser.add_argument("--layouts", default=",".join(LAYOUTS), help="Comma separated subset of " + ", ".join(LAYOUTS))
+    parser.add_argument("--child", choices=LAYOUTS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_layout(args.child, args.rows, args.lookups)))
+        return 0
+
+    results = []
+    for layout in args.layouts.split(","):
+        results.append(run_child(layout, args))
+        print(f"  {layout}: built {args.rows} rows in {results[-1]['build_s']:.0f}s", file=sys.stderr)
+
+    print(f"{args.rows} certificates, {args.lookups} primary-key lookups per pass")
+    print(f"{'layout':<9} {'table MB':>9} {'pk idx MB':>10} {'legacy MB':>10} {'indexes MB':>11} {'file MB':>8}"
+          f" {'cold p50 us':>12} {'cold p95 us':>12} {'warm p50 us':>12} {'warm p95 us':>12}")
+    for r in results:
+        print(f"{r['layout']:<9} {r['table_mb']:>9.1f} {r['pk_index_mb']:>10.1f} {r['legacy_index_mb']:>10.1f}"
+              f" {r['all_indexes_mb']:>11.1f} {r['file_mb']:>8.1f} {r['cold_p50_us']:>12.1f} {r['cold_p95_us']:>12.1f}"
+              f" {r['warm_p50_us']:>12.1f} {r['warm_p95_us']:>12.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
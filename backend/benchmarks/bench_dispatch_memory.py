@@ -0,0 +1,222 @@
+"""
+Dispatch memory check: runs process_dispatch_job in-process for a small and a large job and fails if the
+peak memory of the large one grows with its row count. Two measures are checked: the Python heap
+(tracemalloc) and the process's anonymous RSS, sampled every few ms from a thread, which also covers
+allocations tracemalloc can't see (Pillow's image and encoder buffers, SQLite's page cache).
+
+Each job runs against a fresh SQLite database in a temp dir with the local storage fallback. SMTP sends are
+replaced by a counter (load_dispatch.py covers the real mail path). Every mode runs by default:
+
+    lazy          certificates dispatched with lazy rendering (--rows, 1000 vs 50000)
+    png, pdf      every certificate rendered, encoded and stored in that format (--render-rows, 200 vs 2000;
+                  much slower)
+    pdf_combined  every certificate a page of the job's single PDF (--render-rows)
+
+A pdf_combined job's output is the document itself, built in memory and uploaded when the job ends, so its
+allowance also grows by COMBINED_OUTPUT_COPIES times the growth of the finished file's size: reportlab holds
+each page as objects around its deflated stream (about three times the page's share of the file), and
+writing the file joins its pieces and copies the result into the upload. Anything more is per-row memory
+the job shouldn't keep (before the template was embedded once per document, that was ~2.8 MB a page).
+
+The job's input rows are allocated before measuring starts. File-backed pages (the SQLite mmap) aren't
+counted in RSS.
+
+    cd backend
+    python benchmarks/bench_dispatch_memory.py                      # every mode
+    python benchmarks/bench_dispatch_memory.py --modes pdf_combined --render-rows 500,5000
+"""
+import io
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+import subprocess
+import tracemalloc
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from harness import BACKEND_DIR, synthetic_template
+
+MODES = ("lazy", "png", "pdf", "pdf_combined")
+COMBINED_OUTPUT_COPIES = 8
+
+
+def synthetic_rows(count: int) -> list[dict]:
+    return [{"Name": f"Recipient {i}", "Email": f"recipient{i}@example.com", "Course": "Distributed Systems"}
+            for i in range(count)]
+
+
+def _anon_rss_bytes() -> Optional[int]:
+    """Resident anonymous memory (heap, C buffers), without file-backed pages; None off Linux."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("RssAnon:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+class RssSampler(threading.Thread):
+    """Highest anonymous RSS seen until stop(); a thread, so it keeps sampling while the event loop is busy."""
+
+    def __init__(self, interval: float = 0.005):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = _anon_rss_bytes()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while self.peak is not None and not self._stop_event.wait(self.interval):
+            self.peak = max(self.peak, _anon_rss_bytes() or 0)
+
+    def stop(self) -> Optional[int]:
+        self._stop_event.set()
+        self.join()
+        return self.peak
+
+
+async def run_job(rows: int, mode: str) -> dict:
+    import database
+    import dispatch
+    from fastapi import UploadFile
+    from models import Project, DispatchJob
+    from storage import upload_file_to_s3, local_path_for_url
+    from template_store import ingest_template
+
+    output_format = "png" if mode == "lazy" else mode
+    sent = {"count": 0}
+
+    def count_send(*args):
+        sent["count"] += 1
+    dispatch.send_smtp_email_sync = count_send
+
+    async with database.engine.begin() as conn:
+        await conn.run_sync(database.create_schema)
+    buf = io.BytesIO()
+    synthetic_template(800, 566).save(buf, format="PNG")
+    template_url = await upload_file_to_s3(UploadFile(filename="template.png", file=io.BytesIO(buf.getvalue())))
+    raster = await asyncio.to_thread(ingest_template, buf.getvalue(), template_url)
+
+    async with database.AsyncSessionLocal() as db:
+        project = Project(
+            name="memory", owner_id=1, template_url=template_url, template_raster=raster["key"],
+            mapping_data=[
+                {"name": "Name", "type": "text", "x": 160, "y": 220, "w": 480, "h": 70, "fontSize": 48},
+                {"name": "Course", "type": "text", "x": 200, "y": 310, "w": 400, "h": 40, "fontSize": 24},
+                {"name": "QR", "type": "qrcode", "x": 660, "y": 420, "w": 100, "h": 100},
+            ],
+        )
+        db.add(project)
+        await db.commit()
+        jobs = []
+        for count in (20, rows):
+            job = DispatchJob(project_id=project.id, total_certificates=count, lazy_render=mode == "lazy",
+                              output_format=output_format)
+            db.add(job)
+            await db.commit()
+            jobs.append(job.id)
+
+    # Warm-up job: first-use imports and caches aren't part of the job's footprint
+    await dispatch.process_dispatch_job(jobs[0], project.id, synthetic_rows(20), "Your certificate", "Hello {{Name}}",
+                                        output_format)
+    csv_data = synthetic_rows(rows)
+    sent["count"] = 0
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    rss_baseline = _anon_rss_bytes()
+    sampler = RssSampler()
+    sampler.start()
+    started = time.perf_counter()
+    await dispatch.process_dispatch_job(jobs[1], project.id, csv_data, "Your certificate", "Hello {{Name}}",
+                                        output_format)
+    elapsed = time.perf_counter() - started
+    rss_peak = sampler.stop()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    async with database.AsyncSessionLocal() as db:
+        output_url = (await db.get(DispatchJob, jobs[1])).output_url
+    await database.engine.dispose()
+    return {
+        "rows": rows,
+        "sent": sent["count"],
+        "seconds": round(elapsed, 1),
+        "peak_mb": round((peak - baseline) / 1e6, 3),
+        "retained_mb": round((current - baseline) / 1e6, 3),
+        "rss_peak_mb": round((rss_peak - rss_baseline) / 1e6, 3) if rss_peak is not None else None,
+        "output_mb": round(os.path.getsize(local_path_for_url(output_url)) / 1e6, 3) if output_url else 0.0,
+    }
+
+
+def run_child(rows: int, mode: str) -> dict:
+    """One job in a fresh interpreter with its own database and storage dir."""
+    workdir = tempfile.mkdtemp(prefix="credify-memory-")
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": f"sqlite+aiosqlite:///{os.path.join(workdir, 'memory.db')}",
+        "TEMPLATE_STORE_DIR": os.path.join(workdir, "template_store"),
+        "FONT_STORE_DIR": os.path.join(workdir, "font_store"),
+        "PYTHONPATH": BACKEND_DIR,
+    })
+    command = [sys.executable, os.path.abspath(__file__), "--child", str(rows), "--child-mode", mode]
+    # Local storage fallback writes under ./local_storage
+    out = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--modes", default=",".join(MODES), help="Comma separated subset of " + ", ".join(MODES))
+    parser.add_argument("--rows", default="1000,50000", help="Small and large lazy job sizes, comma separated")
+    parser.add_argument("--render-rows", default="200,2000", help="Small and large rendered job sizes, comma separated")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="Allowed peak ratio large/small")
+    parser.add_argument("--slack-mb", type=float, default=1.0, help="Allowed absolute heap peak growth in MB")
+    parser.add_argument("--rss-slack-mb", type=float, default=8.0, help="Allowed absolute RSS peak growth in MB")
+    parser.add_argument("--child-mode", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        import storage
+        # Never upload to a bucket configured in .env
+        storage.SUPABASE_URL = storage.SUPABASE_KEY = None
+        print(json.dumps(asyncio.run(run_job(args.child, args.child_mode))))
+        return 0
+
+    status = 0
+    for mode in args.modes.split(","):
+        small, large = (int(n) for n in (args.rows if mode == "lazy" else args.render_rows).split(","))
+        results = []
+        for rows in (small, large):
+            results.append(run_child(rows, mode))
+            r = results[-1]
+            print(f"  {mode} {r['rows']:>6} rows: heap peak {r['peak_mb']:.3f} MB, RSS peak {r['rss_peak_mb']} MB, "
+                  f"{r['sent']} sent in {r['seconds']:.1f}s", file=sys.stderr)
+
+        print(f"{mode:<13}{'rows':>8}  {'peak MB':>9}  {'retained MB':>11}  {'RSS peak MB':>11}  {'output MB':>9}  {'seconds':>8}")
+        for r in results:
+            rss = f"{r['rss_peak_mb']:.3f}" if r["rss_peak_mb"] is not None else "n/a"
+            print(f"{'':<13}{r['rows']:>8}  {r['peak_mb']:>9.3f}  {r['retained_mb']:>11.3f}  {rss:>11}  "
+                  f"{r['output_mb']:>9.3f}  {r['seconds']:>8.1f}")
+        # Only a pdf_combined job keeps its output in memory (output_mb is 0 for every other mode)
+        output_growth = COMBINED_OUTPUT_COPIES * max(0.0, results[1]["output_mb"] - results[0]["output_mb"])
+
+        checks = [("heap", "peak_mb", args.slack_mb), ("RSS", "rss_peak_mb", args.rss_slack_mb)]
+        for label, key, slack in checks:
+            small_peak, large_peak = results[0][key], results[1][key]
+            if small_peak is None or large_peak is None:
+                continue
+            if large_peak > max(small_peak * args.tolerance, small_peak + slack) + output_growth:
+                print(f"\n{mode}: peak {label} grows with job size: {small_peak:.3f} MB at {small} rows, "
+                      f"{large_peak:.3f} MB at {large} rows")
+                status = 1
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""
+Rendering micro-benchmarks: font fitting, preview composition (text and QR), name drawing with and without
+the glyph atlas, PNG encoding (full and banded) and the per-row email templating done by process_dispatch_job.
+
+Runs on synthetic templates at several resolutions with the bundled DejaVu font, so results don't depend
+on network storage or installed fonts. Fails (exit code 1) when a case drops below the stored baseline, when
+text drawn through the glyph atlas differs from draw.text by a single pixel, or when a banded PNG doesn't
+decode (with Pillow) to exactly the image it was encoded from.
+
+    cd backend
+    python benchmarks/bench_render.py                    # compare against benchmarks/baseline_render.json
+    python benchmarks/bench_render.py --filter preview   # subset
+    python benchmarks/bench_render.py --update-baseline  # after an intended change, on the CI machine
+"""
+import io
+import os
+import sys
+import itertools
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from harness import BUNDLED_FONT, BENCH_DIR, argument_parser, run_cases, synthetic_template
+
+import services
+from services import get_font, generate_preview, encode_image, draw_text, render_placeholder, BandedPngEncoder
+from dispatch import render_dispatch_email
+
+# Landscape A4 at 100, 200 and 300 dpi
+RESOLUTIONS = {
+    "a4_100dpi": (1169, 827),
+    "a4_200dpi": (2339, 1654),
+    "a4_300dpi": (3508, 2480),
+}
+
+NAMES = {
+    "short": "Ana Li",
+    "medium": "Alexandra Montgomery-Smith",
+    "long": "Maximiliana Theodora Wolfeschlegelsteinhausen-Bergerdorff III",
+}
+
+
+def render_certificate_image(template, name: str, scale: float):
+    """(certificate, touched rows) with a name field and a QR code, as dispatch renders them."""
+    w, h = template.size
+    certificate = template.copy()
+    touched_rows = []
+    render_placeholder(
+        certificate, b"", name, bbox_x=w // 2, bbox_y=int(h * 0.45), bbox_width=int(2400 * scale),
+        bbox_height=int(300 * scale), text_color="#1f2937", initial_font_size=int(250 * scale),
+        font_path=BUNDLED_FONT, touched_rows=touched_rows,
+    )
+    qr_size = int(500 * scale)
+    render_placeholder(
+        certificate, b"", "", bbox_x=w // 2, bbox_y=int(h * 0.78), bbox_width=qr_size, bbox_height=qr_size,
+        text_color="#000000", is_qrcode=True, touched_rows=touched_rows,
+        qr_url="https://credify.gnmlabs.com/verify/0f8fad5b-d9cb-469f-a165-70867728950e",
+    )
+    return certificate, touched_rows
+
+
+def build_cases() -> dict:
+    font_bytes = open(BUNDLED_FONT, "rb").read()
+    cases = {}
+
+    for label, name in NAMES.items():
+        cases[f"get_font[path,{label}]"] = lambda name=name: get_font(b"", name, 1600, 250, 200, font_path=BUNDLED_FONT)
+        cases[f"get_font[bytes,{label}]"] = lambda name=name: get_font(font_bytes, name, 1600, 250, 200)
+
+    for res_label, (w, h) in RESOLUTIONS.items():
+        template = synthetic_template(w, h)
+        template_png = encode_image(template, "PNG")
+        scale = w / 3508
+        text_box = dict(bbox_x=w // 2, bbox_y=int(h * 0.45), bbox_width=int(2400 * scale), bbox_height=int(300 * scale))
+        qr_size = int(500 * scale)
+
+        cases[f"preview_text[{res_label}]"] = lambda template_png=template_png, text_box=text_box, scale=scale: generate_preview(
+            template_png, b"", NAMES["medium"], text_color="#1f2937",
+            initial_font_size=int(250 * scale), font_path=BUNDLED_FONT, **text_box
+        )
+        cases[f"preview_qr[{res_label}]"] = lambda template_png=template_png, w=w, h=h, qr_size=qr_size: generate_preview(
+            template_png, b"", "", bbox_x=w // 2, bbox_y=int(h * 0.78), bbox_width=qr_size, bbox_height=qr_size,
+            text_color="#000000", is_qrcode=True, qr_url="https://credify.gnmlabs.com/verify/0f8fad5b-d9cb-469f-a165-70867728950e"
+        )
+        cases[f"png_encode[{res_label}]"] = lambda template=template: encode_image(template, "PNG")
+
+        # A certificate with a name and a QR code, encoded by a job's banded encoder
+        encoder = BandedPngEncoder(template)
+        certificate, touched_rows = render_certificate_image(template, NAMES["medium"], scale)
+        cases[f"png_encode_banded[{res_label}]"] = lambda encoder=encoder, certificate=certificate, touched_rows=touched_rows: (
+            encoder.encode(certificate, touched_rows)
+        )
+
+    # Name field of a 300dpi job: a different recipient on every call, same font and size
+    template = synthetic_template(*RESOLUTIONS["a4_300dpi"])
+    font = get_font(b"", NAMES["medium"], 2400, 300, 250, font_path=BUNDLED_FONT)
+    recipients = itertools.cycle([f"{first} {last}" for first in ("Ana", "Rahul", "Chen", "Olivia", "Mateo", "Aisha")
+                                  for last in ("Li", "Montgomery-Smith", "Okafor", "Ivanova", "Fernández")])
+
+    def draw_name(atlas: bool):
+        services.GLYPH_ATLAS = atlas
+        try:
+            draw_text(template, (600.5, 1000), next(recipients), "#1f2937", font)
+        finally:
+            services.GLYPH_ATLAS = False
+
+    cases["draw_name[freetype]"] = lambda: draw_name(False)
+    cases["draw_name[atlas]"] = lambda: draw_name(True)
+
+    row = {"Name": NAMES["medium"], "Email": "alexandra@example.com", "Course": "Distributed Systems",
+           "Grade": "A", "Date": "2026-03-01", "Instructor": "Dr. Rivera", "Hours": "42",
+           "City": "Chennai", "Track": "Advanced", "Cohort": "Spring"}
+    body = (
+        "<p>Hi {Name},</p><p>Congratulations on completing {Course} ({Track}, {Cohort} cohort) with grade {Grade} "
+        "on {Date}. Your instructor {Instructor} confirmed {Hours} hours in {City}.</p>{credential_button}"
+        "<p>Regards,<br/>{project_name}</p>"
+    ) * 3
+    cases["email_template[10_columns]"] = lambda: render_dispatch_email(
+        "Your {Course} certificate, {Name}", body, row, "Credify Academy", "0f8fad5b-d9cb-469f-a165-70867728950e"
+    )
+    return cases
+
+
+def atlas_mismatches() -> list[str]:
+    """Texts for which the glyph atlas output differs from draw.text by any pixel."""
+    from PIL import Image, ImageChops, ImageDraw
+
+    mismatches = []
+    for size in (12, 37, 120, 250):
+        font = get_font(b"", "", 10**6, 10**6, size, font_path=BUNDLED_FONT)
+        for text in (*NAMES.values(), "AVATAR Wolf, To Ya.", "Théodora Łukasz Ærø"):
+            for xy in ((3, 2), (10.5, 7.25), (41.9, 0.6)):
+                expected = Image.new("RGB", (int(size * len(text) * 0.7) + 60, size * 2), (250, 246, 236))
+                actual = expected.copy()
+                ImageDraw.Draw(expected).text(xy, text, fill="#1f2937", font=font)
+                services.GLYPH_ATLAS = True
+                try:
+                    draw_text(actual, xy, text, "#1f2937", font)
+                finally:
+                    services.GLYPH_ATLAS = False
+                if ImageChops.difference(expected, actual).getbbox():
+                    mismatches.append(f"{text!r} at {size}px, {xy}")
+    return mismatches
+
+
+def banded_png_mismatches() -> list[str]:
+    """Certificates whose banded PNG doesn't decode back to the rendered image."""
+    from PIL import Image, ImageChops
+
+    w, h = RESOLUTIONS["a4_100dpi"]
+    # Noise defeats the filters' zero runs and exercises every byte value
+    noisy = Image.merge("RGB", [Image.effect_noise((w, h), sigma) for sigma in (20, 60, 120)])
+    mismatches = []
+    for label, template in (("synthetic", synthetic_template(w, h)), ("noise", noisy)):
+        for band_rows in (1, 7, 32):
+            encoder = BandedPngEncoder(template, band_rows=band_rows)
+            # A CSV value with a newline is drawn over several lines
+            for name in (*NAMES.values(), "gjpqy ...", "ÁÉÍ", "Jane\nDoe Second Line"):
+                certificate, touched_rows = render_certificate_image(template, name, w / 3508)
+                decoded = Image.open(io.BytesIO(encoder.encode(certificate, touched_rows)))
+                if decoded.mode != "RGB" or ImageChops.difference(decoded, certificate).getbbox():
+                    mismatches.append(f"{label} template, {band_rows}-row bands, {name!r}")
+    return mismatches
+
+
+def main() -> int:
+    parser = argument_parser(__doc__.strip().splitlines()[0], os.path.join(BENCH_DIR, "baseline_render.json"))
+    args = parser.parse_args()
+    for title, check in (("Glyph atlas output differs from draw.text", atlas_mismatches),
+                         ("Banded PNG round trip failed", banded_png_mismatches)):
+        mismatches = check()
+        if mismatches:
+            print(f"{title}:")
+            for line in mismatches:
+                print(f"  {line}")
+            return 1
+    return run_cases(build_cases(), args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
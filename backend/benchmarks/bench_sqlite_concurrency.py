@@ -0,0 +1,258 @@
+"""
+SQLite concurrency check: dispatch jobs and API traffic against one SQLite database, counting "database is
+locked" errors and API latency, once with the SQLite profile (SQLITE_TUNING, the default) and once without.
+
+Each mode runs in a fresh interpreter with its own database and storage dir. Dispatch jobs run in-process
+with lazy rendering (so the load is mostly database writes) and SMTP sends replaced by a short sleep. Meanwhile
+API clients loop over project creation, mapping updates, project listing and tracking-pixel opens of
+certificates the jobs have already issued, through the ASGI app, pausing --think-ms on average between
+requests. Two scenarios run for each mode:
+
+    mixed        dispatch and API traffic only
+    long-reader  additionally, a connection outside the app (a backup, an analytics query, a slowly read
+                 report download, a second worker) keeps a read transaction open for --reader-hold-ms at a
+                 time, longer than the 5 s busy timeout. Without WAL a reader blocks every commit, so the
+                 untuned app fails with "database is locked"; with it, readers never block the writer.
+
+Lock errors are counted wherever they are raised (engine handle_error), including ones the app swallows.
+Fails if any tuned run saw a lock error, failed request or failed delivery.
+
+    cd backend
+    python benchmarks/bench_sqlite_concurrency.py                   # 2 jobs x 1000 rows, 16 API clients
+    python benchmarks/bench_sqlite_concurrency.py --jobs 4 --rows 2000 --clients 32 --modes tuned
+    python benchmarks/bench_sqlite_concurrency.py --scenarios long-reader --reader-hold-ms 10000
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import sqlite3
+import tempfile
+import threading
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from harness import BACKEND_DIR, percentile, synthetic_template
+
+AUTH = {"Authorization": "Bearer mock_token"}
+MAPPING = [
+    {"name": "Name", "type": "text", "x": 160, "y": 220, "w": 480, "h": 70, "fontSize": 48},
+    {"name": "QR", "type": "qrcode", "x": 660, "y": 420, "w": 100, "h": 100},
+]
+SCENARIOS = ("mixed", "long-reader")
+
+
+def hold_read_transactions(path: str, hold_ms: float, stop: threading.Event, held: list):
+    """Repeatedly opens a read transaction on its own connection and keeps it open for hold_ms."""
+    conn = sqlite3.connect(path, isolation_level=None)
+    while not stop.is_set():
+        conn.execute("BEGIN")
+        conn.execute("SELECT COUNT(*) FROM certificates").fetchone()
+        held.append(1)
+        stop.wait(hold_ms / 1000)
+        conn.execute("COMMIT")
+        stop.wait(0.2)
+    conn.close()
+
+
+async def run_mode(jobs: int, rows: int, clients: int, send_ms: float, think_ms: float, reader_hold_ms: float) -> dict:
+    import httpx
+    import database
+    import dispatch
+    from sqlalchemy import event, select
+    from fastapi import UploadFile
+    from main import app
+    from models import Project, DispatchJob, Certificate
+    from storage import upload_file_to_s3
+    from template_store import ingest_template
+
+    def slow_send(*args):
+        time.sleep(send_ms / 1000)
+    dispatch.send_smtp_email_sync = slow_send
+    lock_errors = {"count": 0}
+
+    @event.listens_for(database.engine.sync_engine, "handle_error")
+    def _count_lock_error(context):
+        if "database is locked" in str(context.original_exception):
+            lock_errors["count"] += 1
+
+    async with database.engine.begin() as conn:
+        await conn.run_sync(database.create_schema)
+    buf = io.BytesIO()
+    synthetic_template(800, 566).save(buf, format="PNG")
+    template_url = await upload_file_to_s3(UploadFile(filename="template.png", file=io.BytesIO(buf.getvalue())))
+    raster = await asyncio.to_thread(ingest_template, buf.getvalue(), template_url)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=AUTH) as http:
+        # Creates the mock user
+        project_id = (await http.post("/api/projects/", json={"name": "bench", "template_url": template_url})).json()["id"]
+        async with database.AsyncSessionLocal() as db:
+            project = await db.get(Project, project_id)
+            project.mapping_data, project.template_raster = MAPPING, raster["key"]
+            job_ids = []
+            for _ in range(jobs):
+                job = DispatchJob(project_id=project.id, total_certificates=rows, lazy_render=True)
+                db.add(job)
+                await db.commit()
+                job_ids.append(job.id)
+
+        issued: list[str] = []
+        latencies: dict[str, list[float]] = {"create": [], "mapping": [], "list": [], "track": []}
+        failed_requests = {"count": 0}
+        done = asyncio.Event()
+
+        async def request(kind: str, method: str, url: str, **kwargs):
+            started = time.perf_counter()
+            try:
+                ok = (await http.request(method, url, **kwargs)).status_code < 400
+            except Exception:
+                ok = False
+            latencies[kind].append(time.perf_counter() - started)
+            if not ok:
+                failed_requests["count"] += 1
+
+        async def api_client(seed: int):
+            rnd = random.Random(seed)
+            while not done.is_set():
+                pick = rnd.random()
+                if pick < 0.1:
+                    await request("create", "POST", "/api/projects/", json={"name": f"p{seed}", "template_url": template_url})
+                elif pick < 0.2:
+                    await request("mapping", "PUT", f"/api/projects/{project_id}/mapping", json={"mapping_data": MAPPING})
+                elif pick < 0.5 or not issued:
+                    await request("list", "GET", "/api/projects/", params={"limit": 20})
+                else:
+                    await request("track", "GET", f"/api/projects/track/{rnd.choice(issued)}.png", follow_redirects=False)
+                await asyncio.sleep(rnd.expovariate(1000 / think_ms) if think_ms else 0)
+
+        async def collect_issued():
+            # Certificate IDs for the tracking clients, as a mail client would see them
+            while not done.is_set():
+                try:
+                    async with database.AsyncSessionLocal() as db:
+                        result = await db.execute(select(Certificate.id).order_by(Certificate.issued_at.desc()).limit(500))
+                        issued[:] = list(result.scalars())
+                except Exception:
+                    pass  # Already counted as a lock error; keep the previous IDs
+                await asyncio.sleep(0.2)
+
+        def job_rows(job_index: int) -> list[dict]:
+            return [{"Name": f"Recipient {job_index}-{i}", "Email": f"r{job_index}-{i}@example.com"} for i in range(rows)]
+
+        stop_reader, reads_held = threading.Event(), []
+        if reader_hold_ms:
+            reader = threading.Thread(target=hold_read_transactions, daemon=True,
+                                      args=(database.engine.url.database, reader_hold_ms, stop_reader, reads_held))
+            reader.start()
+
+        started = time.perf_counter()
+        workers = [asyncio.create_task(api_client(seed)) for seed in range(clients)]
+        workers.append(asyncio.create_task(collect_issued()))
+        # A job the lock errors crashed outright is counted below, through its status
+        await asyncio.gather(*(
+            dispatch.process_dispatch_job(job_id, project_id, job_rows(i), "Your certificate", "Hello {{Name}}")
+            for i, job_id in enumerate(job_ids)
+        ), return_exceptions=True)
+        elapsed = time.perf_counter() - started
+        done.set()
+        stop_reader.set()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    # Drops connections a failed commit left holding a lock before reading the outcome
+    await database.engine.dispose()
+    async with database.AsyncSessionLocal() as db:
+        finished = [await db.get(DispatchJob, job_id) for job_id in job_ids]
+    await database.engine.dispose()
+    api = [s for samples in latencies.values() for s in samples]
+    return {
+        "tuned": database.IS_SQLITE and database.SQLITE_TUNING,
+        "certificates": sum(j.successful_deliveries for j in finished),
+        "failed_deliveries": sum(j.failed_deliveries for j in finished) + sum(j.status != "completed" for j in finished),
+        "dispatch_s": round(elapsed, 2),
+        "certificates_per_sec": round(sum(j.successful_deliveries for j in finished) / elapsed, 1),
+        "api_requests": len(api),
+        "api_requests_per_sec": round(len(api) / elapsed, 1),
+        "api_failed": failed_requests["count"],
+        "lock_errors": lock_errors["count"],
+        "long_reads": len(reads_held),
+        "api_p50_ms": round(percentile(api, 50) * 1000, 1),
+        "api_p95_ms": round(percentile(api, 95) * 1000, 1),
+        "api_p99_ms": round(percentile(api, 99) * 1000, 1),
+        **{f"{kind}_p95_ms": round(percentile(s, 95) * 1000, 1) for kind, s in latencies.items()},
+    }
+
+
+def run_child(mode: str, scenario: str, args) -> dict:
+    """One mode and scenario in a fresh interpreter with its own database and storage dir."""
+    workdir = tempfile.mkdtemp(prefix="credify-sqlite-")
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": f"sqlite+aiosqlite:///{os.path.join(workdir, 'concurrency.db')}",
+        "SQLITE_TUNING": "true" if mode == "tuned" else "false",
+        "TEMPLATE_STORE_DIR": os.path.join(workdir, "template_store"),
+        "FONT_STORE_DIR": os.path.join(workdir, "font_store"),
+        "PYTHONPATH": BACKEND_DIR,
+    })
+    command = [sys.executable, os.path.abspath(__file__), "--child",
+               "--jobs", str(args.jobs), "--rows", str(args.rows), "--clients", str(args.clients), "--send-ms", str(args.send_ms),
+               "--think-ms", str(args.think_ms),
+               "--reader-hold-ms", str(args.reader_hold_ms if scenario == "long-reader" else 0)]
+    # Local storage fallback writes under ./local_storage
+    out = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--jobs", type=int, default=2, help="Concurrent dispatch jobs")
+    parser.add_argument("--rows", type=int, default=1000, help="Rows per dispatch job")
+    parser.add_argument("--clients", type=int, default=16, help="Concurrent API clients")
+    parser.add_argument("--send-ms", type=float, default=2.0, help="Simulated SMTP send time per certificate")
+    parser.add_argument("--think-ms", type=float, default=50.0, help="Mean pause between an API client's requests")
+    parser.add_argument("--modes", default="tuned,untuned", help="tuned (SQLite profile) and/or untuned, comma separated")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma separated subset of " + ", ".join(SCENARIOS))
+    parser.add_argument("--reader-hold-ms", type=float, default=7000.0, help="How long the long-reader scenario holds each read transaction")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        import storage
+        # Never upload to a bucket configured in .env
+        storage.SUPABASE_URL = storage.SUPABASE_KEY = None
+        logging.basicConfig(level=logging.WARNING)
+        print(json.dumps(asyncio.run(run_mode(args.jobs, args.rows, args.clients, args.send_ms, args.think_ms, args.reader_hold_ms))))
+        return 0
+
+    results = {}
+    for scenario in args.scenarios.split(","):
+        for mode in args.modes.split(","):
+            results[scenario, mode] = r = run_child(mode, scenario, args)
+            print(f"  {scenario}/{mode}: {r['certificates']} certificates in {r['dispatch_s']:.1f}s, "
+                  f"{r['api_requests']} API requests, {r['lock_errors']} lock errors", file=sys.stderr)
+
+    keys = [k for k in next(iter(results.values())) if k != "tuned"]
+    print(f"{'':<22}" + "".join(f"{scenario + '/' + mode:>21}" for scenario, mode in results))
+    for key in keys:
+        print(f"{key:<22}" + "".join(f"{r[key]:>21}" for r in results.values()))
+
+    status = 0
+    for (scenario, mode), r in results.items():
+        if mode == "tuned" and (r["lock_errors"] or r["api_failed"] or r["failed_deliveries"]):
+            print(f"\n{scenario}: SQLite profile run had {r['lock_errors']} lock errors, {r['api_failed']} failed "
+                  f"requests and {r['failed_deliveries']} failed deliveries")
+            status = 1
+    untuned = results.get(("long-reader", "untuned"))
+    if untuned and not untuned["lock_errors"]:
+        print("\nlong-reader: the untuned run saw no lock errors, so this run doesn't show what the profile prevents "
+              "(raise --reader-hold-ms above the busy timeout)")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
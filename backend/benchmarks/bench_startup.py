@@ -0,0 +1,118 @@
+"""
+Cold-start benchmarks: import time of main.py and time from process spawn to the first /health response
+under uvicorn, for STARTUP_MODE=full and STARTUP_MODE=fast. Every run is a fresh interpreter.
+
+    cd backend
+    python benchmarks/bench_startup.py                   # compare against benchmarks/baseline_startup.json
+    python benchmarks/bench_startup.py --runs 20
+    python benchmarks/bench_startup.py --database-url postgresql+asyncpg://...   # include a remote schema check
+"""
+import os
+import sys
+import time
+import socket
+import tempfile
+import subprocess
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from harness import BACKEND_DIR, BENCH_DIR, argument_parser, summarize, print_results, compare_with_baseline, write_baseline
+
+# Modules that should not be loaded until a request needs them
+DEFERRED_MODULES = ("PIL", "qrcode", "reportlab", "smtplib", "aiohttp", "passlib", "services")
+
+IMPORT_PROBE = f"""
+import sys, time
+started = time.perf_counter()
+import main
+elapsed = time.perf_counter() - started
+loaded = [m for m in {DEFERRED_MODULES!r} if m in sys.modules]
+print(elapsed, ",".join(loaded))
+"""
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_import(env: dict) -> tuple[float, list[str]]:
+    out = subprocess.run([sys.executable, "-c", IMPORT_PROBE], cwd=BACKEND_DIR, env=env,
+                         capture_output=True, text=True, check=True).stdout.strip().splitlines()[-1]
+    elapsed, loaded = out.split(" ", 1) if " " in out else (out, "")
+    return float(elapsed), [m for m in loaded.split(",") if m]
+
+
+def measure_first_response(env: dict, timeout: float = 30.0) -> float:
+    port = _free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as resp:
+                    if resp.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.005)
+        raise RuntimeError(f"No response from uvicorn within {timeout}s")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main() -> int:
+    parser = argument_parser(__doc__.strip().splitlines()[0], os.path.join(BENCH_DIR, "baseline_startup.json"))
+    parser.add_argument("--runs", type=int, default=10, help="Fresh processes per case")
+    parser.add_argument("--database-url", help="SQLAlchemy async URL (default: a fresh SQLite file in a temp dir)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="credify-startup-")
+    base_env = dict(os.environ)
+    base_env.update({
+        "DATABASE_URL": args.database_url or f"sqlite+aiosqlite:///{os.path.join(workdir, 'startup.db')}",
+        "TEMPLATE_STORE_DIR": os.path.join(workdir, "template_store"),
+        "FONT_STORE_DIR": os.path.join(workdir, "font_store"),
+    })
+    # Fast mode expects the schema to exist already, as after a deploy-time migrate
+    subprocess.run([sys.executable, "migrate.py"], cwd=BACKEND_DIR, env=base_env, check=True, capture_output=True)
+
+    cases = {"import_main": lambda: measure_import(base_env)[0]}
+    for mode in ("full", "fast"):
+        env = dict(base_env, STARTUP_MODE=mode)
+        cases[f"first_response[{mode}]"] = lambda env=env: measure_first_response(env)
+
+    results = []
+    for name, fn in cases.items():
+        if args.filter and args.filter not in name:
+            continue
+        fn()  # warm the OS page cache and bytecode cache
+        samples = [fn() for _ in range(args.runs)]
+        results.append(summarize(name, samples))
+        print(f"  {name}: p50 {results[-1]['p50_ms']:.0f} ms", file=sys.stderr)
+
+    print_results(results)
+    _, loaded = measure_import(base_env)
+    print(f"\nDeferred modules loaded by `import main`: {', '.join(loaded) or 'none'}")
+
+    if args.update_baseline:
+        write_baseline(results, args.baseline)
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+    regressions = compare_with_baseline(results, args.baseline, args.tolerance)
+    if loaded:
+        regressions.append(f"import main loads deferred modules: {', '.join(loaded)}")
+    if regressions:
+        print("\nStartup regressions:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
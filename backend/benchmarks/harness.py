@@ -0,0 +1,149 @@
+"""
+Minimal timing harness shared by the benchmark scripts in this folder.
+
+Each case is timed until it has run for at least `min_time` seconds and `min_iters` iterations, then
+reported as ops/sec with p50/p95 latency. Results can be compared with a stored baseline JSON file;
+a case regresses when its ops/sec drops more than `tolerance` below the baseline.
+Baselines are machine-specific — regenerate them with --update-baseline on the machine that runs the check.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+from typing import Callable
+from PIL import Image, ImageDraw
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BUNDLED_FONT = os.path.join(BENCH_DIR, "fonts", "DejaVuSans.ttf")
+
+# Benchmarks import the backend modules the same way main.py does
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def synthetic_template(width: int, height: int) -> Image.Image:
+    """Certificate-like template: flat paper colour, gradient band, border and a few text-like strokes."""
+    img = Image.new("RGB", (width, height), (250, 246, 236))
+    draw = ImageDraw.Draw(img)
+    band = height // 6
+    for y in range(band):
+        shade = 200 - int(80 * y / band)
+        draw.line([(0, y), (width, y)], fill=(shade, shade - 20, 120))
+    margin = width // 40
+    draw.rectangle((margin, margin, width - margin, height - margin), outline=(140, 110, 40), width=max(2, width // 200))
+    for i in range(12):
+        y = height // 2 + i * height // 40
+        draw.line([(width // 4, y), (3 * width // 4 - (i * 37) % (width // 5), y)], fill=(90, 90, 90), width=max(1, width // 800))
+    return img
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(name: str, samples: list[float]) -> dict:
+    total = sum(samples)
+    return {
+        "name": name,
+        "iterations": len(samples),
+        "ops_per_sec": len(samples) / total if total else 0.0,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "mean_ms": statistics.fmean(samples) * 1000 if samples else 0.0,
+    }
+
+
+def measure(name: str, fn: Callable[[], object], min_time: float = 1.0, min_iters: int = 5, warmup: int = 1) -> dict:
+    for _ in range(warmup):
+        fn()
+    samples: list[float] = []
+    started = time.perf_counter()
+    while len(samples) < min_iters or time.perf_counter() - started < min_time:
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return summarize(name, samples)
+
+
+def print_results(results: list[dict]):
+    width = max([len(r["name"]) for r in results] + [4])
+    print(f"{'case':<{width}}  {'ops/sec':>10}  {'p50 ms':>9}  {'p95 ms':>9}  {'iters':>6}")
+    for r in results:
+        print(f"{r['name']:<{width}}  {r['ops_per_sec']:>10.2f}  {r['p50_ms']:>9.2f}  {r['p95_ms']:>9.2f}  {r['iterations']:>6}")
+
+
+def compare_with_baseline(results: list[dict], baseline_path: str, tolerance: float) -> list[str]:
+    """Human-readable regressions against the stored baseline (cases missing from it are skipped)."""
+    if not os.path.exists(baseline_path):
+        return []
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = []
+    for r in results:
+        expected = baseline.get(r["name"], {}).get("ops_per_sec")
+        if not expected:
+            continue
+        floor = expected * (1 - tolerance)
+        if r["ops_per_sec"] < floor:
+            regressions.append(
+                f"{r['name']}: {r['ops_per_sec']:.2f} ops/sec < {floor:.2f} (baseline {expected:.2f}, tolerance {tolerance:.0%})"
+            )
+    return regressions
+
+
+def write_baseline(results: list[dict], baseline_path: str):
+    existing = {}
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            existing = json.load(f)
+    for r in results:
+        existing[r["name"]] = {k: round(v, 3) if isinstance(v, float) else v for k, v in r.items() if k != "name"}
+    with open(baseline_path, "w") as f:
+        json.dump(dict(sorted(existing.items())), f, indent=2)
+        f.write("\n")
+
+
+def argument_parser(description: str, default_baseline: str) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--filter", default="", help="Only run cases whose name contains this substring")
+    parser.add_argument("--min-time", type=float, default=1.0, help="Minimum seconds spent per case")
+    parser.add_argument("--baseline", default=default_baseline, help="Baseline JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.30, help="Allowed ops/sec drop before failing (0.30 = 30%%)")
+    parser.add_argument("--update-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--json", help="Also write the raw results to this file")
+    return parser
+
+
+def run_cases(cases: dict[str, Callable[[], object]], args, min_iters: int = 5) -> int:
+    """Runs the selected cases, prints the table and applies the baseline check. Returns a process exit code."""
+    results = []
+    for name, fn in cases.items():
+        if args.filter and args.filter not in name:
+            continue
+        results.append(measure(name, fn, min_time=args.min_time, min_iters=min_iters))
+        print(f"  {name}: {results[-1]['ops_per_sec']:.2f} ops/sec", file=sys.stderr)
+
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.update_baseline:
+        write_baseline(results, args.baseline)
+        print(f"Baseline updated: {args.baseline}")
+        return 0
+
+    regressions = compare_with_baseline(results, args.baseline, args.tolerance)
+    if regressions:
+        print("\nPerformance regressions:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    return 0
@@ -1,4 +1,11 @@
 import os
+import time
+import random
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Optional
+from sqlalchemy import event, inspect, text
+from sqlalchemy.util import await_only
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import declarative_base, sessionmaker
 from dotenv import load_dotenv
@@ -26,12 +33,92 @@ if "sqlite" not in DATABASE_URL:
 
 engine = create_async_engine(
     DATABASE_URL, 
-    echo=True,
+    # Logging every statement is only for local debugging; production relies on the slow-query log below
+    echo=os.getenv("SQL_ECHO", "false").lower() == "true",
     pool_pre_ping=True,  # Check connection health before using
     pool_size=10,        # Increase pool size for concurrent dispatching
     max_overflow=20,
     connect_args=connect_args
 )
+# Statements slower than SLOW_QUERY_MS are logged; SLOW_QUERY_SAMPLE_RATE keeps a fraction of them when
+# a slow database would otherwise flood the logs
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "250"))
+SLOW_QUERY_SAMPLE_RATE = float(os.getenv("SLOW_QUERY_SAMPLE_RATE", "1.0"))
+slow_query_logger = logging.getLogger("credify.slow_query")
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _log_slow_query(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if elapsed_ms >= SLOW_QUERY_MS and random.random() < SLOW_QUERY_SAMPLE_RATE:
+        slow_query_logger.warning("Slow query (%.0f ms): %s", elapsed_ms, " ".join(statement.split())[:1000])
+
+@event.listens_for(engine.sync_engine, "handle_error")
+def _discard_query_timer(context):
+    if context.connection is not None and context.connection.info.get("query_started"):
+        context.connection.info["query_started"].pop()
+
+# --- SQLite profile ---------------------------------------------------------------------------------
+# WAL lets readers run alongside the writer, synchronous=NORMAL skips the fsync per commit (still safe against
+# application crashes; only an OS crash can lose the last commits), and a busy timeout makes a second writer
+# wait instead of failing. Within the process, write transactions additionally take turns on the event loop
+# (see _acquire_write_slot), so "database is locked" can only come from other processes.
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+SQLITE_TUNING = os.getenv("SQLITE_TUNING", "true").lower() != "false"
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+_write_slot: Optional[asyncio.Lock] = None
+_write_slot_loop = None
+
+def _get_write_slot() -> asyncio.Lock:
+    global _write_slot, _write_slot_loop
+    loop = asyncio.get_running_loop()
+    if _write_slot_loop is not loop:
+        _write_slot, _write_slot_loop = asyncio.Lock(), loop
+    return _write_slot
+
+def _release_write_slot(info: dict):
+    if info.pop("holds_write_slot", False) and _write_slot is not None:
+        _write_slot.release()
+
+if IS_SQLITE and SQLITE_TUNING:
+    @event.listens_for(engine.sync_engine, "connect")
+    def _sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.close()
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _acquire_write_slot(conn, cursor, statement, parameters, context, executemany):
+        """
+        A transaction's first INSERT/UPDATE/DELETE waits for the process-wide write slot, held until it commits or
+        rolls back. Runs inside the AsyncSession greenlet, so await_only yields to the event loop while waiting.
+        """
+        if context is None or conn.info.get("holds_write_slot"):
+            return
+        if context.isinsert or context.isupdate or context.isdelete:
+            await_only(_get_write_slot().acquire())
+            conn.info["holds_write_slot"] = True
+
+    @event.listens_for(engine.sync_engine, "commit")
+    @event.listens_for(engine.sync_engine, "rollback")
+    def _end_write_transaction(conn):
+        _release_write_slot(conn.info)
+
+    @event.listens_for(engine.sync_engine.pool, "checkin")
+    def _checkin_write_slot(dbapi_connection, connection_record):
+        # Connections returned without an explicit commit/rollback (e.g. invalidated ones)
+        if connection_record is not None:
+            _release_write_slot(connection_record.info)
+
 AsyncSessionLocal = sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
 )
@@ -41,3 +128,79 @@ Base = declarative_base()
 async def get_db():
     async with AsyncSessionLocal() as session:
         yield session
+
+class BatchWriter:
+    """
+    Single task applying small, independent writes (e.g. email open tracking) in batches: everything queued
+    while the previous batch was committing, up to WRITE_BATCH_SIZE, runs in one transaction. Each write gets
+    a SAVEPOINT, so a failing one is rolled back and reported to its caller without undoing the others.
+    """
+
+    def __init__(self, max_batch: int):
+        self.max_batch = max_batch
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def submit(self, write: Callable[[AsyncSession], Awaitable[Any]]) -> Any:
+        """Runs write(session) in the next batch and returns its result once the batch has committed."""
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run(self._queue))
+        future = loop.create_future()
+        self._queue.put_nowait((write, future))
+        return await future
+
+    async def _run(self, queue: asyncio.Queue):
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.max_batch and not queue.empty():
+                batch.append(queue.get_nowait())
+            outcomes = []
+            try:
+                async with AsyncSessionLocal() as session:
+                    for write, future in batch:
+                        try:
+                            async with session.begin_nested():
+                                outcomes.append((future, await write(session), None))
+                        except Exception as e:
+                            outcomes.append((future, None, e))
+                    await session.commit()
+            except Exception as e:
+                outcomes = [(future, None, e) for _, future in batch]
+            for future, result, error in outcomes:
+                if future.done():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "200"))
+batch_writer = BatchWriter(WRITE_BATCH_SIZE)
+
+def create_schema(sync_conn):
+    """
+    Creates missing tables. create_all never alters existing tables, so nullable columns added to a
+    model later are appended with ALTER TABLE, and declared indexes missing on existing tables are created.
+    """
+    Base.metadata.create_all(sync_conn)
+    inspector = inspect(sync_conn)
+    added = set()
+    for table in Base.metadata.sorted_tables:
+        existing = {col["name"] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or column.primary_key or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect=sync_conn.dialect)
+            sync_conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+            added.add((table.name, column.name))
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+    if ("dispatch_jobs", "owner_id") in added:
+        # Denormalized from projects; existing jobs are filled in once, new ones are created with it
+        sync_conn.execute(text(
+            "UPDATE dispatch_jobs SET owner_id = "
+            "(SELECT owner_id FROM projects WHERE projects.id = dispatch_jobs.project_id)"
+        ))
@@ -1,29 +1,99 @@
 import os
-import aiohttp
 import asyncio
-import smtplib
+import hashlib
 import datetime
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from fastapi import UploadFile
 import io
+from typing import Optional, Union, TYPE_CHECKING
 
 from database import AsyncSessionLocal
-from models import DispatchJob, Project, Certificate, FontAsset
-from services import generate_preview
-from storage import upload_file_to_s3
+from models import DispatchJob, Project, Certificate, new_certificate_id
+from font_registry import font_registry
+from font_store import fetch_font_path, download_font_bytes
+from template_store import ensure_template_raster, open_template_raster, decode_template
+from storage import upload_file_to_s3, is_stored_url
+from profiler import profiler
+from cache import TTLCache
+# Rendering (Pillow, qrcode, reportlab) and mail modules are imported on first use to keep API cold starts fast
+if TYPE_CHECKING:
+    import smtplib
+    from services import CertificatePdf, BandedPngEncoder
 
-SMTP_SERVER = "smtp.gmail.com"
-SMTP_PORT = 587
+from metrics import (
+    stage, track_job, DISPATCH_CERTIFICATES, DISPATCH_JOBS, DISPATCH_JOBS_QUEUED, DISPATCH_JOBS_ACTIVE, DISPATCH_ROWS_PENDING,
+    DISPATCH_JOBS_HELD
+)
 
-async def download_font_bytes(font_url: str) -> bytes:
-    if not font_url:
-        return b""
-    async with aiohttp.ClientSession() as session:
-        async with session.get(font_url) as resp:
-            return await resp.read()
+# Outbound mail server. Defaults to Gmail over implicit TLS; SMTP_USE_SSL=false talks plain SMTP
+# (e.g. to a local sink when load testing).
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.googlemail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "465"))
+SMTP_USE_SSL = os.getenv("SMTP_USE_SSL", "true").lower() != "false"
+
+def open_smtp_connection(timeout: Optional[float] = None) -> "smtplib.SMTP":
+    import smtplib
+    kwargs = {"timeout": timeout} if timeout is not None else {}
+    if SMTP_USE_SSL:
+        return smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, **kwargs)
+    return smtplib.SMTP(SMTP_HOST, SMTP_PORT, **kwargs)
+
+# Outcomes of the SMTP login pre-check, per server and sender identity. A successful login is trusted for
+# SMTP_VERIFY_TTL seconds and a rejected one answered from memory for SMTP_VERIFY_FAILURE_TTL, so repeated
+# dispatch clicks don't each open a connection. Unreachable servers and timeouts aren't cached.
+SMTP_VERIFY_TTL = float(os.getenv("SMTP_VERIFY_TTL", "600"))
+SMTP_VERIFY_FAILURE_TTL = float(os.getenv("SMTP_VERIFY_FAILURE_TTL", "60"))
+smtp_login_cache = TTLCache(maxsize=64, ttl=SMTP_VERIFY_TTL)
+_smtp_checks_in_flight: dict[tuple, asyncio.Task] = {}
+
+def check_smtp_login_sync(sender_email: str, app_password: str) -> tuple[str, str]:
+    """
+    Logs in once and classifies the result as (outcome, detail): "ok", "auth_failed", "unreachable",
+    "timeout" or "error". Blocking — run it in a worker thread.
+    """
+    import smtplib
+    import socket
+    try:
+        with open_smtp_connection(timeout=10) as server:
+            server.login(sender_email, app_password)
+        return "ok", ""
+    except smtplib.SMTPAuthenticationError as e:
+        return "auth_failed", str(e)
+    except Exception as e:
+        if isinstance(e, (socket.gaierror, socket.error, smtplib.SMTPConnectError)) and (
+                "101" in str(e) or "unreachable" in str(e).lower()):
+            return "unreachable", str(e)
+        if isinstance(e, TimeoutError) or "timeout" in str(e).lower():
+            return "timeout", str(e)
+        return "error", str(e)
+
+async def verify_smtp_login(sender_email: str, app_password: str) -> tuple[str, str]:
+    """
+    check_smtp_login_sync off the event loop, answered from smtp_login_cache when possible. Concurrent
+    checks of the same identity share one login attempt.
+    """
+    # The password is part of the identity, so correcting it in .env is re-checked right away
+    key = (SMTP_HOST, SMTP_PORT, sender_email, hashlib.sha256(app_password.encode()).hexdigest())
+    cached = smtp_login_cache.get(key)
+    if cached is not None:
+        return cached
+
+    task = _smtp_checks_in_flight.get(key)
+    if task is None:
+        async def _check():
+            try:
+                outcome = await asyncio.to_thread(check_smtp_login_sync, sender_email, app_password)
+                if outcome[0] == "ok":
+                    smtp_login_cache.set(key, outcome)
+                elif outcome[0] == "auth_failed":
+                    smtp_login_cache.set(key, outcome, ttl=SMTP_VERIFY_FAILURE_TTL)
+                return outcome
+            finally:
+                _smtp_checks_in_flight.pop(key, None)
+        task = _smtp_checks_in_flight[key] = asyncio.create_task(_check())
+    # A disconnecting client doesn't cancel the check the other waiters rely on
+    return await asyncio.shield(task)
 
 def send_smtp_email_sync(recipient_email: str, subject: str, html_body: str):
     SENDER_EMAIL = os.getenv("SENDER_EMAIL")
@@ -33,6 +103,9 @@ def send_smtp_email_sync(recipient_email: str, subject: str, html_body: str):
         print("SMTP Credentials missing inside .env. Bypassing email dispatch.")
         raise ValueError("SMTP Credentials missing")
 
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+
     msg = MIMEMultipart("alternative")
     msg["Subject"] = subject
     msg["From"] = f"Credify Notifications <{SENDER_EMAIL}>"
@@ -41,20 +114,335 @@ def send_smtp_email_sync(recipient_email: str, subject: str, html_body: str):
     msg.attach(MIMEText(html_body, "html"))
 
     try:
-        # Use SMTP_SSL on port 465 with alternative hostname
-        with smtplib.SMTP_SSL("smtp.googlemail.com", 465) as server:
+        with open_smtp_connection() as server:
             server.login(SENDER_EMAIL, APP_PASSWORD)
             server.sendmail(SENDER_EMAIL, recipient_email, msg.as_string())
     except Exception as e:
         print(f"Failed to send email to {recipient_email}: {e}")
+        import smtplib
+        if isinstance(e, smtplib.SMTPAuthenticationError):
+            # Credentials were revoked since the last pre-check: the next dispatch checks them again
+            smtp_login_cache.clear()
         raise e
 
-async def process_dispatch_job(job_id: int, project_id: int, csv_data: list[dict], email_subject: str = "Your Verified Certificate", email_body: str = ""):
+def build_placeholder_args(ph: dict, row: dict, cert_id: str, font_paths: dict[str, Union[str, bytes]]) -> dict:
+    """Keyword arguments for services.render_placeholder / CertificatePdf for one placeholder and CSV row."""
+    # Resolve the text from CSV row based on placeholder name
+    ph_name = ph.get("name", "")
+    text_value = row.get(ph_name, f"Sample {ph_name}")
+
+    is_qr = (ph.get("type") == "qrcode")
+    frontend_bg_url = os.getenv("FRONTEND_URL", "http://localhost:5173").rstrip('/')
+    qr_url = f"{frontend_bg_url}/verify/{cert_id}" if is_qr else None
+
+    # A font store path, or the bytes of a font that isn't one of our uploads (see resolve_font_paths)
+    font = font_paths.get(ph.get("fontUrl", ""), "")
+    return dict(
+        font_bytes=font if isinstance(font, bytes) else b"",
+        font_path=font if isinstance(font, str) else "",
+        text=text_value,
+        bbox_x=int(ph.get("x", 0)),
+        bbox_y=int(ph.get("y", 0)),
+        bbox_width=int(ph.get("w", 100)),
+        bbox_height=int(ph.get("h", 100)),
+        text_color=ph.get("fill", "#000000"),
+        initial_font_size=int(ph.get("fontSize", 120)),
+        is_qrcode=is_qr,
+        qr_url=qr_url,
+        qr_bg=ph.get("qrBg", "transparent"),
+        align=ph.get("align", "center")
+    )
+
+def extract_recipient(row: dict) -> tuple[Optional[str], str]:
+    """(email, name) from a CSV row, matching the "email"/"name" headers case-insensitively."""
+    recipient_email = None
+    recipient_name = "Participant"
+    for key, val in row.items():
+        if not key:
+            continue
+        k_clean = key.strip().lower()
+        if k_clean == "email":
+            recipient_email = val
+        elif k_clean == "name":
+            recipient_name = val
+    return recipient_email, recipient_name
+
+def recipient_reader(email_column: Optional[str], name_column: Optional[str]):
+    """extract_recipient for rows whose email/name headers were already located (see preflight.py)."""
+    def read(row: dict) -> tuple[Optional[str], str]:
+        recipient_email = row.get(email_column) if email_column else None
+        recipient_name = row.get(name_column, "Participant") if name_column else "Participant"
+        return recipient_email, recipient_name
+    return read
+
+async def _open_template(template_url: str, key: Optional[str]):
+    """Full-resolution template and its raster info; None for templates outside our storage, which are decoded in memory."""
+    if not is_stored_url(template_url):
+        return await decode_template(template_url), None
+    raster = await ensure_template_raster(template_url, key)
+    base_image = open_template_raster(raster["key"])
+    if base_image is None:
+        raise Exception(f"Template raster {raster['key']} is unreadable")
+    return base_image, raster
+
+async def load_project_template(db: AsyncSession, project: Project):
+    """Memory-mapped full-resolution template raster for a project, ingesting it first if needed."""
+    base_image, raster = await _open_template(project.template_url, project.template_raster)
+    if raster and project.template_raster != raster["key"]:
+        project.template_raster = raster["key"]
+        project.template_width = raster["width"]
+        project.template_height = raster["height"]
+        await db.commit()
+    return base_image
+
+async def _load_font(font_url: str) -> Union[str, bytes]:
+    # Only our own uploads go into the font store; a client can save any fontUrl in a mapping
+    if is_stored_url(font_url):
+        return await fetch_font_path(font_url)
+    return await download_font_bytes(font_url)
+
+async def resolve_font_paths(db: AsyncSession, mapping_data: list[dict]) -> dict[str, Union[str, bytes]]:
+    """
+    Local font store path for every font URL used by the mapping (patching stale placeholders in place).
+    Fonts from outside our storage are downloaded for this job only and returned as bytes.
+    """
+    # Resolve every placeholder's font URL first — saved fontUrl, else the font registry by fontFamily
+    for ph in mapping_data:
+        family_name = ph.get("fontFamily", "")
+        if not ph.get("fontUrl", "") and family_name:
+            # fontUrl missing (stale config) — patch the placeholder so rendering below picks it up
+            resolved_url = await font_registry.resolve_url(db, family_name)
+            if resolved_url:
+                ph["fontUrl"] = resolved_url
+
+    # Then resolve the distinct fonts to local font store paths, downloading missing ones concurrently
+    font_urls = list(dict.fromkeys(ph.get("fontUrl", "") for ph in mapping_data if ph.get("fontUrl", "")))
+    fetched = await asyncio.gather(*(_load_font(url) for url in font_urls), return_exceptions=True)
+    return {
+        # Failed downloads fall back to the default font in services.py
+        url: ("" if isinstance(path, BaseException) else path)
+        for url, path in zip(font_urls, fetched)
+    }
+
+async def create_renderers(base_image, output_format: str) -> tuple[Optional["CertificatePdf"], Optional["BandedPngEncoder"]]:
+    """Per-job (pdf_renderer, png_encoder) for render_certificate; the PNG encoder pre-compresses the template off the loop."""
+    from services import CertificatePdf, BandedPngEncoder, PNG_BAND_ENCODER
+    if output_format in ("pdf", "pdf_combined"):
+        return CertificatePdf(base_image), None
+    if not PNG_BAND_ENCODER:
+        return None, None
+    with stage("encode"):
+        return None, await asyncio.to_thread(BandedPngEncoder, base_image)
+
+def render_certificate(base_image, placeholders: list[dict], pdf_renderer: Optional["CertificatePdf"] = None,
+                       png_encoder: Optional["BandedPngEncoder"] = None) -> tuple[bytes, str]:
+    """
+    Renders one certificate file; returns (bytes, file extension). PDF when a pdf_renderer is given.
+    PNGs go through png_encoder (built from base_image) when given, which re-encodes only the touched bands.
+    """
+    from services import render_placeholder, encode_image
+    # composite includes the nested font_fit time
+    if pdf_renderer is not None:
+        with stage("composite"):
+            return pdf_renderer.render(placeholders), "pdf"
+    # Every placeholder is stamped onto one copy of the template, then encoded once
+    with stage("composite"):
+        img = base_image.copy()
+        touched_rows = []
+        for args in placeholders:
+            render_placeholder(img, touched_rows=touched_rows, **args)
+    with stage("encode"):
+        if png_encoder is not None:
+            data = png_encoder.encode(img, touched_rows)
+        else:
+            data = encode_image(img, format="PNG")
+    del img
+    return data, "png"
+
+# Certificate ID -> task rendering it on first view, so concurrent first views share one render and upload
+_view_renders: dict[str, asyncio.Task] = {}
+
+async def ensure_certificate_rendered(cert_id: str) -> Optional[str]:
+    """
+    image_url of a lazy job's certificate, rendering it from the job's snapshot and uploading it on first call.
+    Returns the stored image_url unchanged for certificates that were rendered at dispatch.
+    """
+    task = _view_renders.get(cert_id)
+    if task is None:
+        task = asyncio.ensure_future(_render_on_view(cert_id))
+        _view_renders[cert_id] = task
+        task.add_done_callback(lambda _: _view_renders.pop(cert_id, None))
+    # Shielded: a viewer disconnecting doesn't cancel the render the others are waiting for
+    return await asyncio.shield(task)
+
+async def _render_on_view(cert_id: str) -> Optional[str]:
+    async with AsyncSessionLocal() as db:
+        cert = await db.get(Certificate, cert_id)
+        if cert is None or cert.image_url or cert.render_data is None:
+            return cert.image_url if cert else None
+        job = await db.get(DispatchJob, cert.job_id) if cert.job_id else None
+        spec = job.render_spec if job else None
+        if not spec:
+            return None
+
+        with stage("download"):
+            base_image, _ = await _open_template(spec["template_url"], spec.get("template_raster"))
+            font_paths = await resolve_font_paths(db, spec["mapping_data"])
+        placeholders = [build_placeholder_args(ph, cert.render_data, cert.id, font_paths) for ph in spec["mapping_data"]]
+        pdf_renderer = None
+        if job.output_format == "pdf":
+            from services import CertificatePdf
+            pdf_renderer = await asyncio.to_thread(CertificatePdf, base_image)
+        data, file_ext = await asyncio.to_thread(render_certificate, base_image, placeholders, pdf_renderer)
+
+        upload_file = UploadFile(filename=f"{cert.id}.{file_ext}", file=io.BytesIO(data))
+        with stage("upload"):
+            cert.image_url = await upload_file_to_s3(upload_file, folder="certificates")
+        cert.render_data = None
+        with stage("commit"):
+            await db.commit()
+        return cert.image_url
+
+def render_dispatch_email(email_subject: str, email_body: str, row: dict, project_name: str, cert_id: str) -> tuple[str, str]:
+    """Per-recipient (subject, html): CSV {tags}, {project_name}, {credential_button} and the tracking footer."""
+    frontend_bg_url = os.getenv("FRONTEND_URL", "http://localhost:5173").rstrip('/')
+    button_html = f'''
+    <div style="margin: 30px 0;">
+        <a href="{frontend_bg_url}/verify/{cert_id}" 
+           style="background-color: #4f46e5; color: white; padding: 12px 24px; text-decoration: none; border-radius: 8px; font-weight: bold; display: inline-block;">
+           View Credential
+        </a>
+    </div>
+    '''
+
+    final_html = email_body
+    final_subject = email_subject
+
+    # Replace all CSV columns as {tags} in body and subject
+    for key, val in row.items():
+        if not key:
+            continue
+        tag = f"{{{key.strip()}}}"
+        final_html = final_html.replace(tag, str(val))
+        final_subject = final_subject.replace(tag, str(val))
+
+    # Also support general {project_name} replacement
+    final_html = final_html.replace("{project_name}", project_name)
+    final_subject = final_subject.replace("{project_name}", project_name)
+
+    # Inject the credential button
+    final_html = final_html.replace("{credential_button}", button_html)
+
+    # Inject "Powered by Credify" footer with tracking
+    backend_base_url = os.getenv("BACKEND_URL", "http://localhost:8000").rstrip('/')
+    logo_url = f"{backend_base_url}/api/projects/track/{cert_id}.png"
+    footer_html = f'''
+    <br/>
+    <hr style="border: 0; border-top: 1px solid #e2e8f0; margin: 40px 0 20px;">
+    <div style="text-align:center; color: #64748b; font-family: sans-serif; font-size: 12px; margin-bottom: 20px;">
+        <p style="margin: 0; font-weight: 600; text-transform: uppercase; letter-spacing: 1px;">Powered by</p>
+        <a href="https://credify.gnmlabs.com" style="text-decoration: none; display: inline-block; margin-top: 10px;">
+            <img src="{logo_url}" alt="Credify" style="height:28px; width:auto; border:0;">
+        </a>
+    </div>
+    '''
+    final_html += footer_html
+
+    return final_subject, final_html
+
+async def process_dispatch_job(job_id: int, project_id: int, csv_data: list[dict], email_subject: str = "Your Verified Certificate", email_body: str = "",
+                               output_format: str = "png", recipient_columns: Optional[tuple[Optional[str], Optional[str]]] = None):
     """
     Background worker that iterates through the parsed CSV recipients, 
     generates their custom certificates natively in-memory, uploads to S3, 
     and dispatches the outbound email.
+    output_format: "png" (raster per certificate), "pdf" (vector PDF per certificate)
+    or "pdf_combined" (one multi-page PDF for the whole job, stored on DispatchJob.output_url). Combined
+    certificates get no image_url: the job's PDF holds every recipient, so it is never linked from verify.
+    recipient_columns: (email, name) headers found by the pre-flight check, so rows aren't rescanned for them.
+    csv_data is consumed: rows are removed from the list in chunks of DISPATCH_CHUNK_ROWS as they are processed.
+    Per-stage timings are exported to /metrics and summarized on DispatchJob.timings.
     """
+    DISPATCH_JOBS_QUEUED.dec()
+    DISPATCH_JOBS_ACTIVE.inc()
+    total_rows = len(csv_data)
+    DISPATCH_ROWS_PENDING.inc(total_rows)
+    progress = {"rows": 0}
+    _running_jobs.add(job_id)
+    try:
+        with track_job() as timings, profiler.capture_job(job_id):
+            status = await _run_dispatch_job(job_id, project_id, csv_data, email_subject, email_body, output_format,
+                                              timings, progress, recipient_columns)
+        DISPATCH_JOBS.labels(status).inc()
+    except Exception:
+        DISPATCH_JOBS.labels("error").inc()
+        raise
+    finally:
+        DISPATCH_JOBS_ACTIVE.dec()
+        DISPATCH_ROWS_PENDING.dec(total_rows - progress["rows"])
+        _running_jobs.discard(job_id)
+
+# Rows handled per database session; each chunk commits and closes its session before the next one starts
+DISPATCH_CHUNK_ROWS = int(os.getenv("DISPATCH_CHUNK_ROWS", "200"))
+# Resident memory ceiling of the process in MB (0 disables). A job over it at a chunk boundary waits until
+# usage drops or no other dispatch job is running, so concurrent jobs run one after another instead of
+# stacking their template rasters and renderers
+DISPATCH_MEMORY_LIMIT_MB = float(os.getenv("DISPATCH_MEMORY_LIMIT_MB", "0"))
+DISPATCH_MEMORY_POLL_SECONDS = 1.0
+
+# Jobs in this process that are running and not held at the ceiling
+_running_jobs: set[int] = set()
+
+def _resident_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+def _release_memory():
+    """Collects garbage and hands freed heap pages back to the OS (glibc), so RSS reflects what is still in use."""
+    import gc
+    gc.collect()
+    try:
+        import ctypes
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+async def _wait_for_memory(job_id: int):
+    if not DISPATCH_MEMORY_LIMIT_MB:
+        return
+    limit = DISPATCH_MEMORY_LIMIT_MB * 1024 * 1024
+    held = False
+    try:
+        while (_resident_bytes() or 0) > limit:
+            if not held:
+                _release_memory()
+                if (_resident_bytes() or 0) <= limit:
+                    break
+            # Nothing else can free memory; holding this job would only stall it
+            if not _running_jobs - {job_id}:
+                break
+            if not held:
+                print(f"Dispatch job {job_id} waiting: resident memory is over DISPATCH_MEMORY_LIMIT_MB={DISPATCH_MEMORY_LIMIT_MB:g}")
+                held = True
+                _running_jobs.discard(job_id)
+                DISPATCH_JOBS_HELD.inc()
+            await asyncio.sleep(DISPATCH_MEMORY_POLL_SECONDS)
+    finally:
+        if held:
+            DISPATCH_JOBS_HELD.dec()
+        _running_jobs.add(job_id)
+
+def _row_done(progress: dict, outcome: str):
+    progress["rows"] += 1
+    DISPATCH_ROWS_PENDING.dec()
+    DISPATCH_CERTIFICATES.labels(outcome).inc()
+
+async def _run_dispatch_job(job_id: int, project_id: int, csv_data: list[dict], email_subject: str, email_body: str,
+                            output_format: str, timings, progress: dict, recipient_columns=None) -> str:
+    """Body of process_dispatch_job; returns the job's final status."""
     async with AsyncSessionLocal() as db:
         result = await db.execute(select(DispatchJob).where(DispatchJob.id == job_id))
         job = result.scalars().first()
@@ -66,174 +454,132 @@ async def process_dispatch_job(job_id: int, project_id: int, csv_data: list[dict
             if job:
                 job.status = "failed"
                 await db.commit()
-            return
+            return "failed"
             
         job.status = "processing"
+        if job.lazy_render:
+            # Certificates are rendered from this snapshot on first view, so later edits to the project don't change them
+            job.render_spec = {
+                "template_url": project.template_url,
+                "template_raster": project.template_raster,
+                "mapping_data": project.mapping_data,
+            }
         await db.commit()
 
-        # Download the base certificate template bytes once to save network requests
-        async with aiohttp.ClientSession() as session:
-            async with session.get(project.template_url) as resp:
-                template_bytes = await resp.read()
+        if not job.lazy_render:
+            # Map the pre-decoded template raster once (ingesting it first for older projects)
+            try:
+                with stage("download"):
+                    base_image = await load_project_template(db, project)
+            except Exception as e:
+                print(f"Template ingestion failed for project {project.id}: {e}")
+                job.status = "failed"
+                job.timings = timings.summary()
+                await db.commit()
+                return "failed"
+
+            pdf_renderer, png_encoder = await create_renderers(base_image, output_format)
+            with stage("download"):
+                font_paths = await resolve_font_paths(db, project.mapping_data)
 
-        # Pre-cache font binaries mapping — try saved fontUrl first, then look up persistent library
-        font_cache: dict[str, bytes] = {}
-        for ph in project.mapping_data:
-            url = ph.get("fontUrl", "")
-            family_name = ph.get("fontFamily", "")
+    read_recipient = recipient_reader(*recipient_columns) if recipient_columns else extract_recipient
+    while csv_data:
+        await _wait_for_memory(job_id)
+        # Processed rows are dropped from the job's list, so they are freed as the job advances
+        chunk = csv_data[:DISPATCH_CHUNK_ROWS]
+        del csv_data[:DISPATCH_CHUNK_ROWS]
 
-            if url and url not in font_cache:
-                # Direct URL from mapping — fetch it
-                try:
-                    font_cache[url] = await download_font_bytes(url)
-                except Exception:
-                    font_cache[url] = b""  # fallback handled in services.py
-
-            elif not url and family_name:
-                # fontUrl missing (stale config) — look up from persistent font library by fontFamily
-                db_font = await db.execute(
-                    select(FontAsset).where(
-                        (FontAsset.family + " " + FontAsset.variant) == family_name
-                    )
-                )
-                asset = db_font.scalars().first()
-                if asset and asset.storage_url not in font_cache:
-                    try:
-                        font_cache[asset.storage_url] = await download_font_bytes(asset.storage_url)
-                        # Patch the placeholder so below rendering code picks up the resolved URL
-                        ph["fontUrl"] = asset.storage_url
-                    except Exception:
-                        font_cache[asset.storage_url] = b""
-
-        for row in csv_data:
-            recipient_email = None
-            recipient_name = "Participant"
-            
-            for key, val in row.items():
-                if not key:
+        # One session per chunk: nothing a chunk loaded or added stays referenced once it is committed
+        async with AsyncSessionLocal() as db:
+            job = await db.get(DispatchJob, job_id)
+            for row in chunk:
+                recipient_email, recipient_name = read_recipient(row)
+
+                if not recipient_email:
+                    job.failed_deliveries += 1
+                    job.processed_certificates += 1
+                    with stage("commit"):
+                        await db.commit()
+                    _row_done(progress, "missing_email")
                     continue
-                k_clean = key.strip().lower()
-                if k_clean == "email":
-                    recipient_email = val
-                elif k_clean == "name":
-                    recipient_name = val
-            
-            if not recipient_email:
-                job.failed_deliveries += 1
+
+                # 1. Create the Certificate record with its ID assigned up front; it is inserted by the commit at the
+                # end of the row, so no write transaction stays open during rendering, upload and send
+                cert = Certificate(
+                    id=new_certificate_id(),
+                    project_id=project.id,
+                    job_id=job.id,
+                    recipient_email=recipient_email,
+                    recipient_name=recipient_name,
+                    render_data=row if job.lazy_render else None
+                )
+                db.add(cert)
+
+                try:
+                    # Lazy jobs skip 2-3: the certificate is rendered and uploaded on first view (ensure_certificate_rendered)
+                    if not job.lazy_render:
+                        # 2. Resolve every placeholder of the mapping configuration for this row
+                        placeholders = [build_placeholder_args(ph, row, cert.id, font_paths) for ph in project.mapping_data]
+
+                        if output_format == "pdf_combined":
+                            # Page of the job's single PDF — nothing is uploaded per certificate
+                            with stage("composite"):
+                                pdf_renderer.add_page(placeholders)
+                        else:
+                            current_image_bytes, file_ext = render_certificate(base_image, placeholders, pdf_renderer, png_encoder)
+
+                            # 3. Upload composited bytes to S3
+                            upload_file = UploadFile(filename=f"{cert.id}.{file_ext}", file=io.BytesIO(current_image_bytes))
+                            with stage("upload"):
+                                public_url = await upload_file_to_s3(upload_file, folder="certificates")
+                            # Free the encoded certificate now, not when the next row replaces it
+                            upload_file.file.close()
+                            del current_image_bytes, upload_file
+
+                            cert.image_url = public_url
+
+                    # 4. Dispatch the SMTP Email
+                    # Run SMTP blocking call inside asyncio threadpool so it doesn't freeze the async worker
+
+                    final_subject, final_html = render_dispatch_email(email_subject, email_body, row, project.name, cert.id)
+
+                    with stage("send"):
+                        await asyncio.to_thread(send_smtp_email_sync, recipient_email, final_subject, final_html)
+
+                    job.successful_deliveries += 1
+                    outcome = "sent"
+                except Exception as e:
+                    import traceback
+                    print(f"Error processing row for {recipient_email}: {e}")
+                    traceback.print_exc()
+                    job.failed_deliveries += 1
+                    cert.status = "Failed"
+                    outcome = "failed"
+
                 job.processed_certificates += 1
-                await db.commit()
-                continue
-            
-            # 1. Create Certificate DB record to lock-in the UUID
-            cert = Certificate(
-                project_id=project.id,
-                recipient_email=recipient_email,
-                recipient_name=recipient_name
-            )
-            db.add(cert)
-            await db.flush() # flush to get cert.id
-            
-            try:
-                # 2. Iterate through mapping configuration and composite the image
-                # In MVP, we iteratively stamp the template for each placeholder
-                current_image_bytes = template_bytes
-                
-                for ph in project.mapping_data:
-                    # Resolve the text from CSV row based on placeholder name
-                    ph_name = ph.get("name", "")
-                    text_value = row.get(ph_name, f"Sample {ph_name}")
-                    
-                    is_qr = (ph.get("type") == "qrcode")
-                    frontend_bg_url = os.getenv("FRONTEND_URL", "http://localhost:5173").rstrip('/')
-                    qr_url = f"{frontend_bg_url}/verify/{cert.id}" if is_qr else None
-                    
-                    font_url = ph.get("fontUrl", "")
-                    f_bytes = font_cache.get(font_url, b"")
-                    
-                    current_image_bytes = generate_preview(
-                        template_bytes=current_image_bytes,
-                        font_bytes=f_bytes,
-                        text=text_value,
-                        bbox_x=int(ph.get("x", 0)),
-                        bbox_y=int(ph.get("y", 0)),
-                        bbox_width=int(ph.get("w", 100)),
-                        bbox_height=int(ph.get("h", 100)),
-                        text_color=ph.get("fill", "#000000"),
-                        initial_font_size=int(ph.get("fontSize", 120)),
-                        format="PNG",
-                        is_qrcode=is_qr,
-                        qr_url=qr_url,
-                        qr_bg=ph.get("qrBg", "transparent"),
-                        align=ph.get("align", "center")
-                    )
-
-                # 3. Upload composited bytes to S3
-                upload_file = UploadFile(filename=f"{cert.id}.png", file=io.BytesIO(current_image_bytes))
-                public_url = await upload_file_to_s3(upload_file, folder="certificates")
-                
-                cert.image_url = public_url
-                
-                # 4. Dispatch the SMTP Email
-                # Run SMTP blocking call inside asyncio threadpool so it doesn't freeze the async worker
-                
-                frontend_bg_url = os.getenv("FRONTEND_URL", "http://localhost:5173").rstrip('/')
-                button_html = f'''
-                <div style="margin: 30px 0;">
-                    <a href="{frontend_bg_url}/verify/{cert.id}" 
-                       style="background-color: #4f46e5; color: white; padding: 12px 24px; text-decoration: none; border-radius: 8px; font-weight: bold; display: inline-block;">
-                       View Credential
-                    </a>
-                </div>
-                '''
-                
-                final_html = email_body
-                final_subject = email_subject
-
-                # Replace all CSV columns as {tags} in body and subject
-                for key, val in row.items():
-                    if not key:
-                        continue
-                    tag = f"{{{key.strip()}}}"
-                    final_html = final_html.replace(tag, str(val))
-                    final_subject = final_subject.replace(tag, str(val))
-
-                # Also support general {project_name} replacement
-                final_html = final_html.replace("{project_name}", project.name)
-                final_subject = final_subject.replace("{project_name}", project.name)
-
-                # Inject the credential button
-                final_html = final_html.replace("{credential_button}", button_html)
-
-                # Inject "Powered by Credify" footer with tracking
-                backend_base_url = os.getenv("BACKEND_URL", "http://localhost:8000").rstrip('/')
-                logo_url = f"{backend_base_url}/api/projects/track/{cert.id}.png"
-                footer_html = f'''
-                <br/>
-                <hr style="border: 0; border-top: 1px solid #e2e8f0; margin: 40px 0 20px;">
-                <div style="text-align:center; color: #64748b; font-family: sans-serif; font-size: 12px; margin-bottom: 20px;">
-                    <p style="margin: 0; font-weight: 600; text-transform: uppercase; letter-spacing: 1px;">Powered by</p>
-                    <a href="https://credify.gnmlabs.com" style="text-decoration: none; display: inline-block; margin-top: 10px;">
-                        <img src="{logo_url}" alt="Credify" style="height:28px; width:auto; border:0;">
-                    </a>
-                </div>
-                '''
-                final_html += footer_html
-
-                await asyncio.to_thread(send_smtp_email_sync, recipient_email, final_subject, final_html)
-                
-                job.successful_deliveries += 1
-            except Exception as e:
-                import traceback
-                print(f"Error processing row for {recipient_email}: {e}")
-                traceback.print_exc()
-                job.failed_deliveries += 1
-                
-            job.processed_certificates += 1
-            await db.commit()
+                with stage("commit"):
+                    await db.commit()
+                _row_done(progress, outcome)
+        del chunk
+
+    async with AsyncSessionLocal() as db:
+        job = await db.get(DispatchJob, job_id)
+        if output_format == "pdf_combined" and not job.lazy_render:
+            with stage("encode"):
+                combined_bytes = pdf_renderer.finish()
+            if combined_bytes:
+                try:
+                    upload_file = UploadFile(filename=f"job-{job.id}.pdf", file=io.BytesIO(combined_bytes))
+                    with stage("upload"):
+                        job.output_url = await upload_file_to_s3(upload_file, folder="jobs")
+                except Exception as e:
+                    print(f"Failed to upload combined PDF for job {job.id}: {e}")
 
         job.status = "completed"
         job.completed_at = datetime.datetime.utcnow()
+        job.timings = timings.summary()
         await db.commit()
+        return "completed"
 
 async def send_test_email(emails: list[str], subject: str, body: str, project_name: str, sample_data: dict = None):
     """
@@ -0,0 +1,96 @@
+"""
+In-memory view of the font_assets library.
+
+Loaded once at startup and rebuilt lazily after upload_font invalidates it (or after FONT_REGISTRY_TTL
+seconds, so other workers pick up uploads they did not see). Serves both the editor's GET /api/fonts
+listing and dispatch-time resolution of placeholder fontFamily names to storage URLs.
+"""
+import os
+import time
+import asyncio
+import hashlib
+from collections import defaultdict
+from typing import Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from models import FontAsset
+
+FONT_REGISTRY_TTL = int(os.getenv("FONT_REGISTRY_TTL", "300"))
+
+
+def font_full_name(family: str, variant: str) -> str:
+    return f"{family} {variant}".strip()
+
+
+class FontRegistry:
+    def __init__(self, ttl: float = FONT_REGISTRY_TTL):
+        self.ttl = ttl
+        self._by_full_name: dict[str, str] = {}
+        self._grouped: dict[str, list] = {}
+        self._etag: Optional[str] = None
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    def invalidate(self):
+        self._loaded_at = None
+
+    def _is_fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    async def load(self, db: AsyncSession):
+        result = await db.execute(select(FontAsset).order_by(FontAsset.family, FontAsset.variant))
+        fonts = result.scalars().all()
+
+        by_full_name: dict[str, str] = {}
+        grouped: dict[str, list] = defaultdict(list)
+        digest = hashlib.sha1()
+        backfilled = False
+        for f in fonts:
+            full_name = font_full_name(f.family, f.variant)
+            if f.full_name != full_name:
+                # Rows created before the indexed full_name column existed
+                f.full_name = full_name
+                backfilled = True
+            by_full_name.setdefault(full_name, f.storage_url)
+            grouped[f.family].append({
+                "variant": f.variant,
+                "url": f.storage_url,
+                "fontName": full_name,
+            })
+            digest.update(f"{f.id}:{full_name}:{f.storage_url}\n".encode())
+        if backfilled:
+            await db.commit()
+
+        self._by_full_name = by_full_name
+        self._grouped = dict(grouped)
+        self._etag = f'"{digest.hexdigest()}"'
+        self._loaded_at = time.monotonic()
+
+    async def ensure_loaded(self, db: AsyncSession):
+        if self._is_fresh():
+            return
+        async with self._lock:
+            if not self._is_fresh():
+                await self.load(db)
+
+    async def grouped(self, db: AsyncSession) -> tuple[dict, str]:
+        """Fonts grouped by family, plus an ETag for the listing."""
+        await self.ensure_loaded(db)
+        return self._grouped, self._etag
+
+    async def resolve_url(self, db: AsyncSession, full_name: str) -> Optional[str]:
+        """Storage URL for a "family variant" name, falling back to the indexed column on a miss."""
+        if not full_name:
+            return None
+        await self.ensure_loaded(db)
+        url = self._by_full_name.get(full_name)
+        if url is None:
+            result = await db.execute(
+                select(FontAsset.storage_url).where(FontAsset.full_name == full_name).limit(1)
+            )
+            url = result.scalar()
+        return url
+
+
+font_registry = FontRegistry()
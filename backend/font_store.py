@@ -0,0 +1,81 @@
+"""
+Content-addressed local font store.
+
+Font files are kept on disk under FONT_STORE_DIR/<sha256[:2]>/<sha256>, written when a font is uploaded
+through /api/fonts/upload or the first time a font URL is fetched. Rendering opens fonts by path, so
+FreeType maps the file itself and every worker process shares one copy in the OS page cache instead of
+holding its own bytes per job.
+"""
+import os
+import math
+import asyncio
+import hashlib
+from typing import Optional
+
+from cache import TTLCache
+from storage import atomic_write_file, local_path_for_url, fetch_stored_file
+
+FONT_STORE_DIR = os.getenv("FONT_STORE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "font_store"))
+
+# Storage URLs are immutable (uuid file names), so URL -> content hash aliases never need invalidating; the
+# in-memory copy is bounded, older entries are read back from the alias files on disk
+URL_ALIAS_CACHE_SIZE = int(os.getenv("FONT_URL_ALIAS_CACHE_SIZE", "10000"))
+_url_aliases = TTLCache(maxsize=URL_ALIAS_CACHE_SIZE, ttl=math.inf)
+
+
+def _blob_path(digest: str) -> str:
+    return os.path.join(FONT_STORE_DIR, digest[:2], digest)
+
+
+def _alias_path(url: str) -> str:
+    return os.path.join(FONT_STORE_DIR, "urls", hashlib.sha256(url.encode()).hexdigest())
+
+
+def store_font_bytes(font_bytes: bytes, url: Optional[str] = None) -> str:
+    """Write font bytes into the store (no-op if already present) and return the file path."""
+    digest = hashlib.sha256(font_bytes).hexdigest()
+    path = _blob_path(digest)
+    if not os.path.exists(path):
+        atomic_write_file(path, font_bytes)
+    if url:
+        atomic_write_file(_alias_path(url), digest.encode())
+        _url_aliases.set(url, digest)
+    return path
+
+
+def lookup_font_path(url: str) -> Optional[str]:
+    """Path of an already-stored font for this URL, or None."""
+    digest = _url_aliases.get(url)
+    if digest is None:
+        try:
+            with open(_alias_path(url), "rb") as f:
+                digest = f.read().decode().strip()
+        except OSError:
+            return None
+        _url_aliases.set(url, digest)
+    path = _blob_path(digest)
+    return path if os.path.exists(path) else None
+
+
+async def download_font_bytes(font_url: str) -> bytes:
+    if not font_url:
+        return b""
+    if local_path_for_url(font_url):
+        return await fetch_stored_file(font_url)
+    import aiohttp
+    async with aiohttp.ClientSession() as session:
+        async with session.get(font_url) as resp:
+            if resp.status != 200:
+                raise Exception(f"Font download failed with status {resp.status}: {font_url}")
+            return await resp.read()
+
+
+async def fetch_font_path(font_url: str) -> str:
+    """Local path for a font URL, downloading and storing it on first use."""
+    if not font_url:
+        return ""
+    path = lookup_font_path(font_url)
+    if path:
+        return path
+    font_bytes = await download_font_bytes(font_url)
+    return await asyncio.to_thread(store_font_bytes, font_bytes, font_url)
@@ -2,28 +2,36 @@ import os
 from dotenv import load_dotenv
 load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
 
-from fastapi import FastAPI, Request
+import time
+from fastapi import FastAPI, Request, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 import logging
 
 # Setup Logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-from database import engine, Base
+from database import engine, create_schema, AsyncSessionLocal
+from migrate import certificate_id_storage
+from models import COMPACT_CERTIFICATE_IDS
+from font_registry import font_registry
+from metrics import HTTP_REQUEST_SECONDS, register_pool_metrics, render_metrics
+from profiler import ProfilerMiddleware
+from storage import static_files
 import auth
-from routers import projects, verify, fonts
+from routers import projects, verify, fonts, admin
 
 app = FastAPI(title="Credify API", description="SaaS Backend for Credify Certificate Pipeline")
 
+register_pool_metrics(engine)
+
 app.include_router(auth.router)
 app.include_router(projects.router)
 app.include_router(verify.router)
 app.include_router(fonts.router)
+app.include_router(admin.router)
 
-os.makedirs("local_storage/uploads", exist_ok=True)
-app.mount("/static", StaticFiles(directory="local_storage"), name="static")
+app.mount("/static", static_files(), name="static")
 
 # CORS Security Bridge
 # Support multiple origins via comma-separated list in env var
@@ -51,16 +59,48 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
+# Added before the latency middleware below so it runs in the same task as the endpoint
+app.add_middleware(ProfilerMiddleware)
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template (/api/projects/{project_id}) rather than the raw path
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.labels(
+            request.method, getattr(route, "path", "unmatched"), str(status)
+        ).observe(time.perf_counter() - started)
+
+# "full" (default) creates the schema and warms caches on startup. "fast" skips both so an autoscaled
+# instance answers its first request sooner: run `python migrate.py` at deploy time instead, and the
+# font registry loads on first use.
+STARTUP_MODE = os.getenv("STARTUP_MODE", "full").lower()
 
 @app.on_event("startup")
 async def startup_event():
-    logger.info("Application starting up...")
+    logger.info(f"Application starting up ({STARTUP_MODE} startup)...")
+    if STARTUP_MODE == "fast":
+        return
     try:
         async with engine.begin() as conn:
             # Create all tables explicitly in local DB (if not using migrations initially)
-            await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(create_schema)
+            id_storage = await conn.run_sync(certificate_id_storage)
         logger.info("Database connection successful and tables verified.")
+        if id_storage and id_storage != ("compact" if COMPACT_CERTIFICATE_IDS else "string"):
+            logger.error(f"certificates.id uses {id_storage} storage but COMPACT_CERTIFICATE_IDS={COMPACT_CERTIFICATE_IDS}: run `python migrate.py`")
+
+        # Warm the font library so the first editor load and dispatch don't pay for it
+        async with AsyncSessionLocal() as db:
+            await font_registry.load(db)
     except Exception as e:
         logger.error(f"CRITICAL STARTUP ERROR: Database connection failed: {e}")
         # In production, we might still want to start the app so we can serve health checks/logs
@@ -87,6 +127,15 @@ async def db_health_check():
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+@app.get("/metrics", include_in_schema=False)
+def metrics(request: Request):
+    """Prometheus scrape endpoint. Set METRICS_TOKEN to require `Authorization: Bearer <token>`."""
+    token = os.getenv("METRICS_TOKEN")
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 @app.get("/health")
 def health_check():
     return {"status": "healthy"}
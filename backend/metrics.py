@@ -0,0 +1,132 @@
+"""
+Prometheus metrics for the API and the dispatch pipeline, served at /metrics.
+
+Dispatch code times its stages with `with stage("encode"):`. Every stage is observed in a process-wide
+histogram, and while a JobTimings is active (see track_job) it is also added to that job's summary,
+which process_dispatch_job persists on DispatchJob.timings.
+
+Metrics are per process; when running several gunicorn workers, set PROMETHEUS_MULTIPROC_DIR.
+"""
+import os
+import time
+import contextvars
+from contextlib import contextmanager
+from typing import Optional
+from prometheus_client import (
+    Counter, Gauge, Histogram, CollectorRegistry, CONTENT_TYPE_LATEST, REGISTRY, generate_latest, multiprocess
+)
+from prometheus_client.core import GaugeMetricFamily
+
+# Stages of one certificate: download (template/fonts), font_fit, composite, encode, upload, send, commit
+DISPATCH_STAGE_SECONDS = Histogram(
+    "credify_dispatch_stage_seconds", "Time spent per dispatch pipeline stage", ["stage"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+DISPATCH_CERTIFICATES = Counter(
+    "credify_dispatch_certificates_total", "Processed dispatch rows by outcome", ["outcome"],
+)
+DISPATCH_JOBS = Counter(
+    "credify_dispatch_jobs_total", "Finished dispatch jobs by final status", ["status"],
+)
+DISPATCH_JOBS_QUEUED = Gauge(
+    "credify_dispatch_jobs_queued", "Dispatch jobs accepted but not started yet",
+)
+DISPATCH_JOBS_ACTIVE = Gauge(
+    "credify_dispatch_jobs_active", "Dispatch jobs currently running",
+)
+DISPATCH_ROWS_PENDING = Gauge(
+    "credify_dispatch_rows_pending", "CSV rows of running jobs not processed yet",
+)
+DISPATCH_JOBS_HELD = Gauge(
+    "credify_dispatch_jobs_held", "Dispatch jobs waiting at the DISPATCH_MEMORY_LIMIT_MB ceiling",
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "credify_http_request_duration_seconds", "API request latency", ["method", "route", "status"],
+)
+
+
+class JobTimings:
+    """Per-stage call count, total and max for one dispatch job."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: dict[str, list[float]] = {}  # stage -> [count, total seconds, max seconds]
+
+    def add(self, name: str, seconds: float):
+        entry = self.stages.get(name)
+        if entry is None:
+            self.stages[name] = [1, seconds, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+
+    def summary(self) -> dict:
+        return {
+            "wall_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "stages": {
+                name: {"count": count, "total_ms": round(total * 1000, 1), "max_ms": round(longest * 1000, 1)}
+                for name, (count, total, longest) in self.stages.items()
+            },
+        }
+
+
+_current_job: contextvars.ContextVar[Optional[JobTimings]] = contextvars.ContextVar("credify_job_timings", default=None)
+
+
+@contextmanager
+def track_job():
+    """Collects stage timings of the enclosed code (including asyncio.to_thread calls) into a JobTimings."""
+    timings = JobTimings()
+    token = _current_job.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_job.reset(token)
+
+
+@contextmanager
+def stage(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        DISPATCH_STAGE_SECONDS.labels(name).observe(elapsed)
+        timings = _current_job.get()
+        if timings is not None:
+            timings.add(name, elapsed)
+
+
+class DatabasePoolCollector:
+    """Reads SQLAlchemy pool usage at scrape time."""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def collect(self):
+        pool = self.engine.sync_engine.pool
+        for name, attr, doc in (
+            ("credify_db_pool_size", "size", "Configured connection pool size"),
+            ("credify_db_pool_checked_out", "checkedout", "Connections currently in use"),
+            ("credify_db_pool_checked_in", "checkedin", "Idle connections in the pool"),
+            ("credify_db_pool_overflow", "overflow", "Connections opened beyond pool_size"),
+        ):
+            reader = getattr(pool, attr, None)
+            if reader is not None:
+                # QueuePool.overflow() counts up from -pool_size
+                yield GaugeMetricFamily(name, doc, value=max(0, reader()))
+
+
+def register_pool_metrics(engine):
+    REGISTRY.register(DatabasePoolCollector(engine))
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """(body, content type) of the Prometheus text exposition."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        # Aggregate the metric files of every worker process
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,126 @@
+"""
+Creates missing tables, columns and indexes (database.create_schema), drops indexes older versions declared
+that newer ones replace (drop_legacy_indexes), converts the storage of certificate IDs to match
+COMPACT_CERTIFICATE_IDS (migrate_certificate_ids) and exits.
+
+Run it once per deploy, before starting the API with STARTUP_MODE=fast:
+
+    python migrate.py
+"""
+import sys
+import uuid
+import asyncio
+import logging
+from typing import Optional
+
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.sql import sqltypes
+
+from database import engine, create_schema, DATABASE_URL
+from models import Certificate, COMPACT_CERTIFICATE_IDS
+
+logger = logging.getLogger("credify.migrate")
+
+# Index declared by older versions on top of the primary key's own index
+LEGACY_CERTIFICATE_ID_INDEX = "ix_certificates_id"
+# Single-column index of older versions, covered by the leading column of ix_certificates_job_id_issued_at
+LEGACY_CERTIFICATE_JOB_INDEX = "ix_certificates_job_id"
+
+
+def certificate_id_storage(sync_conn) -> Optional[str]:
+    """"compact" or "string" for the certificates.id column as it exists in the database, None without the table."""
+    inspector = inspect(sync_conn)
+    if not inspector.has_table(Certificate.__tablename__):
+        return None
+    column = next(c for c in inspector.get_columns(Certificate.__tablename__) if c["name"] == "id")
+    return "compact" if isinstance(column["type"], (sqltypes.LargeBinary, sqltypes.Uuid)) else "string"
+
+
+def _uuid_bytes(value):
+    try:
+        return uuid.UUID(value).bytes
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+def _uuid_text(value):
+    return str(uuid.UUID(bytes=bytes(value))) if value is not None else None
+
+
+def _rebuild_sqlite_table(sync_conn, to_compact: bool):
+    """
+    SQLite can't change a column's type: the table is renamed, recreated from the model and refilled with
+    converted IDs, then its indexes are built on the full table.
+    """
+    table = Certificate.__table__
+    dbapi_conn = sync_conn.connection.dbapi_connection
+    convert = "credify_uuid_bytes" if to_compact else "credify_uuid_text"
+    dbapi_conn.create_function("credify_uuid_bytes", 1, _uuid_bytes, deterministic=True)
+    dbapi_conn.create_function("credify_uuid_text", 1, _uuid_text, deterministic=True)
+
+    if to_compact:
+        invalid = sync_conn.execute(text(
+            "SELECT id FROM certificates WHERE credify_uuid_bytes(id) IS NULL LIMIT 5"
+        )).scalars().all()
+        if invalid:
+            raise RuntimeError(f"Certificate IDs that aren't UUIDs can't be stored compactly, e.g. {invalid}")
+
+    existing = {col["name"] for col in inspect(sync_conn).get_columns(table.name)}
+    for index in inspect(sync_conn).get_indexes(table.name):
+        sync_conn.execute(text(f'DROP INDEX "{index["name"]}"'))
+    sync_conn.execute(text(f"ALTER TABLE {table.name} RENAME TO {table.name}_old"))
+    sync_conn.execute(CreateTable(table))
+    columns = [c.name for c in table.columns if c.name in existing]
+    selected = [f"{convert}(id)" if name == "id" else name for name in columns]
+    sync_conn.execute(text(
+        f"INSERT INTO {table.name} ({', '.join(columns)}) SELECT {', '.join(selected)} FROM {table.name}_old"
+    ))
+    sync_conn.execute(text(f"DROP TABLE {table.name}_old"))
+    for index in table.indexes:
+        index.create(sync_conn)
+
+
+def drop_legacy_indexes(sync_conn):
+    """Drops indexes that create_schema no longer declares but existing databases still maintain on every write."""
+    for name in (LEGACY_CERTIFICATE_ID_INDEX, LEGACY_CERTIFICATE_JOB_INDEX):
+        sync_conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+
+def migrate_certificate_ids(sync_conn) -> bool:
+    """
+    Converts certificates.id to the storage selected by COMPACT_CERTIFICATE_IDS (native UUID on PostgreSQL,
+    16-byte BLOB on SQLite, or text). Returns whether the column was converted. Rewrites the whole table, so
+    it runs here at deploy time, never at startup.
+    """
+    current = certificate_id_storage(sync_conn)
+    wanted = "compact" if COMPACT_CERTIFICATE_IDS else "string"
+    if current is None or current == wanted:
+        return False
+
+    logger.info(f"Converting certificates.id from {current} to {wanted} storage...")
+    if sync_conn.dialect.name == "postgresql":
+        target = "uuid USING id::uuid" if COMPACT_CERTIFICATE_IDS else "varchar USING id::text"
+        sync_conn.execute(text(f"ALTER TABLE certificates ALTER COLUMN id TYPE {target}"))
+    elif sync_conn.dialect.name == "sqlite":
+        _rebuild_sqlite_table(sync_conn, COMPACT_CERTIFICATE_IDS)
+    else:
+        raise RuntimeError(f"No certificate ID migration for {sync_conn.dialect.name}")
+    return True
+
+
+async def _main() -> int:
+    async with engine.begin() as conn:
+        await conn.run_sync(create_schema)
+        await conn.run_sync(drop_legacy_indexes)
+        converted = await conn.run_sync(migrate_certificate_ids)
+    await engine.dispose()
+    if converted:
+        print(f"Certificate IDs now use {'compact' if COMPACT_CERTIFICATE_IDS else 'string'} storage.")
+    print(f"Schema is up to date ({DATABASE_URL.split('://', 1)[0]}).")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_main()))
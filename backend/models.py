@@ -1,9 +1,16 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, JSON, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, JSON, DateTime, Index, LargeBinary
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.orm import relationship
+from sqlalchemy.types import TypeDecorator
+import os
 import datetime
 import uuid
 from database import Base
 
+# Store certificate IDs as a native UUID (PostgreSQL) or 16 raw bytes (SQLite) instead of 36-character text.
+# Existing databases are converted by `python migrate.py` after switching, in either direction
+COMPACT_CERTIFICATE_IDS = os.getenv("COMPACT_CERTIFICATE_IDS", "false").lower() == "true"
+
 class User(Base):
     __tablename__ = "users"
 
@@ -21,17 +28,26 @@ class Project(Base):
     name = Column(String, index=True)
     template_url = Column(String, nullable=True)     # Stores the base certificate image URL
     mapping_data = Column(JSON, nullable=True)       # Stores the React placeholders array configuration
+    template_raster = Column(String, nullable=True)  # Pre-decoded raster key in template_store ("<sha256>_<w>x<h>")
+    template_width = Column(Integer, nullable=True)
+    template_height = Column(Integer, nullable=True)
     owner_id = Column(Integer, ForeignKey("users.id"))
 
     owner = relationship("User", back_populates="projects")
     certificates = relationship("Certificate", back_populates="project")
     dispatch_jobs = relationship("DispatchJob", back_populates="project")
 
+    __table_args__ = (
+        # Keyset pagination of a user's projects
+        Index("ix_projects_owner_id_id", "owner_id", "id"),
+    )
+
 class DispatchJob(Base):
     __tablename__ = "dispatch_jobs"
 
     id = Column(Integer, primary_key=True, index=True)
     project_id = Column(Integer, ForeignKey("projects.id"))
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=True)  # The project's owner, so job history needs no join
     status = Column(String, default="pending") # pending, processing, completed, failed
     total_certificates = Column(Integer, default=0)
     processed_certificates = Column(Integer, default=0)
@@ -39,26 +55,89 @@ class DispatchJob(Base):
     failed_deliveries = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     completed_at = Column(DateTime, nullable=True)
+    output_format = Column(String, default="png", nullable=True)  # png, pdf, pdf_combined
+    output_url = Column(String, nullable=True)                      # Combined multi-page PDF (pdf_combined jobs)
+    export_only = Column(Boolean, default=False, nullable=True)     # Rendered straight into a ZIP download, no upload/email
+    timings = Column(JSON, nullable=True)                           # Per-stage timing summary written when the job finishes
+    lazy_render = Column(Boolean, default=False, nullable=True)     # Certificates are rendered on first view, not at dispatch
+    render_spec = Column(JSON, nullable=True)                       # Template URL/raster and mapping snapshot for lazy rendering
+    preflight = Column(JSON, nullable=True)                         # Pre-flight report: rejected rows and duration estimate
 
     project = relationship("Project", back_populates="dispatch_jobs")
 
+    __table_args__ = (
+        # Keyset pagination of job history (newest first) per project, and across all of a user's projects
+        Index("ix_dispatch_jobs_project_id_created_at", "project_id", "created_at"),
+        Index("ix_dispatch_jobs_owner_id_created_at_id", "owner_id", "created_at", "id"),
+    )
+
+def new_certificate_id() -> str:
+    """Certificate IDs are assigned before insert, so rows can be written in one short transaction after rendering."""
+    return str(uuid.uuid4())
+
+class CompactUUID(TypeDecorator):
+    """
+    UUID strings in Python (the public ID format in URLs and QR codes is unchanged), stored as a native UUID on
+    PostgreSQL and as 16 raw bytes elsewhere. Only the canonical lowercase, hyphenated form binds; anything else
+    (malformed, uppercase, braced, urn:uuid:) binds as NULL and finds nothing, exactly as with text IDs. Aliases
+    resolving to the same row would escape caches keyed by the ID, such as the verification cache.
+    """
+    impl = LargeBinary(16)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(postgresql.UUID(as_uuid=False))
+        return dialect.type_descriptor(LargeBinary(16))
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, uuid.UUID):
+            parsed = value
+        else:
+            try:
+                parsed = uuid.UUID(value)
+            except (ValueError, TypeError, AttributeError):
+                return None
+            if str(parsed) != value:
+                return None
+        return str(parsed) if dialect.name == "postgresql" else parsed.bytes
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, (bytes, memoryview)):
+            return str(uuid.UUID(bytes=bytes(value)))
+        return str(value)
+
 class Certificate(Base):
     __tablename__ = "certificates"
 
-    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()), index=True)
+    # The verify, tracking and QR lookup key. The primary key index serves those lookups on its own
+    id = Column(CompactUUID if COMPACT_CERTIFICATE_IDS else String, primary_key=True, default=new_certificate_id)
     project_id = Column(Integer, ForeignKey("projects.id"))
+    job_id = Column(Integer, ForeignKey("dispatch_jobs.id"), nullable=True)  # Dispatch/export job that issued it
     recipient_email = Column(String, index=True)
     recipient_name = Column(String)
     image_url = Column(String, nullable=True)     # The final composited certificate PNG/PDF S3 link
+    render_data = Column(JSON, nullable=True)     # CSV row of a lazy job's certificate until it is first rendered
     issued_at = Column(DateTime, default=datetime.datetime.utcnow)
     is_revoked = Column(Boolean, default=False)
     
     # Delivery Analytics
-    status = Column(String, default="Sent") # Sent, Opened
+    status = Column(String, default="Sent") # Sent, Opened, Failed
     opened_at = Column(DateTime, nullable=True)
 
     project = relationship("Project", back_populates="certificates")
 
+    __table_args__ = (
+        # Per-project delivery analytics (e.g. opened counts)
+        Index("ix_certificates_project_id_status", "project_id", "status"),
+        # Per-job archives and delivery reports, in issue order
+        Index("ix_certificates_job_id_issued_at", "job_id", "issued_at"),
+    )
+
 class FontAsset(Base):
     """Persistent shared font library — persists uploaded custom fonts across all user sessions."""
     __tablename__ = "font_assets"
@@ -66,7 +145,18 @@ class FontAsset(Base):
     id = Column(Integer, primary_key=True, index=True)
     family = Column(String, index=True)          # e.g. "Space Grotesk"
     variant = Column(String)                      # e.g. "Regular", "Light", "Medium Bold"
+    full_name = Column(String, index=True, nullable=True)  # "family variant" as used by placeholder fontFamily
     storage_url = Column(String, unique=True)     # Permanent Supabase URL
     file_name = Column(String)                    # Original filename for deduplication check
     uploaded_by = Column(Integer, ForeignKey("users.id"), nullable=True)
     uploaded_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class UserStats(Base):
+    """Per-owner dashboard counters, maintained incrementally so /api/projects/kpi is a primary-key read."""
+    __tablename__ = "user_stats"
+
+    owner_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    total_certificates = Column(Integer, default=0, nullable=False)  # SUM(dispatch_jobs.total_certificates)
+    total_projects = Column(Integer, default=0, nullable=False)
+    total_opened = Column(Integer, default=0, nullable=False)        # Certificates with status "Opened"
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
@@ -0,0 +1,161 @@
+"""
+Pre-flight checks for a dispatch, run once over the whole CSV before a job is created.
+
+Headers are normalized (surrounding whitespace stripped) and the email/name columns are located once.
+Addresses are validated and deduplicated across the file, and every text placeholder of the mapping must
+name a CSV column. Only clean rows are enqueued; the others are listed in the report with a reason.
+The report also estimates how long the job will take.
+"""
+import os
+import re
+from typing import Optional
+
+from metrics import DISPATCH_STAGE_SECONDS
+
+EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s.]+(\.[^@\s.]+)+$")
+
+# Composite + encode time per template megapixel, measured with benchmarks/load_dispatch.py
+# (A4 at 200dpi, name, course and QR placeholders)
+RENDER_MS_PER_MEGAPIXEL = {"png": 16.0, "pdf": 25.0, "pdf_combined": 25.0}
+DEFAULT_TEMPLATE_MEGAPIXELS = 2339 * 1654 / 1e6
+# Storage and SMTP round trips can't be measured against the local fakes; these apply until this process
+# has observed PREFLIGHT_MIN_SAMPLES real uploads/sends, then the observed means (see /metrics) are used
+PREFLIGHT_UPLOAD_MS = float(os.getenv("PREFLIGHT_UPLOAD_MS", "250"))
+PREFLIGHT_SEND_MS = float(os.getenv("PREFLIGHT_SEND_MS", "1200"))
+PREFLIGHT_MIN_SAMPLES = 20
+
+# Rejected rows listed in a report; the counts always cover all of them
+PREFLIGHT_REPORT_LIMIT = 1000
+
+
+class PreflightResult:
+    def __init__(self, rows: list[dict], email_column: Optional[str], name_column: Optional[str], report: dict,
+                 options_error: Optional[str] = None):
+        self.rows = rows                  # Clean rows with normalized headers, in CSV order
+        self.email_column = email_column
+        self.name_column = name_column
+        self.report = report
+        self.options_error = options_error  # Job options that can't be combined, whatever the CSV holds
+
+    @property
+    def blocking_error(self) -> Optional[str]:
+        """Why no job should be created from this CSV, if anything."""
+        if self.options_error:
+            return self.options_error
+        if self.email_column is None:
+            return "The CSV has no email column."
+        if self.report["unmapped_placeholders"]:
+            return "Placeholders without a matching CSV column: " + ", ".join(self.report["unmapped_placeholders"])
+        if not self.rows:
+            return "The CSV has no rows with a valid, unique email address."
+        return None
+
+    def job_report(self, limit: int = 100) -> dict:
+        """The report as stored on DispatchJob.preflight, with a shorter list of rejected rows."""
+        return dict(self.report, rejected=self.report["rejected"][:limit])
+
+
+def _observed_mean_ms(stage: str) -> Optional[float]:
+    total = count = 0.0
+    for metric in DISPATCH_STAGE_SECONDS.collect():
+        for sample in metric.samples:
+            if sample.labels.get("stage") != stage:
+                continue
+            if sample.name.endswith("_sum"):
+                total = sample.value
+            elif sample.name.endswith("_count"):
+                count = sample.value
+    if count < PREFLIGHT_MIN_SAMPLES:
+        return None
+    return total / count * 1000
+
+
+def estimate_duration(rows: int, output_format: str, lazy_render: bool = False,
+                      template_size: Optional[tuple[Optional[int], Optional[int]]] = None) -> dict:
+    """Expected job duration in seconds, split by stage (the job processes rows one at a time)."""
+    width, height = template_size or (None, None)
+    megapixels = width * height / 1e6 if width and height else DEFAULT_TEMPLATE_MEGAPIXELS
+    observed_upload = _observed_mean_ms("upload")
+    observed_send = _observed_mean_ms("send")
+    upload_ms = observed_upload if observed_upload is not None else PREFLIGHT_UPLOAD_MS
+    send_ms = observed_send if observed_send is not None else PREFLIGHT_SEND_MS
+
+    render_s = 0.0 if lazy_render else rows * RENDER_MS_PER_MEGAPIXEL.get(output_format, 16.0) * megapixels / 1000
+    if lazy_render:
+        upload_s = 0.0
+    elif output_format == "pdf_combined":
+        upload_s = upload_ms / 1000  # One document per job
+    else:
+        upload_s = rows * upload_ms / 1000
+    send_s = rows * send_ms / 1000
+    return {
+        "render_s": round(render_s, 1),
+        "upload_s": round(upload_s, 1),
+        "send_s": round(send_s, 1),
+        "total_s": round(render_s + upload_s + send_s, 1),
+        "basis": {
+            "template_megapixels": round(megapixels, 2),
+            "upload": "observed" if observed_upload is not None else "default",
+            "send": "observed" if observed_send is not None else "default",
+        },
+    }
+
+
+def run_preflight(csv_data: list[dict], mapping_data: list[dict], output_format: str = "png",
+                  lazy_render: bool = False, template_size: Optional[tuple] = None) -> PreflightResult:
+    # Normalize headers once; empty headers (trailing commas) are dropped
+    rows = [{key.strip(): value for key, value in row.items() if key and key.strip()} for row in csv_data]
+    columns = list(dict.fromkeys(key for row in rows for key in row))
+    email_column = next((c for c in columns if c.lower() == "email"), None)
+    name_column = next((c for c in columns if c.lower() == "name"), None)
+
+    # Only text placeholders (the default type) are filled from the CSV; QR codes and logo/signature images aren't
+    known = set(columns)
+    unmapped = [
+        ph.get("name", "") for ph in mapping_data or []
+        if ph.get("type", "text") in (None, "text") and ph.get("name", "") not in known
+    ]
+
+    clean: list[dict] = []
+    rejected: list[dict] = []
+    reasons: dict[str, int] = {}
+    first_seen: dict[str, int] = {}
+
+    def _reject(number: int, email, reason: str, **extra):
+        reasons[reason] = reasons.get(reason, 0) + 1
+        if len(rejected) < PREFLIGHT_REPORT_LIMIT:
+            rejected.append({"row": number, "email": email, "reason": reason, **extra})
+
+    for number, row in enumerate(rows, start=1):
+        email = str(row.get(email_column) or "").strip() if email_column else ""
+        if not email:
+            _reject(number, None, "missing_email")
+            continue
+        if not EMAIL_RE.match(email):
+            _reject(number, email, "invalid_email")
+            continue
+        key = email.lower()
+        if key in first_seen:
+            _reject(number, email, "duplicate_email", duplicate_of=first_seen[key])
+            continue
+        first_seen[key] = number
+        row[email_column] = email
+        clean.append(row)
+
+    report = {
+        "total_rows": len(rows),
+        "valid_rows": len(clean),
+        "rejected_rows": len(rows) - len(clean),
+        "columns": columns,
+        "email_column": email_column,
+        "name_column": name_column,
+        "unmapped_placeholders": unmapped,
+        "reasons": reasons,
+        "rejected": rejected,
+        "estimate": estimate_duration(len(clean), output_format, lazy_render, template_size),
+    }
+    options_error = None
+    if lazy_render and output_format == "pdf_combined":
+        # Lazy certificates are rendered one at a time when viewed; a combined PDF needs every page at once
+        options_error = "Combined PDFs can't be rendered on first view."
+    return PreflightResult(clean, email_column, name_column, report, options_error)
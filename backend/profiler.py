@@ -0,0 +1,294 @@
+"""
+On-demand sampling profiler.
+
+An admin arms a capture for the next N seconds, for a dispatch job ID, or for requests whose path matches a
+glob. While a capture is running, a daemon thread samples the interpreter's stacks every PROFILE_INTERVAL_MS
+and aggregates them into collapsed stacks ("frame;frame;frame count" lines, as read by flamegraph.pl and
+speedscope), saved under PROFILE_STORE_DIR for download.
+
+Job and route captures only keep event-loop samples taken while the captured task is the one running,
+plus busy worker threads (asyncio.to_thread calls such as SMTP sends). Threads parked in select/queue waits
+are skipped, so the stacks show where the CPU time goes. When nothing is armed there is no
+sampler thread; the only cost is a dict/list emptiness check per dispatch job and per request.
+
+Captures live in the memory of the process that armed them, so with several workers arm them on each.
+"""
+import os
+import sys
+import time
+import uuid
+import asyncio
+import fnmatch
+import datetime
+import linecache
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Optional
+
+from storage import atomic_write_file
+
+PROFILE_STORE_DIR = os.getenv("PROFILE_STORE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+# Hard cap on how long one capture samples, whatever its target
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "300"))
+
+PROFILE_HISTORY = 100
+
+# Leaf frames of a thread that is parked waiting for work
+_IDLE_LEAVES = {"wait", "select", "poll", "epoll", "_worker", "get", "_wait_for_tstate_lock", "accept", "sleep"}
+# Blocking calls into C (e.g. SimpleQueue.get in aiosqlite's connection thread) leave a Python frame as the
+# leaf, so its current source line is checked too
+_IDLE_CALLS = (".get()", ".get(timeout", ".wait(", ".select(", ".accept(", "sleep(")
+_idle_lines: dict[tuple[str, int], bool] = {}
+
+
+def _is_idle(frame) -> bool:
+    if frame.f_code.co_name in _IDLE_LEAVES:
+        return True
+    key = (frame.f_code.co_filename, frame.f_lineno)
+    idle = _idle_lines.get(key)
+    if idle is None:
+        line = linecache.getline(*key)
+        idle = _idle_lines[key] = any(call in line for call in _IDLE_CALLS)
+    return idle
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _collapse(frame, thread_name: str) -> str:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.append(f"thread:{thread_name}")
+    return ";".join(reversed(labels))
+
+
+class ProfileSession:
+    def __init__(self, target: str, value=None, max_seconds: float = PROFILE_MAX_SECONDS,
+                 expires_in: float = 600, count: int = 1):
+        self.id = uuid.uuid4().hex[:12]
+        self.target = target          # "seconds", "job" or "route"
+        self.value = value            # seconds, job ID or path glob
+        self.max_seconds = min(max_seconds, PROFILE_MAX_SECONDS)
+        self.count = count            # route captures: matching requests to capture
+        self.captured = 0
+        self.status = "armed"         # armed, running, completed, expired, cancelled
+        self.created_at = datetime.datetime.utcnow()
+        self.expires_at = time.monotonic() + expires_in
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[datetime.datetime] = None
+        self.samples = 0
+        self.stacks: dict[str, int] = {}
+        # Captured asyncio tasks -> their loop (job/route captures)
+        self.tasks: dict[asyncio.Task, asyncio.AbstractEventLoop] = {}
+        # Event loop threads seen running a captured task; their other work is never sampled
+        self.loop_threads: dict[int, asyncio.AbstractEventLoop] = {}
+
+    @property
+    def all_threads(self) -> bool:
+        return self.target == "seconds"
+
+    @property
+    def path(self) -> str:
+        return os.path.join(PROFILE_STORE_DIR, f"{self.id}.collapsed")
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "target": self.target,
+            "value": self.value,
+            "status": self.status,
+            "count": self.count,
+            "captured": self.captured,
+            "samples": self.samples,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class Profiler:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sessions: dict[str, ProfileSession] = {}
+        self._armed_jobs: dict[int, ProfileSession] = {}
+        self._armed_routes: list[ProfileSession] = []
+        self._running: set[ProfileSession] = set()
+        self._thread: Optional[threading.Thread] = None
+
+    # --- Arming ---------------------------------------------------------------------------------
+
+    def arm(self, seconds: Optional[float] = None, job_id: Optional[int] = None, route: Optional[str] = None,
+            max_seconds: float = PROFILE_MAX_SECONDS, expires_in: float = 600, count: int = 1) -> ProfileSession:
+        if sum(x is not None for x in (seconds, job_id, route)) != 1:
+            raise ValueError("Arm exactly one of seconds, job_id or route")
+        with self._lock:
+            if seconds is not None:
+                session = ProfileSession("seconds", seconds, max_seconds=min(seconds, max_seconds))
+                self._start(session)
+            elif job_id is not None:
+                session = ProfileSession("job", job_id, max_seconds, expires_in)
+                self._armed_jobs[job_id] = session
+            else:
+                session = ProfileSession("route", route, max_seconds, expires_in, count)
+                self._armed_routes.append(session)
+            self.sessions[session.id] = session
+            # Keep the most recent captures listed; their files stay on disk
+            for old_id in list(self.sessions)[:-PROFILE_HISTORY]:
+                if self.sessions[old_id].status not in ("armed", "running"):
+                    del self.sessions[old_id]
+        return session
+
+    def cancel(self, session_id: str) -> Optional[ProfileSession]:
+        with self._lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                return None
+            if session.status == "armed":
+                self._disarm(session)
+                session.status = "cancelled"
+            elif session.status == "running":
+                self._finish(session)
+        return session
+
+    def _disarm(self, session: ProfileSession):
+        if session.target == "job":
+            self._armed_jobs.pop(session.value, None)
+        elif session in self._armed_routes:
+            self._armed_routes.remove(session)
+
+    def _expire(self):
+        now = time.monotonic()
+        for session in list(self._armed_jobs.values()) + self._armed_routes:
+            if now <= session.expires_at:
+                continue
+            self._disarm(session)
+            if session.status == "armed":
+                session.status = "expired"
+            elif session.status == "running" and not session.tasks:
+                # Route capture that saw fewer matching requests than requested
+                self._finish(session)
+
+    # --- Captures -------------------------------------------------------------------------------
+
+    def capture_job(self, job_id: int):
+        """Context manager around a dispatch job; samples it if a capture is armed for this job ID."""
+        if not self._armed_jobs:
+            return nullcontext()
+        with self._lock:
+            self._expire()
+            session = self._armed_jobs.pop(job_id, None)
+        if session is None:
+            return nullcontext()
+        return self._capture_task(session)
+
+    def capture_request(self, path: str):
+        """Context manager around a request; samples it if an armed route glob matches the path."""
+        if not self._armed_routes:
+            return nullcontext()
+        with self._lock:
+            self._expire()
+            session = next((s for s in self._armed_routes if fnmatch.fnmatchcase(path, s.value)), None)
+            if session is None:
+                return nullcontext()
+            session.captured += 1
+            if session.captured >= session.count:
+                self._armed_routes.remove(session)
+        return self._capture_task(session)
+
+    @contextmanager
+    def _capture_task(self, session: ProfileSession):
+        task = asyncio.current_task()
+        with self._lock:
+            if session.status in ("armed", "running"):
+                loop = asyncio.get_running_loop()
+                session.tasks[task] = loop
+                session.loop_threads[threading.get_ident()] = loop
+                if session.status == "armed":
+                    self._start(session)
+        try:
+            yield session
+        finally:
+            with self._lock:
+                session.tasks.pop(task, None)
+                # Route captures end after their last matching request
+                done = not session.tasks and not (session.target == "route" and session in self._armed_routes)
+                if done and session.status == "running":
+                    self._finish(session)
+
+    # --- Sampling -------------------------------------------------------------------------------
+
+    def _start(self, session: ProfileSession):
+        session.status = "running"
+        session.started_at = time.monotonic()
+        self._running.add(session)
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._sample_loop, name="credify-profiler", daemon=True)
+            self._thread.start()
+
+    def _finish(self, session: ProfileSession):
+        self._disarm(session)
+        self._running.discard(session)
+        session.status = "completed"
+        session.finished_at = datetime.datetime.utcnow()
+        lines = [f"{stack} {count}" for stack, count in sorted(session.stacks.items())]
+        atomic_write_file(session.path, ("\n".join(lines) + "\n").encode() if lines else b"")
+        session.stacks = {}
+
+    def _sample_loop(self):
+        interval = PROFILE_INTERVAL_MS / 1000
+        own_id = threading.get_ident()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                for session in list(self._running):
+                    if now - session.started_at >= session.max_seconds:
+                        self._finish(session)
+                if not self._running:
+                    self._thread = None
+                    return
+                sessions = list(self._running)
+                frames = sys._current_frames()
+                names = {t.ident: t.name for t in threading.enumerate()}
+
+                for thread_id, frame in frames.items():
+                    if thread_id == own_id or _is_idle(frame):
+                        continue
+                    stack = None
+                    for session in sessions:
+                        if not session.all_threads and not session.tasks:
+                            continue
+                        loop = session.loop_threads.get(thread_id)
+                        # Event loop thread: only while one of this session's tasks is the one running
+                        if loop is not None and asyncio.current_task(loop) not in session.tasks:
+                            continue
+                        if stack is None:
+                            stack = _collapse(frame, names.get(thread_id, str(thread_id)))
+                        session.stacks[stack] = session.stacks.get(stack, 0) + 1
+                        session.samples += 1
+                del frames
+            time.sleep(interval)
+
+    def list_sessions(self) -> list[ProfileSession]:
+        with self._lock:
+            self._expire()
+            return sorted(self.sessions.values(), key=lambda s: s.created_at, reverse=True)
+
+
+profiler = Profiler()
+
+
+class ProfilerMiddleware:
+    """ASGI middleware starting route captures. Must sit inside any middleware that runs the app in a new task."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not profiler._armed_routes:
+            return await self.app(scope, receive, send)
+        with profiler.capture_request(scope["path"]):
+            await self.app(scope, receive, send)
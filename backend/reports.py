@@ -0,0 +1,72 @@
+"""
+Streaming delivery reports: one line per certificate of a job (recipient, certificate ID, status, opened_at,
+image URL) as CSV or NDJSON.
+
+Rows come from a streamed query (a server-side cursor on PostgreSQL, fetched REPORT_FETCH_ROWS at a time) as
+plain tuples rather than ORM objects, and are serialized into chunks of about REPORT_CHUNK_SIZE bytes, so a
+report's memory use doesn't depend on the number of recipients.
+"""
+import io
+import os
+import csv
+import json
+from typing import AsyncIterator
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Certificate
+
+REPORT_FETCH_ROWS = int(os.getenv("REPORT_FETCH_ROWS", "1000"))
+REPORT_CHUNK_SIZE = 64 * 1024
+
+REPORT_FIELDS = ("recipient_email", "recipient_name", "certificate_id", "status", "opened_at", "image_url")
+REPORT_MEDIA_TYPES = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+
+async def report_rows(session: AsyncSession, job_id: int) -> AsyncIterator[tuple]:
+    """Report rows of a job in issue order, in REPORT_FIELDS order."""
+    result = await session.stream(
+        select(
+            Certificate.recipient_email, Certificate.recipient_name, Certificate.id,
+            Certificate.status, Certificate.opened_at, Certificate.image_url,
+        )
+        .where(Certificate.job_id == job_id)
+        .order_by(Certificate.issued_at)
+        .execution_options(yield_per=REPORT_FETCH_ROWS)
+    )
+    async for row in result:
+        yield tuple(row)
+
+
+def _csv_line(writer, row: tuple):
+    email, name, cert_id, status, opened_at, image_url = row
+    writer.writerow((email, name, cert_id, status, opened_at.isoformat() if opened_at else "", image_url or ""))
+
+
+def _ndjson_line(buffer: io.StringIO, row: tuple):
+    record = dict(zip(REPORT_FIELDS, row))
+    if record["opened_at"] is not None:
+        record["opened_at"] = record["opened_at"].isoformat()
+    buffer.write(json.dumps(record))
+    buffer.write("\n")
+
+
+async def report_stream(rows: AsyncIterator[tuple], fmt: str = "csv") -> AsyncIterator[bytes]:
+    """Serializes report rows into response chunks."""
+    buffer = io.StringIO()
+    if fmt == "csv":
+        writer = csv.writer(buffer)
+        writer.writerow(REPORT_FIELDS)
+        write = lambda row: _csv_line(writer, row)
+    else:
+        write = lambda row: _ndjson_line(buffer, row)
+
+    async for row in rows:
+        write(row)
+        if buffer.tell() >= REPORT_CHUNK_SIZE:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
@@ -0,0 +1,71 @@
+"""
+Admin Router — operational tools restricted to ADMIN_EMAILS.
+Profiling: arm a sampling capture for the next N seconds, a dispatch job ID or requests matching a
+path glob (e.g. "/api/projects/preview"), then download the collapsed stacks for a flame graph.
+"""
+import os
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse
+from pydantic import BaseModel, Field
+
+from models import User
+from auth import get_admin_user
+from profiler import profiler, PROFILE_MAX_SECONDS
+
+router = APIRouter(prefix="/api/admin", tags=["admin"])
+
+
+class ProfileRequest(BaseModel):
+    # Exactly one target
+    seconds: Optional[float] = Field(None, gt=0, le=PROFILE_MAX_SECONDS)
+    job_id: Optional[int] = None
+    route: Optional[str] = None
+    # Job/route captures: sampling limit per capture, how long to wait for the target, requests to capture
+    max_seconds: float = Field(60, gt=0, le=PROFILE_MAX_SECONDS)
+    expires_in: float = Field(600, gt=0)
+    count: int = Field(1, ge=1, le=100)
+
+
+def _get_session(session_id: str):
+    session = profiler.sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return session
+
+
+@router.post("/profiles")
+async def arm_profile(req: ProfileRequest, admin: User = Depends(get_admin_user)):
+    try:
+        session = profiler.arm(
+            seconds=req.seconds, job_id=req.job_id, route=req.route,
+            max_seconds=req.max_seconds, expires_in=req.expires_in, count=req.count,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return session.to_dict()
+
+
+@router.get("/profiles")
+async def list_profiles(admin: User = Depends(get_admin_user)):
+    return [session.to_dict() for session in profiler.list_sessions()]
+
+
+@router.get("/profiles/{session_id}")
+async def get_profile(session_id: str, admin: User = Depends(get_admin_user)):
+    return _get_session(session_id).to_dict()
+
+
+@router.get("/profiles/{session_id}/collapsed")
+async def download_profile(session_id: str, admin: User = Depends(get_admin_user)):
+    session = _get_session(session_id)
+    if session.status != "completed" or not os.path.exists(session.path):
+        raise HTTPException(status_code=409, detail=f"Profile is {session.status}")
+    return FileResponse(session.path, media_type="text/plain", filename=f"profile-{session.id}.collapsed")
+
+
+@router.delete("/profiles/{session_id}")
+async def cancel_profile(session_id: str, admin: User = Depends(get_admin_user)):
+    """Disarms a pending capture, or stops a running one early and keeps what was sampled."""
+    _get_session(session_id)
+    return profiler.cancel(session_id).to_dict()
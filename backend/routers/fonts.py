@@ -5,15 +5,18 @@ stored in the font_assets DB table, grouped by family, and deduplicated.
 """
 import re
 import os
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
+import asyncio
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Request, Response
+from fastapi.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from collections import defaultdict
 
 from database import get_db
 from models import FontAsset, User
 from storage import upload_file_to_s3
 from auth import get_current_user
+from font_registry import font_registry, font_full_name
+from font_store import store_font_bytes
 
 router = APIRouter(prefix="/api/fonts", tags=["fonts"])
 
@@ -45,23 +48,16 @@ def _parse_font_name(filename: str) -> tuple[str, str]:
 
 
 @router.get("")
-async def list_fonts(db: AsyncSession = Depends(get_db)):
+async def list_fonts(request: Request, db: AsyncSession = Depends(get_db)):
     """
-    Returns all persisted fonts grouped by family.
+    Returns all persisted fonts grouped by family, served from the in-memory font registry.
     e.g. { "Space Grotesk": [ {variant, url}, ... ], ... }
     """
-    result = await db.execute(select(FontAsset).order_by(FontAsset.family, FontAsset.variant))
-    fonts = result.scalars().all()
-
-    grouped: dict[str, list] = defaultdict(list)
-    for f in fonts:
-        grouped[f.family].append({
-            "variant": f.variant,
-            "url": f.storage_url,
-            "fontName": f"{f.family} {f.variant}".strip(),
-        })
-
-    return dict(grouped)
+    grouped, etag = await font_registry.grouped(db)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content=grouped, headers=headers)
 
 
 @router.post("/upload")
@@ -119,10 +115,13 @@ async def upload_font(
         file=_io.BytesIO(font_bytes),
     )
     storage_url = await upload_file_to_s3(structured_file, folder=f"fonts/{safe_family}")
+    # Keep a content-addressed local copy so previews and dispatch never download it again
+    await asyncio.to_thread(store_font_bytes, font_bytes, storage_url)
 
     font_record = FontAsset(
         family=family,
         variant=variant,
+        full_name=font_full_name(family, variant),
         storage_url=storage_url,
         file_name=file.filename,
         uploaded_by=current_user.id,
@@ -130,11 +129,12 @@ async def upload_font(
     db.add(font_record)
     await db.commit()
     await db.refresh(font_record)
+    font_registry.invalidate()
 
     return {
         "family": family,
         "variant": variant,
-        "fontName": f"{family} {variant}".strip(),
+        "fontName": font_full_name(family, variant),
         "url": storage_url,
     }
 
@@ -1,22 +1,32 @@
 import io
 import os
-import aiohttp
-import smtplib
+import asyncio
 import base64
 import datetime
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, BackgroundTasks, Response
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, BackgroundTasks, Response, Query
 from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import update, tuple_
 from sqlalchemy.future import select
 
-from database import get_db
-from models import User, Project, DispatchJob, Certificate
+from database import get_db, AsyncSessionLocal, batch_writer
+from models import User, Project, DispatchJob, Certificate, new_certificate_id
 from auth import get_current_user
 from schemas import ProjectCreate, ProjectResponse, PreviewRequest, ProjectMappingUpdate, DispatchJobResponse, TestEmailRequest
-from storage import upload_file_to_s3
-from services import generate_preview
-from dispatch import process_dispatch_job, send_test_email
+from storage import upload_file_to_s3, is_stored_url
+from font_store import fetch_font_path, download_font_bytes
+from template_store import ingest_template, record_template_url, ensure_template_raster, select_level, open_template_raster, decode_template
+from dispatch import (
+    process_dispatch_job, send_test_email, verify_smtp_login, extract_recipient, load_project_template,
+    resolve_font_paths, build_placeholder_args, render_certificate, create_renderers
+)
+from archive import zip_stream, stored_certificate_entries, archive_entry_name
+from reports import report_rows, report_stream, REPORT_MEDIA_TYPES
+from stats import bump_user_stats, get_user_stats
+from metrics import DISPATCH_JOBS_QUEUED, stage
+from preflight import run_preflight
 from pydantic import BaseModel
+from typing import Optional, Literal
 import logging
 
 logger = logging.getLogger(__name__)
@@ -25,12 +35,46 @@ class DispatchRequest(BaseModel):
     csv_data: list[dict]
     email_subject: str
     email_body: str
+    # png: raster per certificate, pdf: vector PDF per certificate, pdf_combined: one multi-page PDF per job
+    # (its certificates have no image_url, so their verify page shows no certificate image)
+    output_format: Literal["png", "pdf", "pdf_combined"] = "png"
+    # Only email the verify links; each certificate is rendered the first time it is viewed (png and pdf only)
+    lazy_render: bool = False
+
+class PreflightRequest(BaseModel):
+    csv_data: list[dict]
+    output_format: Literal["png", "pdf", "pdf_combined"] = "png"
+    lazy_render: bool = False
+
+class ExportRequest(BaseModel):
+    csv_data: list[dict]
+    output_format: Literal["png", "pdf"] = "png"
 
 router = APIRouter(prefix="/api/projects", tags=["projects"])
 
+# Listing endpoints are keyset-paginated: the next page's opaque cursor is returned in X-Next-Cursor.
+# Projects are only paginated when called with limit or cursor (the editor needs the full list); jobs always are
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+def _encode_cursor(*parts) -> str:
+    raw = "|".join(p.isoformat() if isinstance(p, datetime.datetime) else str(p) for p in parts)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str, count: int) -> list[str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        parts = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+    except Exception:
+        parts = []
+    if len(parts) != count:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor.")
+    return parts
+
 async def download_file(url: str) -> bytes:
     # If the URL is our mock local URL, we would normally handle it differently,
     # but for simplicity, we treat it as an honest HTTP fetch.
+    import aiohttp
     async with aiohttp.ClientSession() as session:
         async with session.get(url) as response:
             if response.status != 200:
@@ -38,50 +82,87 @@ async def download_file(url: str) -> bytes:
             return await response.read()
 
 @router.post("/upload")
-async def upload_asset(file: UploadFile = File(...), current_user: User = Depends(get_current_user)):
+async def upload_asset(file: UploadFile = File(...), kind: str = Form("asset"), current_user: User = Depends(get_current_user)):
     """
     Upload a template or font to Cloud Storage (or local mock block).
+    Templates (kind="template") are also ingested into a pre-decoded RGB raster for the renderer.
     Returns the public URL of the uploaded asset.
     """
+    raster = None
+    if kind == "template":
+        # Decode before uploading, so an unreadable template never leaves a file behind in storage
+        image_bytes = await file.read()
+        await file.seek(0)
+        try:
+            raster = await asyncio.to_thread(ingest_template, image_bytes)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Template is not a readable image: {e}")
     try:
         url = await upload_file_to_s3(file)
-        return {"url": url}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    response = {"url": url}
+    if raster is not None:
+        await asyncio.to_thread(record_template_url, url, raster["key"])
+        response["width"] = raster["width"]
+        response["height"] = raster["height"]
+    return response
+
 @router.post("/preview")
 async def preview_certificate(req: PreviewRequest, current_user: User = Depends(get_current_user)):
     """
-    Downloads the template and font, processes it using the backend generation service,
-    and returns a live generated PNG image.
+    Renders the placeholder onto the pre-decoded template raster and returns a live generated PNG image.
+    With display_width set, the smallest template pyramid level at least that wide is used and the
+    bounding box and font size are scaled to match.
+    Only URLs into our own storage are kept in the template and font stores; any other URL is rendered from
+    a one-off download at full resolution, so clients can't fill the stores with arbitrary files.
     """
+    from services import render_placeholder, encode_image
     try:
-        template_bytes = await download_file(req.template_url)
-        
-        if req.is_qrcode:
-            font_bytes = b""
+        if is_stored_url(req.template_url):
+            raster = await ensure_template_raster(req.template_url)
+            level, scale = select_level(raster["key"], req.display_width)
+            base_image = open_template_raster(level)
         else:
+            base_image, scale = await decode_template(req.template_url), 1.0
+        if base_image is None:
+            raise Exception("Template raster is unreadable")
+        
+        font_bytes, font_path = b"", ""
+        if not req.is_qrcode:
             if not req.font_url:
                 raise HTTPException(status_code=400, detail="font_url is required for text rendering")
-            font_bytes = await download_file(req.font_url)
+            if is_stored_url(req.font_url):
+                # Served from the local font store after the first fetch
+                font_path = await fetch_font_path(req.font_url)
+            else:
+                font_bytes = await download_font_bytes(req.font_url)
                 
-        result_bytes = generate_preview(
-            template_bytes=template_bytes,
+        img = base_image.copy()
+        render_placeholder(
+            img,
             font_bytes=font_bytes,
+            font_path=font_path,
             text=req.text,
-            bbox_x=req.bbox_x,
-            bbox_y=req.bbox_y,
-            bbox_width=req.bbox_width,
-            bbox_height=req.bbox_height,
+            bbox_x=round(req.bbox_x * scale),
+            bbox_y=round(req.bbox_y * scale),
+            bbox_width=max(1, round(req.bbox_width * scale)),
+            bbox_height=max(1, round(req.bbox_height * scale)),
             text_color=req.text_color,
-            initial_font_size=req.font_size,
+            initial_font_size=max(1, round(req.font_size * scale)),
             is_qrcode=req.is_qrcode,
             qr_url=req.qr_url,
             qr_bg=req.qr_bg,
             align=req.align
         )
+        result_bytes = encode_image(img, format="PNG")
         
-        return StreamingResponse(io.BytesIO(result_bytes), media_type="image/png")
+        return StreamingResponse(
+            io.BytesIO(result_bytes),
+            media_type="image/png",
+            headers={"X-Preview-Scale": f"{scale:.4f}"}
+        )
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -94,7 +175,19 @@ async def create_project(project: ProjectCreate, current_user: User = Depends(ge
         template_url=project.template_url,
         owner_id=current_user.id
     )
+    # Only our own uploads are ingested; any other URL is decoded in memory whenever it's rendered
+    if is_stored_url(project.template_url):
+        try:
+            # Usually a local lookup — the template was ingested when it was uploaded
+            raster = await ensure_template_raster(project.template_url)
+            new_project.template_raster = raster["key"]
+            new_project.template_width = raster["width"]
+            new_project.template_height = raster["height"]
+        except Exception as e:
+            # Not fatal: dispatch ingests the template on first use
+            logger.warning(f"Template ingestion failed for {project.template_url}: {e}")
     db.add(new_project)
+    await bump_user_stats(db, current_user.id, total_projects=1)
     await db.commit()
     await db.refresh(new_project)
     return new_project
@@ -116,11 +209,51 @@ async def update_project_mapping(project_id: int, payload: ProjectMappingUpdate,
     return project
 
 @router.get("/", response_model=list[ProjectResponse])
-async def list_projects(current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Project).where(Project.owner_id == current_user.id))
+async def list_projects(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Fetch the current user's projects in creation order (served by ix_projects_owner_id_id). Without limit
+    or cursor every project is returned; otherwise a page, with X-Next-Cursor set when more follow.
+    """
+    query = select(Project).where(Project.owner_id == current_user.id).order_by(Project.id)
+    if limit is None and cursor is None:
+        return (await db.execute(query)).scalars().all()
+    limit = limit or DEFAULT_PAGE_SIZE
+    if cursor:
+        (last_id,) = _decode_cursor(cursor, 1)
+        try:
+            last_id = int(last_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid pagination cursor.")
+        query = query.where(Project.id > last_id)
+    result = await db.execute(query.limit(limit + 1))
     projects = result.scalars().all()
+
+    if len(projects) > limit:
+        projects = projects[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(projects[-1].id)
     return projects
 
+@router.post("/{project_id}/preflight")
+async def preflight_project(project_id: int, req: PreflightRequest, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    """
+    Dry run of the checks dispatch applies to a CSV: which rows would be sent, which would be skipped and why,
+    and how long the job is expected to take. Nothing is written.
+    """
+    result = await db.execute(select(Project).where(Project.id == project_id, Project.owner_id == current_user.id))
+    project = result.scalars().first()
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found or access denied.")
+    with stage("preflight"):
+        preflight = run_preflight(req.csv_data, project.mapping_data or [], req.output_format, req.lazy_render,
+                                  (project.template_width, project.template_height))
+    return dict(preflight.report, ok=preflight.blocking_error is None, error=preflight.blocking_error)
+
 @router.post("/{project_id}/dispatch", response_model=DispatchJobResponse)
 async def dispatch_project(project_id: int, req: DispatchRequest, background_tasks: BackgroundTasks, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     result = await db.execute(select(Project).where(Project.id == project_id, Project.owner_id == current_user.id))
@@ -136,49 +269,152 @@ async def dispatch_project(project_id: int, req: DispatchRequest, background_tas
         logger.error(f"Dispatch failed for project {project_id}: Mapping data or template URL missing")
         raise HTTPException(status_code=400, detail="Project mapping or template is missing. Please save the canvas configuration first.")
 
-    try:
-        sender_email = os.getenv("SENDER_EMAIL")
-        app_password = os.getenv("APP_PASSWORD")
-        if not sender_email or not app_password:
-            logger.error("Dispatch failed: SMTP Credentials missing")
-            raise HTTPException(status_code=400, detail="SMTP Credentials (SENDER_EMAIL, APP_PASSWORD) missing in .env")
-        
-        logger.info(f"Verifying SMTP login for {sender_email} (Forcing IPv4 + Port 465)...")
-        # Force IPv4 to avoid Render IPv6 routing issues
-        import socket
-        try:
-            # Use smtp.googlemail.com as it sometimes has better routing
-            with smtplib.SMTP_SSL("smtp.googlemail.com", 465, timeout=10) as server:
-                server.login(sender_email, app_password)
-            logger.info("SMTP login successful")
-        except (socket.gaierror, socket.error, smtplib.SMTPConnectError) as e:
-            if "101" in str(e) or "unreachable" in str(e).lower():
-                logger.warning(f"SMTP is unreachable during pre-check: {e}. Allowing dispatch to background task anyway.")
-            else:
-                raise e
-    except smtplib.SMTPAuthenticationError:
+    with stage("preflight"):
+        preflight = run_preflight(req.csv_data, project.mapping_data, req.output_format, req.lazy_render,
+                                  (project.template_width, project.template_height))
+    if preflight.blocking_error:
+        logger.error(f"Dispatch failed for project {project_id}: {preflight.blocking_error}")
+        raise HTTPException(status_code=400, detail=preflight.blocking_error)
+    if preflight.report["rejected_rows"]:
+        logger.info(f"Pre-flight for project {project_id} skipped {preflight.report['rejected_rows']} rows: {preflight.report['reasons']}")
+
+    sender_email = os.getenv("SENDER_EMAIL")
+    app_password = os.getenv("APP_PASSWORD")
+    if not sender_email or not app_password:
+        logger.error("Dispatch failed: SMTP Credentials missing")
+        raise HTTPException(status_code=400, detail="SMTP Credentials (SENDER_EMAIL, APP_PASSWORD) missing in .env")
+
+    # Runs in a worker thread and is usually answered from the cache of recent checks (verify_smtp_login)
+    with stage("smtp_check"):
+        outcome, detail = await verify_smtp_login(sender_email, app_password)
+    if outcome == "auth_failed":
         logger.error("Dispatch failed: SMTP Authentication Error")
         raise HTTPException(status_code=400, detail="Invalid SMTP Application Password. Please check your Google App Passwords.")
-    except Exception as e:
-        logger.error(f"Dispatch failed: SMTP Connection Error: {e}")
-        # We don't block the whole process if just the PRE-CHECK fails due to a timeout, 
-        # but if it's a real connection error we should report it.
-        if "timeout" in str(e).lower():
-            logger.warning("SMTP pre-check timed out, but allowed to proceed to background task.")
-        else:
-            raise HTTPException(status_code=400, detail=f"SMTP Connection Error: {str(e)}")
+    if outcome in ("unreachable", "timeout"):
+        # We don't block the whole process if just the PRE-CHECK can't reach the server
+        logger.warning(f"SMTP pre-check failed ({outcome}): {detail}. Allowing dispatch to background task anyway.")
+    elif outcome == "error":
+        logger.error(f"Dispatch failed: SMTP Connection Error: {detail}")
+        raise HTTPException(status_code=400, detail=f"SMTP Connection Error: {detail}")
 
     job = DispatchJob(
         project_id=project.id,
-        total_certificates=len(req.csv_data),
-        status="pending"
+        owner_id=current_user.id,
+        total_certificates=len(preflight.rows),
+        status="pending",
+        output_format=req.output_format,
+        lazy_render=req.lazy_render,
+        preflight=preflight.job_report()
     )
     db.add(job)
+    await bump_user_stats(db, current_user.id, total_certificates=job.total_certificates)
     await db.commit()
     await db.refresh(job)
-    background_tasks.add_task(process_dispatch_job, job.id, project.id, req.csv_data, req.email_subject, req.email_body)
+    DISPATCH_JOBS_QUEUED.inc()
+    background_tasks.add_task(process_dispatch_job, job.id, project.id, preflight.rows, req.email_subject, req.email_body, req.output_format,
+                              (preflight.email_column, preflight.name_column))
     return job
 
+# Tasks marking aborted exports as failed, referenced until they finish
+_export_closers: set[asyncio.Task] = set()
+
+async def _close_aborted_export(job_id: int):
+    async with AsyncSessionLocal() as session:
+        job = await session.get(DispatchJob, job_id)
+        if job is not None and job.status == "processing":
+            job.status = "failed"
+            job.completed_at = datetime.datetime.utcnow()
+            await session.commit()
+    logger.warning(f"Export {job_id} was aborted after {job.processed_certificates if job else 0} rows")
+
+@router.post("/{project_id}/export")
+async def export_project(project_id: int, req: ExportRequest, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    """
+    Export-only job: renders every row straight into a streamed ZIP download.
+    Certificates are recorded (so QR verify links work) but nothing is uploaded or emailed.
+    """
+    result = await db.execute(select(Project).where(Project.id == project_id, Project.owner_id == current_user.id))
+    project = result.scalars().first()
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found or access denied.")
+    if not project.mapping_data or not project.template_url:
+        raise HTTPException(status_code=400, detail="Project mapping or template is missing. Please save the canvas configuration first.")
+
+    job = DispatchJob(
+        project_id=project.id,
+        owner_id=current_user.id,
+        total_certificates=len(req.csv_data),
+        status="processing",
+        output_format=req.output_format,
+        export_only=True
+    )
+    db.add(job)
+    await bump_user_stats(db, current_user.id, total_certificates=job.total_certificates)
+    await db.commit()
+    job_id = job.id
+
+    async def _rendered_entries():
+        # Own session: the request-scoped one is closed before the response body is streamed
+        async with AsyncSessionLocal() as session:
+            export_job = await session.get(DispatchJob, job_id)
+            export_project = await session.get(Project, project_id)
+            try:
+                base_image = await load_project_template(session, export_project)
+            except Exception as e:
+                logger.error(f"Export {job_id} failed to load template: {e}")
+                export_job.status = "failed"
+                await session.commit()
+                return
+            font_paths = await resolve_font_paths(session, export_project.mapping_data)
+            pdf_renderer, png_encoder = await create_renderers(base_image, req.output_format)
+
+            finished = False
+            try:
+                for row in req.csv_data:
+                    recipient_email, recipient_name = extract_recipient(row)
+                    cert_id = new_certificate_id()
+                    try:
+                        placeholders = [build_placeholder_args(ph, row, cert_id, font_paths) for ph in export_project.mapping_data]
+                        data, ext = await asyncio.to_thread(render_certificate, base_image, placeholders, pdf_renderer, png_encoder)
+                    except Exception as e:
+                        logger.error(f"Export {job_id} failed to render a row: {e}")
+                        export_job.failed_deliveries += 1
+                        export_job.processed_certificates += 1
+                        await session.commit()
+                        continue
+                    # Committed before the file goes into the ZIP: every certificate a client received has a
+                    # working verify link, even if the download is aborted right after
+                    session.add(Certificate(
+                        id=cert_id,
+                        project_id=export_project.id,
+                        job_id=job_id,
+                        recipient_email=recipient_email,
+                        recipient_name=recipient_name,
+                        status="Exported"
+                    ))
+                    export_job.successful_deliveries += 1
+                    export_job.processed_certificates += 1
+                    await session.commit()
+                    yield archive_entry_name(recipient_name, cert_id, ext), data
+
+                export_job.status = "completed"
+                export_job.completed_at = datetime.datetime.utcnow()
+                await session.commit()
+                finished = True
+            finally:
+                if not finished:
+                    # Download aborted (client disconnected or an error): close the job out from a task of its
+                    # own, since awaits here would be cancelled along with the response
+                    closer = asyncio.ensure_future(_close_aborted_export(job_id))
+                    _export_closers.add(closer)
+                    closer.add_done_callback(_export_closers.discard)
+
+    return StreamingResponse(
+        zip_stream(_rendered_entries()),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="job-{job_id}-certificates.zip"'}
+    )
+
 @router.post("/{project_id}/test-email")
 async def test_email(project_id: int, req: TestEmailRequest, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     result = await db.execute(select(Project).where(Project.id == project_id, Project.owner_id == current_user.id))
@@ -214,45 +450,102 @@ async def get_dispatch_job(job_id: int, current_user: User = Depends(get_current
         raise HTTPException(status_code=404, detail="Job not found")
     return job
 
-from sqlalchemy import func
+@router.get("/jobs/{job_id}/archive")
+async def download_job_archive(job_id: int, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    """Streams a ZIP of every stored certificate of a job (plus its combined PDF, if any)."""
+    result = await db.execute(select(DispatchJob).join(Project).where(
+        DispatchJob.id == job_id,
+        Project.owner_id == current_user.id
+    ))
+    job = result.scalars().first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    extra_files = [(f"job-{job.id}.pdf", job.output_url)] if job.output_url else []
+
+    async def _rows():
+        # Own session with a streamed result: the request-scoped one is closed before the body is sent
+        async with AsyncSessionLocal() as session:
+            result = await session.stream(
+                select(Certificate.id, Certificate.recipient_name, Certificate.image_url)
+                .where(Certificate.job_id == job_id)
+                .execution_options(yield_per=500)
+            )
+            async for row in result:
+                yield tuple(row)
+
+    return StreamingResponse(
+        zip_stream(stored_certificate_entries(_rows(), extra_files)),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="job-{job.id}-certificates.zip"'}
+    )
+
+@router.get("/jobs/{job_id}/report")
+async def download_job_report(
+    job_id: int,
+    format: Literal["csv", "ndjson"] = "csv",
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Streams the job's per-recipient outcomes (status, opened_at, image URL) as CSV or NDJSON."""
+    result = await db.execute(select(DispatchJob.id).join(Project).where(
+        DispatchJob.id == job_id,
+        Project.owner_id == current_user.id
+    ))
+    if result.scalar() is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def _chunks():
+        # Own session with a streamed result: the request-scoped one is closed before the body is sent
+        async with AsyncSessionLocal() as session:
+            async for chunk in report_stream(report_rows(session, job_id), format):
+                yield chunk
+
+    return StreamingResponse(
+        _chunks(),
+        media_type=REPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="job-{job_id}-report.{format}"'}
+    )
 
 @router.get("/jobs", response_model=list[DispatchJobResponse])
-async def list_user_jobs(current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
-    """Fetch all dispatch jobs belonging to the current user's projects."""
+async def list_user_jobs(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Fetch a page of dispatch jobs belonging to the current user's projects, newest first, with X-Next-Cursor
+    set when more follow. Read in index order from ix_dispatch_jobs_owner_id_created_at_id, with no sort.
+    """
+    query = select(DispatchJob).where(DispatchJob.owner_id == current_user.id)
+    order = (DispatchJob.created_at.desc(), DispatchJob.id.desc())
+    if cursor:
+        last_created_at, last_id = _decode_cursor(cursor, 2)
+        try:
+            last_created_at = datetime.datetime.fromisoformat(last_created_at)
+            last_id = int(last_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid pagination cursor.")
+        # (created_at, id) row comparison — id breaks ties between jobs created in the same instant
+        query = query.where(tuple_(DispatchJob.created_at, DispatchJob.id) < tuple_(last_created_at, last_id))
     result = await db.execute(
-        select(DispatchJob)
-        .join(Project)
-        .where(Project.owner_id == current_user.id)
-        .order_by(DispatchJob.created_at.desc())
+        query.order_by(*order).limit(limit + 1)
     )
-    return result.scalars().all()
+    jobs = result.scalars().all()
+
+    if len(jobs) > limit:
+        jobs = jobs[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(jobs[-1].created_at, jobs[-1].id)
+    return jobs
 
 @router.get("/kpi")
 async def get_user_kpis(current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
-    """Calculate aggregate dashboard statistics for the logged-in user."""
-    # Total certificates dispatched
-    result = await db.execute(
-        select(func.sum(DispatchJob.total_certificates))
-        .join(Project)
-        .where(Project.owner_id == current_user.id)
-    )
-    total_certs = result.scalar() or 0
-    
-    # Total projects created
-    result_projects = await db.execute(
-        select(func.count(Project.id))
-        .where(Project.owner_id == current_user.id)
-    )
-    total_projects = result_projects.scalar() or 0
-    
-    # Track opened certificates
-    result_opened = await db.execute(
-        select(func.count(Certificate.id))
-        .join(Project)
-        .where(Project.owner_id == current_user.id)
-        .where(Certificate.status == "Opened")
-    )
-    total_opened = result_opened.scalar() or 0
+    """Dashboard statistics for the logged-in user, read from the incrementally maintained user_stats row."""
+    stats = await get_user_stats(db, current_user.id)
+    total_certs = stats.total_certificates
+    total_projects = stats.total_projects
+    total_opened = stats.total_opened
 
     hit_rate = (total_opened / total_certs * 100) if total_certs > 0 else 0
     
@@ -268,21 +561,31 @@ TRANSPARENT_PNG_PIXEL = base64.b64decode(
     "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII="
 )
 
+async def _record_open(db: AsyncSession, certificate_id: str):
+    # Conditional UPDATE so concurrent opens of the same mail only count once
+    result = await db.execute(
+        update(Certificate)
+        .where(Certificate.id == certificate_id, Certificate.status == "Sent")
+        .values(status="Opened", opened_at=datetime.datetime.utcnow())
+    )
+    if result.rowcount:
+        owner_id = (await db.execute(
+            select(Project.owner_id)
+            .join(Certificate, Certificate.project_id == Project.id)
+            .where(Certificate.id == certificate_id)
+        )).scalar()
+        await bump_user_stats(db, owner_id, total_opened=1)
+
 @router.get("/track/{certificate_id}.png")
-async def track_email_open(certificate_id: str, db: AsyncSession = Depends(get_db)):
+async def track_email_open(certificate_id: str):
     """
     Tracking endpoint using the Credify Logo.
     Registers 'Opened' status when the mail client loads the logo image.
     Redirects to the official Google Drive logo URL.
+    Opens arrive in bursts after a dispatch, so they are committed in batches by the shared batch writer.
     """
     try:
-        result = await db.execute(select(Certificate).where(Certificate.id == certificate_id))
-        cert = result.scalars().first()
-        
-        if cert and cert.status == "Sent":
-            cert.status = "Opened"
-            cert.opened_at = datetime.datetime.utcnow()
-            await db.commit()
+        await batch_writer.submit(lambda db: _record_open(db, certificate_id))
     except Exception as e:
         logger.error(f"Tracking failed for {certificate_id}: {e}")
     
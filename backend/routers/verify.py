@@ -1,31 +1,137 @@
-from fastapi import APIRouter, Depends, HTTPException
+import os
+import json
+import hashlib
+import logging
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import RedirectResponse
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import Session, object_session
 
 from database import get_db
+from cache import TTLCache
+from dispatch import ensure_certificate_rendered
 import models
 import schemas
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/api/verify", tags=["verification"])
 
+# Verification results keyed by certificate ID. Values are (status_code, body) tuples so that
+# unknown and revoked IDs are answered from memory too and scanners can't hammer the database.
+# Revocation evicts the entry only in the process that commits it: with several workers, the others keep
+# answering from their own copy for up to VERIFY_CACHE_TTL seconds, so keep the TTL short there.
+VERIFY_CACHE_TTL = int(os.getenv("VERIFY_CACHE_TTL", "300"))
+VERIFY_NEGATIVE_CACHE_TTL = int(os.getenv("VERIFY_NEGATIVE_CACHE_TTL", "60"))
+verify_cache = TTLCache(maxsize=int(os.getenv("VERIFY_CACHE_SIZE", "10000")), ttl=VERIFY_CACHE_TTL)
+
+_PENDING_INVALIDATIONS = "verify_cache_pending"
+
+
+def invalidate_certificate(certificate_id: str):
+    """Drop a certificate from the verification cache (e.g. after revocation)."""
+    if certificate_id:
+        verify_cache.pop(str(certificate_id))
+
+
+@event.listens_for(models.Certificate, "after_insert")
+@event.listens_for(models.Certificate, "after_update")
+def _invalidate_on_flush(mapper, connection, target):
+    # Evict at flush time, and remember the ID so it is evicted again once the transaction
+    # commits — otherwise a concurrent reader could re-cache the old row in between.
+    invalidate_certificate(target.id)
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_PENDING_INVALIDATIONS, set()).add(target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_on_commit(session):
+    for certificate_id in session.info.pop(_PENDING_INVALIDATIONS, ()):
+        invalidate_certificate(certificate_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session):
+    session.info.pop(_PENDING_INVALIDATIONS, None)
+
+
+def _build_response(request: Request, status_code: int, body: dict, cache_control: str) -> Response:
+    payload = json.dumps(body, separators=(",", ":")).encode()
+    etag = '"' + hashlib.sha1(payload).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if status_code == 200 and request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=payload, status_code=status_code, media_type="application/json", headers=headers)
+
+
 @router.get("/{certificate_id}", response_model=schemas.CertificateResponse)
-async def verify_certificate(certificate_id: str, db: AsyncSession = Depends(get_db)):
+async def verify_certificate(certificate_id: str, request: Request, db: AsyncSession = Depends(get_db)):
     """
     Public endpoint to verify a certificate's authenticity.
     Validates UUID checks against the database and returns issuance parameters.
+    Results (including misses) are served from an in-process TTL cache with ETag/Cache-Control headers.
     """
-    result = await db.execute(
-        select(models.Certificate)
-        .options(selectinload(models.Certificate.project))
-        .where(models.Certificate.id == certificate_id)
-    )
-    cert = result.scalars().first()
-    
-    if not cert:
+    cached = verify_cache.get(certificate_id)
+    cacheable = True
+    if cached is None:
+        result = await db.execute(
+            select(models.Certificate).where(models.Certificate.id == certificate_id)
+        )
+        cert = result.scalars().first()
+
+        if not cert:
+            cached = (404, {"detail": "Certificate not found or invalid."})
+            verify_cache.set(certificate_id, cached, ttl=VERIFY_NEGATIVE_CACHE_TTL)
+        elif cert.is_revoked:
+            cached = (400, {"detail": "This credential has been permanently revoked by the issuer."})
+            verify_cache.set(certificate_id, cached)
+        else:
+            body = schemas.CertificateResponse.model_validate(cert).model_dump(mode="json")
+            if cert.image_url is None and cert.render_data is not None:
+                # Lazy job: the first view renders the certificate
+                body["image_url"] = await _render_on_view(cert.id)
+            cached = (200, body)
+            # A failed lazy render is retried on the next view, so neither we nor a CDN may keep its null image_url
+            cacheable = body["image_url"] is not None or cert.render_data is None
+            if cacheable:
+                verify_cache.set(certificate_id, cached)
+
+    status_code, body = cached
+    if not cacheable:
+        cache_control = "no-store"
+    elif status_code == 200:
+        # A valid certificate can be revoked at any time: caches may keep it, but must revalidate every
+        # request (a cheap 304 while the ETag matches) so a revoked certificate never keeps verifying
+        cache_control = "no-cache"
+    else:
+        # Revoked and unknown IDs; a shared max-age lets a CDN absorb scanner traffic
+        max_age = VERIFY_CACHE_TTL if status_code != 404 else VERIFY_NEGATIVE_CACHE_TTL
+        cache_control = f"public, max-age={max_age}"
+    return _build_response(request, status_code, body, cache_control)
+
+
+async def _render_on_view(certificate_id: str):
+    try:
+        return await ensure_certificate_rendered(certificate_id)
+    except Exception as e:
+        # The details still verify; the next view retries the render
+        logger.error(f"Rendering certificate {certificate_id} on first view failed: {e}")
+        return None
+
+
+@router.get("/{certificate_id}/image")
+async def certificate_image(certificate_id: str, db: AsyncSession = Depends(get_db)):
+    """Redirects to the certificate file, rendering it first for lazy jobs."""
+    cert = await db.get(models.Certificate, certificate_id)
+    if not cert or cert.is_revoked:
         raise HTTPException(status_code=404, detail="Certificate not found or invalid.")
-    
-    if cert.is_revoked:
-        raise HTTPException(status_code=400, detail="This credential has been permanently revoked by the issuer.")
-        
-    return cert
+    image_url = cert.image_url
+    if image_url is None and cert.render_data is not None:
+        image_url = await _render_on_view(cert.id)
+    if image_url is None:
+        raise HTTPException(status_code=503, detail="Certificate image is not available yet.")
+    # Rendered files never change, but revocation must take effect at once, so the redirect isn't stored
+    return RedirectResponse(image_url, status_code=302, headers={"Cache-Control": "no-cache"})
@@ -14,6 +14,8 @@ class ProjectResponse(BaseModel):
     name: str
     template_url: Optional[str] = None
     mapping_data: Optional[List[Any]] = None
+    template_width: Optional[int] = None
+    template_height: Optional[int] = None
     owner_id: int
     
     class Config:
@@ -34,6 +36,8 @@ class PreviewRequest(BaseModel):
     qr_url: Optional[str] = None
     qr_bg: str = "transparent"
     align: str = "center"
+    # Width the editor displays the template at; picks a downscaled template level (None = full resolution)
+    display_width: Optional[int] = None
 
 class TestEmailRequest(BaseModel):
     emails: List[str]
@@ -44,7 +48,7 @@ class TestEmailRequest(BaseModel):
 class CertificateResponse(BaseModel):
     id: str
     project_id: int
-    recipient_email: str
+    recipient_email: Optional[str] = None
     recipient_name: str
     image_url: Optional[str] = None
     issued_at: Any
@@ -63,6 +67,12 @@ class DispatchJobResponse(BaseModel):
     failed_deliveries: int
     created_at: Any
     completed_at: Optional[Any] = None
+    output_format: Optional[str] = None
+    output_url: Optional[str] = None
+    export_only: Optional[bool] = None
+    timings: Optional[dict] = None
+    lazy_render: Optional[bool] = None
+    preflight: Optional[dict] = None
 
     class Config:
         from_attributes = True
@@ -1,16 +1,39 @@
 import io
-import qrcode
-from PIL import Image, ImageDraw, ImageFont
+import os
+import math
+import zlib
+import struct
+import hashlib
+import weakref
+import tempfile
+import functools
+from typing import Callable, Optional
+from PIL import Image, ImageChops, ImageColor, ImageDraw, ImageFont
 
-def get_font(font_bytes: bytes, text: str, max_width: int, max_height: int, initial_size: int):
+from cache import TTLCache
+from metrics import stage
+
+@functools.lru_cache(maxsize=256)
+def _truetype_from_path(font_path: str, size: int):
+    # FreeType maps font files opened by path, so worker processes share them through the page cache
+    return ImageFont.truetype(font_path, size)
+
+def get_font(font_bytes: bytes, text: str, max_width: int, max_height: int, initial_size: int,
+             font_path: Optional[str] = None):
     """
     Dynamically scales down the font size so that the text fits within max_width and max_height.
+    font_path is a local font file (see font_store.py) and is preferred when given;
     font_bytes is the raw TrueType font file content in memory. 
     If missing, falls back to Arial.
     """
     fontsize = initial_size
     
     def _load(sz):
+        if font_path:
+            try:
+                return _truetype_from_path(font_path, sz)
+            except Exception:
+                pass
         if font_bytes:
             try:
                 return ImageFont.truetype(io.BytesIO(font_bytes), sz)
@@ -44,19 +67,108 @@ def get_font(font_bytes: bytes, text: str, max_width: int, max_height: int, init
         
     return font
 
-def generate_preview(template_bytes: bytes, font_bytes: bytes, text: str, 
-                     bbox_x: int, bbox_y: int, bbox_width: int, bbox_height: int,
-                     text_color: str, initial_font_size: int = 120, format: str = "PNG",
-                     is_qrcode: bool = False, qr_url: Optional[str] = None,
-                     qr_bg: str = "transparent",
-                     align: str = "center") -> bytes:
+# --- Glyph atlas ------------------------------------------------------------------------------
+# Opt-in (GLYPH_ATLAS=true). FreeType rasterizes every glyph again on each draw.text call; with the atlas,
+# strings are composed from cached per-glyph masks placed with the font's own advances and kerning.
+# Pillow renders each glyph at its rounded pen position plus the subpixel remainder (in 1/64 px) and
+# blends overlapping glyphs alpha-over, so doing the same here gives pixel-identical output.
+# Only fonts opened from a path with the basic layout engine use it (no shaping), everything else
+# goes through draw.text.
+GLYPH_ATLAS = os.getenv("GLYPH_ATLAS", "false").lower() == "true"
+GLYPH_ATLAS_SIZE = int(os.getenv("GLYPH_ATLAS_SIZE", "4096"))
+
+# (font key, char, subpixel x, subpixel y) -> (mask, offset); (font key, char, next char) -> advance in 1/64 px
+_glyph_masks = TTLCache(maxsize=GLYPH_ATLAS_SIZE, ttl=math.inf)
+_glyph_advances = TTLCache(maxsize=GLYPH_ATLAS_SIZE * 4, ttl=math.inf)
+
+def _atlas_key(font) -> Optional[tuple]:
+    path = getattr(font, "path", None)
+    if not isinstance(path, str) or getattr(font, "layout_engine", None) != ImageFont.Layout.BASIC:
+        return None
+    return (path, font.index, font.size)
+
+def _glyph(font, key: tuple, char: str, fx: int, fy: int) -> tuple[Image.Image, tuple[int, int]]:
+    entry_key = (key, char, fx, fy)
+    entry = _glyph_masks.get(entry_key)
+    if entry is None:
+        mask, offset = font.getmask2(char, "L", start=(fx / 64, fy / 64))
+        entry = (Image.Image()._new(mask), offset)
+        _glyph_masks.set(entry_key, entry)
+    return entry
+
+def _advance(font, key: tuple, char: str, next_char: Optional[str]) -> int:
+    """Pen advance after char, including its kerning against next_char."""
+    entry_key = (key, char, next_char)
+    advance = _glyph_advances.get(entry_key)
+    if advance is None:
+        if next_char is None:
+            advance = round(font.getlength(char) * 64)
+        else:
+            advance = round(font.getlength(char + next_char) * 64) - round(font.getlength(next_char) * 64)
+        _glyph_advances.set(entry_key, advance)
+    return advance
+
+def draw_text(img: Image.Image, xy: tuple[float, float], text: str, fill: str, font):
+    """ImageDraw.text(xy, text, fill=fill, font=font), through the glyph atlas when it is enabled."""
+    key = _atlas_key(font) if GLYPH_ATLAS else None
+    if key is None or img.mode not in ("RGB", "L") or "\n" in text or xy[0] < 0 or xy[1] < 0:
+        ImageDraw.Draw(img).text(xy, text, fill=fill, font=font)
+        return
+
+    pen = round(math.modf(xy[0])[0] * 64)
+    fy = round(math.modf(xy[1])[0] * 64)
+    placed = []
+    for i, char in enumerate(text):
+        mask, (left, top) = _glyph(font, key, char, pen % 64, fy)
+        if mask.width and mask.height:
+            placed.append((mask, pen // 64 + left, top))
+        pen += _advance(font, key, char, text[i + 1] if i + 1 < len(text) else None)
+    if not placed:
+        return
+
+    # Glyphs with overlapping boxes are merged into one coverage mask so shared pixels are blended once,
+    # like draw.text does; every other glyph is filled through its own mask
+    color = ImageColor.getcolor(fill, img.mode)
+    origin = (int(xy[0]), int(xy[1]))
+    run = [placed[0]]
+    right = placed[0][1] + placed[0][0].width
+    for glyph in placed[1:]:
+        mask, x, _ = glyph
+        if x >= right:
+            _fill_glyphs(img, color, origin, run)
+            run = []
+        run.append(glyph)
+        right = max(right, x + mask.width)
+    _fill_glyphs(img, color, origin, run)
+
+def _fill_glyphs(img: Image.Image, color, origin: tuple[int, int], glyphs: list):
+    if len(glyphs) == 1:
+        coverage, x0, y0 = glyphs[0]
+    else:
+        x0 = min(x for _, x, _ in glyphs)
+        y0 = min(y for _, _, y in glyphs)
+        x1 = max(x + mask.width for mask, x, _ in glyphs)
+        y1 = max(y + mask.height for mask, _, y in glyphs)
+        coverage = Image.new("L", (x1 - x0, y1 - y0), 0)
+        for mask, x, y in glyphs:
+            coverage.paste(255, (x - x0, y - y0, x - x0 + mask.width, y - y0 + mask.height), mask)
+    left, top = origin[0] + x0, origin[1] + y0
+    img.paste(color, (left, top, left + coverage.width, top + coverage.height), coverage)
+
+def render_placeholder(img: Image.Image, font_bytes: bytes, text: str,
+                       bbox_x: int, bbox_y: int, bbox_width: int, bbox_height: int,
+                       text_color: str, initial_font_size: int = 120,
+                       is_qrcode: bool = False, qr_url: Optional[str] = None,
+                       qr_bg: str = "transparent",
+                       align: str = "center", font_path: Optional[str] = None,
+                       touched_rows: Optional[list] = None) -> Image.Image:
     """
-    Generates a single certificate in memory and returns its bytes.
-    Useful for live /preview endpoint. Handles dynamic fonts and QR Code matrices.
+    Stamps a single placeholder (text or QR Code matrix) onto an RGB image in place.
+    Dispatch calls this once per placeholder on the same canvas and encodes once at the end.
+    touched_rows, when given, receives the (top, bottom) pixel rows the placeholder may have changed.
     """
-    img = Image.open(io.BytesIO(template_bytes)).convert("RGB")
-    
     if is_qrcode and qr_url:
+        import qrcode
         qr = qrcode.QRCode(version=1, box_size=10, border=1)
         qr.add_data(qr_url)
         qr.make(fit=True)
@@ -71,10 +183,12 @@ def generate_preview(template_bytes: bytes, font_bytes: bytes, text: str,
         
         # Paste the QR matrix onto the main certificate canvas using itself as a transparency mask
         img.paste(qr_img, (top_left_x, top_left_y), mask=qr_img)
+        if touched_rows is not None:
+            touched_rows.append((top_left_y, top_left_y + bbox_height))
     else:
         # Standard TrueType text rendering logic
-        draw = ImageDraw.Draw(img)
-        font = get_font(font_bytes, text, bbox_width, bbox_height, initial_font_size)
+        with stage("font_fit"):
+            font = get_font(font_bytes, text, bbox_width, bbox_height, initial_font_size, font_path=font_path)
         bbox = font.getbbox(text)
         text_width = bbox[2] - bbox[0]
         text_height = bbox[3] - bbox[1]
@@ -94,8 +208,329 @@ def generate_preview(template_bytes: bytes, font_bytes: bytes, text: str,
         # Standard vertical centering
         adjusted_y = bbox_y - (text_height / 2)
         
-        draw.text((adjusted_x, adjusted_y), text, fill=text_color, font=font)
-    
+        draw_text(img, (adjusted_x, adjusted_y), text, text_color, font)
+        if touched_rows is not None:
+            if "\n" in text:
+                # draw.text lays CSV values with newlines out over several lines, below the first line's box
+                ink = ImageDraw.Draw(img).textbbox((adjusted_x, adjusted_y), text, font=font)
+                touched_rows.append((math.floor(ink[1]) - 1, math.ceil(ink[3]) + 1))
+            else:
+                # Ink box of the text, plus a row either side for the subpixel start offset
+                touched_rows.append((math.floor(adjusted_y) + bbox[1] - 1, math.ceil(adjusted_y) + bbox[3] + 1))
+    return img
+
+def encode_image(img: Image.Image, format: str = "PNG") -> bytes:
     output_stream = io.BytesIO()
     img.save(output_stream, format=format)
     return output_stream.getvalue()
+
+# --- Banded PNG encoding -----------------------------------------------------------------------
+# Certificates of a job differ from the template only in the rows their placeholders cover. The template
+# is split into bands of PNG_BAND_ROWS rows, each deflated once per job into its own IDAT chunk that ends
+# on a zlib full flush (byte-aligned, no back-references into the next band), so chunks can be reused in
+# any certificate's zlib stream. Per certificate only the touched bands are filtered and deflated again.
+# Rows use the Up filter, except the first row of every band (Sub), so no band depends on its neighbour.
+PNG_BAND_ENCODER = os.getenv("PNG_BAND_ENCODER", "true").lower() != "false"
+PNG_BAND_ROWS = int(os.getenv("PNG_BAND_ROWS", "32"))
+PNG_COMPRESS_LEVEL = 6  # Pillow's default
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+_ADLER_BASE = 65521
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(data, zlib.crc32(kind)))
+
+def _adler32_combine(adler1: int, adler2: int, length2: int) -> int:
+    """Adler-32 of A + B from adler32(A), adler32(B) and len(B) (zlib's adler32_combine)."""
+    rem = length2 % _ADLER_BASE
+    sum1 = adler1 & 0xFFFF
+    sum2 = (rem * sum1) % _ADLER_BASE
+    sum1 += (adler2 & 0xFFFF) + _ADLER_BASE - 1
+    sum2 += (adler1 >> 16) + (adler2 >> 16) + _ADLER_BASE - rem
+    return (sum1 % _ADLER_BASE) | ((sum2 % _ADLER_BASE) << 16)
+
+class BandedPngEncoder:
+    """PNG encoder for the certificates of one job; only re-encodes the bands a certificate changed."""
+
+    def __init__(self, template: Image.Image, band_rows: int = PNG_BAND_ROWS):
+        self.size = template.size
+        self.band_rows = band_rows
+        width, height = template.size
+        ihdr = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)  # 8-bit RGB, no interlace
+        # zlib header on its own; the stream is continued by the band chunks
+        self._head = _PNG_SIGNATURE + _png_chunk(b"IHDR", ihdr) + _png_chunk(b"IDAT", b"\x78\x9c")
+        self._tail = _png_chunk(b"IEND", b"")
+        template = template.convert("RGB") if template.mode != "RGB" else template
+        self._bands = [self._encode_band(template, top) for top in range(0, height, band_rows)]
+
+    def _encode_band(self, img: Image.Image, top: int) -> tuple[bytes, int, int]:
+        """(IDAT chunk, adler32 of the filtered rows, their length) of the band starting at row top."""
+        width = self.size[0]
+        rows = min(self.band_rows, self.size[1] - top)
+        band = img.crop((0, top, width, top + rows))
+        # Up: each row minus the row above it. The band's first row is Sub-filtered instead (minus the pixel
+        # to its left), so it doesn't depend on the previous band.
+        filtered = ImageChops.subtract_modulo(band, band.crop((0, -1, width, rows - 1))).tobytes()
+        first = band.crop((0, 0, width, 1))
+        stride = width * 3
+        raw = b"".join([
+            b"\x01", ImageChops.subtract_modulo(first, first.crop((-1, 0, width - 1, 1))).tobytes(),
+            *(b"\x02" + filtered[row * stride:(row + 1) * stride] for row in range(1, rows)),
+        ])
+        compressor = zlib.compressobj(PNG_COMPRESS_LEVEL, zlib.DEFLATED, -15)
+        data = compressor.compress(raw) + compressor.flush(zlib.Z_FULL_FLUSH)
+        return _png_chunk(b"IDAT", data), zlib.adler32(raw), len(raw)
+
+    def encode(self, img: Image.Image, touched_rows: list[tuple[int, int]]) -> bytes:
+        """PNG bytes of img, which must equal the template outside touched_rows (see render_placeholder)."""
+        if img.size != self.size or img.mode != "RGB":
+            return encode_image(img, format="PNG")
+        height = self.size[1]
+        dirty = set()
+        for top, bottom in touched_rows:
+            top, bottom = max(0, top), min(height, bottom)
+            if bottom > top:
+                dirty.update(range(top // self.band_rows, (bottom - 1) // self.band_rows + 1))
+
+        parts = [self._head]
+        adler = 1
+        for index, band in enumerate(self._bands):
+            chunk, band_adler, length = self._encode_band(img, index * self.band_rows) if index in dirty else band
+            parts.append(chunk)
+            adler = _adler32_combine(adler, band_adler, length)
+        # Final empty deflate block and the stream's checksum
+        parts.append(_png_chunk(b"IDAT", b"\x03\x00" + struct.pack(">I", adler)))
+        parts.append(self._tail)
+        return b"".join(parts)
+
+def generate_preview(template_bytes: bytes, font_bytes: bytes, text: str, 
+                     bbox_x: int, bbox_y: int, bbox_width: int, bbox_height: int,
+                     text_color: str, initial_font_size: int = 120, format: str = "PNG",
+                     is_qrcode: bool = False, qr_url: Optional[str] = None,
+                     qr_bg: str = "transparent",
+                     align: str = "center", font_path: Optional[str] = None) -> bytes:
+    """
+    Generates a single certificate in memory and returns its bytes.
+    Useful for live /preview endpoint. Handles dynamic fonts and QR Code matrices.
+    """
+    img = Image.open(io.BytesIO(template_bytes)).convert("RGB")
+    render_placeholder(
+        img, font_bytes, text, bbox_x, bbox_y, bbox_width, bbox_height, text_color,
+        initial_font_size=initial_font_size, is_qrcode=is_qrcode, qr_url=qr_url,
+        qr_bg=qr_bg, align=align, font_path=font_path
+    )
+    return encode_image(img, format=format)
+
+# --- Vector PDF output -------------------------------------------------------------------------
+# Template pixels are mapped to PDF points at PDF_DPI (A4 at 300dpi -> 595x842pt). The template is
+# JPEG-encoded once per job and embedded as one form XObject per document; placeholders are drawn as
+# real text in the project font (subset-embedded) and QR codes as vector modules.
+PDF_DPI = int(os.getenv("PDF_DPI", "300"))
+PDF_TEMPLATE_QUALITY = int(os.getenv("PDF_TEMPLATE_QUALITY", "90"))
+
+# Name of the form XObject holding the template in every document
+_PDF_TEMPLATE_FORM = "template"
+
+_pdf_font_names: dict[str, Optional[str]] = {}
+
+def _pdf_font_name(font) -> Optional[str]:
+    """Registers the Pillow font's file with reportlab once; None if it can't be embedded (e.g. CFF .otf)."""
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+
+    path = getattr(font, "path", None)
+    if not isinstance(path, str):
+        return None
+    if path not in _pdf_font_names:
+        name = "F" + hashlib.sha1(path.encode()).hexdigest()[:12]
+        try:
+            pdfmetrics.registerFont(TTFont(name, path))
+            _pdf_font_names[path] = name
+        except Exception:
+            _pdf_font_names[path] = None
+    return _pdf_font_names[path]
+
+def _pdf_rgb(color: str) -> tuple[float, float, float]:
+    r, g, b = ImageColor.getrgb(color)[:3]
+    return r / 255, g / 255, b / 255
+
+class CertificatePdf:
+    """
+    Renders certificates of one job as vector PDFs, either one file per certificate (render)
+    or as pages of a single combined document (add_page + finish).
+    """
+
+    def __init__(self, template: Image.Image, dpi: int = PDF_DPI):
+        self.width_px, self.height_px = template.size
+        self.scale = 72.0 / dpi
+        self.page_size = (self.width_px * self.scale, self.height_px * self.scale)
+
+        # Encoded once per job into a temp file: reportlab embeds a JPEG file's data as-is, while an in-memory
+        # ImageReader is decoded and hashed again for every document
+        fd, self._template_path = tempfile.mkstemp(prefix="credify-template-", suffix=".jpg")
+        with os.fdopen(fd, "wb") as f:
+            template.convert("RGB").save(f, format="JPEG", quality=PDF_TEMPLATE_QUALITY, optimize=True)
+        weakref.finalize(self, os.remove, self._template_path)
+        self._combined = None
+        self._combined_stream = None
+
+    def _new_canvas(self, stream):
+        from reportlab import rl_config
+        from reportlab.pdfgen import canvas
+
+        # Binary streams: ASCII85 only makes the file 25% bigger, and without reportlab's C accelerator
+        # encoding the template JPEG for every document was most of a certificate's render time
+        rl_config.useA85 = 0
+        pdf = canvas.Canvas(stream, pagesize=self.page_size, pageCompression=1)
+        # The template is drawn into a form XObject once per document and every page only references it
+        pdf.beginForm(_PDF_TEMPLATE_FORM)
+        pdf.drawImage(self._template_path, 0, 0, *self.page_size)
+        pdf.endForm()
+        return pdf
+
+    def _draw_page(self, pdf, placeholders: list[dict]):
+        # Every placeholder is laid out before the page is touched, so a row that fails (bad colour, missing
+        # font) leaves nothing behind on a combined document's next page
+        drawers = [self._placeholder_drawer(**ph) for ph in placeholders]
+        pdf.doForm(_PDF_TEMPLATE_FORM)
+        for draw in drawers:
+            draw(pdf)
+        pdf.showPage()
+
+    def render(self, placeholders: list[dict]) -> bytes:
+        """Single-page PDF for one certificate. placeholders are render_placeholder keyword arguments."""
+        stream = io.BytesIO()
+        pdf = self._new_canvas(stream)
+        self._draw_page(pdf, placeholders)
+        pdf.save()
+        return stream.getvalue()
+
+    def add_page(self, placeholders: list[dict]):
+        if self._combined is None:
+            self._combined_stream = io.BytesIO()
+            self._combined = self._new_canvas(self._combined_stream)
+        self._draw_page(self._combined, placeholders)
+        self._deflate_last_page(self._combined)
+
+    @staticmethod
+    def _deflate_last_page(pdf):
+        """
+        reportlab keeps every page's operators as text until save() and compresses them then; a combined
+        document's pages are deflated as they are added instead, so the job holds about the finished file.
+        """
+        from reportlab.pdfbase.pdfdoc import PDFStream, PDFArray, PDFName
+
+        page = pdf._doc.Pages.pages[-1]
+        content = page.stream.encode("utf8") if isinstance(page.stream, str) else page.stream
+        stream = PDFStream(content=zlib.compress(content))
+        # A stream that already names its filter is written as is
+        stream.dictionary["Filter"] = PDFArray([PDFName("FlateDecode")])
+        stream.__Comment__ = "page stream"
+        page.Contents = stream
+        page.stream = None
+
+    def finish(self) -> Optional[bytes]:
+        """Bytes of the combined multi-page document, or None if no page was added."""
+        if self._combined is None:
+            return None
+        self._combined.save()
+        data = self._combined_stream.getvalue()
+        self._combined = self._combined_stream = None
+        return data
+
+    def _placeholder_drawer(self, font_bytes: bytes, text: str,
+                            bbox_x: int, bbox_y: int, bbox_width: int, bbox_height: int,
+                            text_color: str, initial_font_size: int = 120,
+                            is_qrcode: bool = False, qr_url: Optional[str] = None,
+                            qr_bg: str = "transparent",
+                            align: str = "center", font_path: Optional[str] = None) -> Callable:
+        """Lays out one placeholder and returns a function drawing it onto a canvas page."""
+        s = self.scale
+        page_height = self.page_size[1]
+
+        if is_qrcode and qr_url:
+            import qrcode
+            qr = qrcode.QRCode(version=1, box_size=10, border=1)
+            qr.add_data(qr_url)
+            qr.make(fit=True)
+            matrix = qr.get_matrix()
+            modules = len(matrix)
+
+            # Same centre-anchored box as the raster path
+            left = bbox_x - (bbox_width / 2)
+            top = bbox_y - (bbox_height / 2)
+            module_w = bbox_width / modules
+            module_h = bbox_height / modules
+
+            background = None
+            if qr_bg.lower() != "transparent":
+                background = (_pdf_rgb(qr_bg), (left * s, page_height - (top + bbox_height) * s, bbox_width * s, bbox_height * s))
+            fill = _pdf_rgb(text_color)
+            rects = []
+            for r, row in enumerate(matrix):
+                c = 0
+                while c < modules:
+                    if not row[c]:
+                        c += 1
+                        continue
+                    # One rectangle per horizontal run of dark modules
+                    start = c
+                    while c < modules and row[c]:
+                        c += 1
+                    rects.append((
+                        (left + start * module_w) * s,
+                        page_height - (top + (r + 1) * module_h) * s,
+                        (c - start) * module_w * s,
+                        module_h * s,
+                    ))
+
+            def draw_qr(pdf):
+                if background:
+                    pdf.setFillColorRGB(*background[0])
+                    pdf.rect(*background[1], stroke=0, fill=1)
+                pdf.setFillColorRGB(*fill)
+                for rect in rects:
+                    pdf.rect(*rect, stroke=0, fill=1)
+            return draw_qr
+
+        with stage("font_fit"):
+            font = get_font(font_bytes, text, bbox_width, bbox_height, initial_font_size, font_path=font_path)
+        bbox = font.getbbox(text)
+        text_width = bbox[2] - bbox[0]
+        text_height = bbox[3] - bbox[1]
+
+        if align == "left":
+            adjusted_x = bbox_x - (bbox_width / 2)
+        elif align == "right":
+            adjusted_x = (bbox_x + (bbox_width / 2)) - text_width
+        else: # center
+            adjusted_x = bbox_x - (text_width / 2)
+        adjusted_y = bbox_y - (text_height / 2)
+
+        font_name = _pdf_font_name(font)
+        if font_name:
+            # Pillow anchors text at the ascender line; PDF text is positioned on the baseline
+            ascent, _ = font.getmetrics()
+            fill = _pdf_rgb(text_color)
+
+            def draw_string(pdf):
+                pdf.setFillColorRGB(*fill)
+                pdf.setFont(font_name, font.size * s)
+                pdf.drawString(adjusted_x * s, page_height - (adjusted_y + ascent) * s, text)
+            return draw_string
+
+        # Font can't be embedded — fall back to a transparent raster patch of just this text
+        patch = Image.new("RGBA", (max(1, text_width), max(1, text_height)), (0, 0, 0, 0))
+        ImageDraw.Draw(patch).text((-bbox[0], -bbox[1]), text, fill=text_color, font=font)
+        from reportlab.lib.utils import ImageReader
+        reader = ImageReader(patch)
+
+        def draw_patch(pdf):
+            pdf.drawImage(
+                reader,
+                (adjusted_x + bbox[0]) * s,
+                page_height - (adjusted_y + bbox[3]) * s,
+                text_width * s, text_height * s,
+                mask="auto"
+            )
+        return draw_patch
@@ -0,0 +1,124 @@
+"""
+Incrementally maintained dashboard counters (the user_stats table).
+
+Writers call bump_user_stats() inside their own transaction; the KPI endpoint then reads a single row.
+Counters can drift if rows are edited by hand, so they can be reconciled from the source tables with:
+
+    python stats.py rebuild            # every owner
+    python stats.py rebuild <user_id>  # a single owner
+"""
+import sys
+import asyncio
+from typing import Optional
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from models import User, Project, DispatchJob, Certificate, UserStats
+
+
+async def compute_user_stats(db: AsyncSession, owner_id: int) -> dict:
+    """Recompute one owner's counters from the source tables (the original aggregate queries)."""
+    total_certificates = (await db.execute(
+        select(func.sum(DispatchJob.total_certificates))
+        .join(Project)
+        .where(Project.owner_id == owner_id)
+    )).scalar() or 0
+
+    total_projects = (await db.execute(
+        select(func.count(Project.id)).where(Project.owner_id == owner_id)
+    )).scalar() or 0
+
+    total_opened = (await db.execute(
+        select(func.count(Certificate.id))
+        .join(Project)
+        .where(Project.owner_id == owner_id)
+        .where(Certificate.status == "Opened")
+    )).scalar() or 0
+
+    return {
+        "total_certificates": total_certificates,
+        "total_projects": total_projects,
+        "total_opened": total_opened,
+    }
+
+
+async def get_user_stats(db: AsyncSession, owner_id: int) -> UserStats:
+    """Primary-key read of an owner's counters, seeding the row from the source tables if it is missing."""
+    stats = await db.get(UserStats, owner_id)
+    if stats is None:
+        stats = UserStats(owner_id=owner_id, **(await compute_user_stats(db, owner_id)))
+        try:
+            async with db.begin_nested():
+                db.add(stats)
+            await db.commit()
+        except IntegrityError:
+            # Another request seeded it first
+            stats = await db.get(UserStats, owner_id, populate_existing=True)
+    return stats
+
+
+async def bump_user_stats(db: AsyncSession, owner_id: int, **deltas: int):
+    """
+    Atomically add deltas (e.g. total_opened=1) to an owner's counters.
+    Does not commit — the caller's commit makes the counter change visible together with the source row.
+    """
+    if owner_id is None or not deltas:
+        return
+    values = {name: getattr(UserStats, name) + delta for name, delta in deltas.items()}
+    stmt = update(UserStats).where(UserStats.owner_id == owner_id).values(**values)
+    result = await db.execute(stmt)
+    if result.rowcount:
+        return
+
+    # No counters yet (account predates the table) — seed them from the source tables,
+    # which already include the caller's pending change once it is flushed.
+    await db.flush()
+    seeded = await compute_user_stats(db, owner_id)
+    try:
+        async with db.begin_nested():
+            db.add(UserStats(owner_id=owner_id, **seeded))
+    except IntegrityError:
+        # Lost a race with a concurrent seed that could not see our change — apply the delta on top
+        await db.execute(stmt)
+
+
+async def rebuild_user_stats(db: AsyncSession, owner_id: Optional[int] = None) -> int:
+    """Reconcile user_stats with the source tables. Returns the number of owners rebuilt."""
+    if owner_id is None:
+        owner_ids = (await db.execute(select(User.id))).scalars().all()
+    else:
+        owner_ids = [owner_id]
+
+    for oid in owner_ids:
+        computed = await compute_user_stats(db, oid)
+        stats = await db.get(UserStats, oid)
+        if stats is None:
+            db.add(UserStats(owner_id=oid, **computed))
+        else:
+            for name, value in computed.items():
+                setattr(stats, name, value)
+    await db.commit()
+    return len(owner_ids)
+
+
+async def _main(argv: list[str]):
+    from database import engine, create_schema, AsyncSessionLocal
+
+    if not argv or argv[0] != "rebuild":
+        print(__doc__)
+        return 1
+    owner_id = int(argv[1]) if len(argv) > 1 else None
+
+    async with engine.begin() as conn:
+        await conn.run_sync(create_schema)
+    async with AsyncSessionLocal() as db:
+        count = await rebuild_user_stats(db, owner_id)
+    await engine.dispose()
+    print(f"Rebuilt dashboard statistics for {count} user(s).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
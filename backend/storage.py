@@ -1,7 +1,18 @@
+"""
+Object storage for uploaded assets and rendered certificates.
+
+Objects are stored under "<folder>/<uuid>.<ext>" keys and never overwritten. Supabase Storage is used when
+SUPABASE_URL/SUPABASE_KEY are set; otherwise files go to the local backend, served from BACKEND_URL/static
+by StorageStaticFiles (suitable for development and single-box deployments).
+"""
 import os
 import uuid
-import aiohttp
+import asyncio
+import tempfile
+from typing import Optional, TYPE_CHECKING
 from fastapi import UploadFile
+from fastapi.staticfiles import StaticFiles
+from starlette.responses import FileResponse, Response
 from dotenv import load_dotenv
 
 # Explicitly load credentials from the root Credify directory's .env file, mapping overrides dynamically on hot-reloads
@@ -11,67 +22,203 @@ SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 SUPABASE_BUCKET_NAME = os.getenv("SUPABASE_BUCKET_NAME", "credify-assets")
 
+LOCAL_STORAGE_DIR = os.getenv("LOCAL_STORAGE_DIR", os.path.join(os.getcwd(), "local_storage"))
+# Internal nginx location aliased to LOCAL_STORAGE_DIR (e.g. "/_storage/"). When set, /static answers with an
+# X-Accel-Redirect and nginx sends the file itself
+LOCAL_STORAGE_ACCEL_REDIRECT = os.getenv("LOCAL_STORAGE_ACCEL_REDIRECT", "")
+# Stored objects never change, so clients and CDNs may keep them indefinitely
+STATIC_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+if TYPE_CHECKING:
+    import aiohttp
+
+def atomic_write_file(path: str, data: bytes):
+    """Write a file via a temp file + rename so concurrent readers never see a partial file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _backend_url() -> str:
+    return os.getenv("BACKEND_URL", "http://localhost:8000").rstrip("/")
+
+def _content_type(ext: str, fallback: Optional[str]) -> str:
+    # Explicit MIME types: browsers omit or misreport some, and Supabase rejects those with a 415
+    ext = ext.lower()
+    if ext == 'ttf':
+        return 'font/ttf'
+    if ext == 'otf':
+        return 'font/otf'
+    if ext in ('png', 'jpeg', 'jpg', 'webp'):
+        return f'image/{ext}'
+    if ext == 'svg':
+        return 'image/svg+xml'
+    if ext == 'pdf':
+        return 'application/pdf'
+    return fallback or 'application/octet-stream'
+
+# --- Backends ---------------------------------------------------------------------------------------
+
+class StorageBackend:
+    async def put(self, key: str, data: bytes, content_type: str) -> str:
+        """Stores data under key ("<folder>/<uuid>.<ext>") and returns its public URL."""
+        raise NotImplementedError
+
+
+class LocalStorage(StorageBackend):
+    """
+    Files under root, written from a worker thread (temp file + rename). "<folder>/<id>.<ext>" is stored as
+    "<folder>/<id[:2]>/<id>.<ext>", spreading a folder over 256 directories.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    @staticmethod
+    def shard(key: str) -> str:
+        folder, name = key.rsplit("/", 1) if "/" in key else ("", key)
+        return "/".join(part for part in (folder, name[:2], name) if part)
+
+    async def put(self, key: str, data: bytes, content_type: str) -> str:
+        relative = self.shard(key)
+        await asyncio.to_thread(atomic_write_file, os.path.join(self.root, *relative.split("/")), data)
+        return f"{_backend_url()}/static/{relative}"
+
+
+class SupabaseStorage(StorageBackend):
+    """Supabase Storage REST API; objects are served from the bucket's public URL."""
+
+    def __init__(self, url: str, key: str, bucket: str):
+        self.base_url = url.rstrip("/")
+        self.key = key
+        self.bucket = bucket
+
+    async def put(self, key: str, data: bytes, content_type: str) -> str:
+        upload_url = f"{self.base_url}/storage/v1/object/{self.bucket}/{key}"
+        headers = {
+            "Authorization": f"Bearer {self.key}",
+            "apikey": self.key,
+            "Content-Type": content_type
+        }
+        try:
+            import aiohttp
+            async with aiohttp.ClientSession() as session:
+                async with session.post(upload_url, headers=headers, data=data) as response:
+                    if response.status not in (200, 201):
+                        error_msg = await response.text()
+                        raise Exception(f"Supabase error {response.status}: {error_msg}")
+        except Exception as e:
+            raise Exception(f"Supabase Storage Upload Failed: {str(e)}")
+        return f"{self.base_url}/storage/v1/object/public/{self.bucket}/{key}"
+
+
+local_storage = LocalStorage(LOCAL_STORAGE_DIR)
+
+def get_storage() -> StorageBackend:
+    """The configured backend (read per call: load tests repoint the Supabase settings after import)."""
+    if SUPABASE_URL and SUPABASE_KEY:
+        return SupabaseStorage(SUPABASE_URL, SUPABASE_KEY, SUPABASE_BUCKET_NAME)
+    return local_storage
+
+# --- Reads ------------------------------------------------------------------------------------------
+
+def local_path_for_url(url: str) -> Optional[str]:
+    """Filesystem path behind a URL produced by the local backend, or None for remote URLs."""
+    prefix = f"{_backend_url()}/static/"
+    if not url or not url.startswith(prefix):
+        return None
+    relative = url[len(prefix):]
+    root = os.path.realpath(local_storage.root)
+    path = os.path.realpath(os.path.join(root, relative))
+    # Never resolve outside the local storage root
+    if not path.startswith(root + os.sep):
+        return None
+    return path
+
+def is_stored_url(url: str) -> bool:
+    """Whether url points into the configured storage backend, i.e. could have come from upload_file_to_s3."""
+    if local_path_for_url(url):
+        return True
+    if not (SUPABASE_URL and SUPABASE_KEY) or not url:
+        return False
+    prefix = f"{SUPABASE_URL.rstrip('/')}/storage/v1/object/public/{SUPABASE_BUCKET_NAME}/"
+    return url.startswith(prefix) and ".." not in url[len(prefix):]
+
+async def fetch_stored_file(url: str, session: Optional["aiohttp.ClientSession"] = None) -> bytes:
+    """Bytes of a file previously returned by upload_file_to_s3 (read from disk when stored locally)."""
+    local_path = local_path_for_url(url)
+    if local_path:
+        def _read():
+            with open(local_path, "rb") as f:
+                return f.read()
+        return await asyncio.to_thread(_read)
+
+    if session is None:
+        import aiohttp
+        async with aiohttp.ClientSession() as own_session:
+            return await fetch_stored_file(url, own_session)
+    async with session.get(url) as response:
+        if response.status != 200:
+            raise Exception(f"Failed to fetch {url}: HTTP {response.status}")
+        return await response.read()
+
 async def upload_file_to_s3(file: UploadFile, folder: str = "uploads") -> str:
     """
-    Uploads a file to Supabase Storage via REST APIs and returns the public URL.
+    Stores an uploaded file in the configured backend (Supabase, or local storage when it isn't
+    configured) and returns the public URL.
     The function retains 's3' in its name to prevent breaking upstream dependencies.
-    If Supabase is not configured in .env, it simulates a local upload for development.
     """
     file_extension = file.filename.split(".")[-1]
-    unique_filename = f"{folder}/{uuid.uuid4()}.{file_extension}"
-    
-    if not SUPABASE_URL or not SUPABASE_KEY:
-        # Development mode fallback: save locally if Supabase not configured
-        local_dir = os.path.join(os.getcwd(), "local_storage", folder)
-        os.makedirs(local_dir, exist_ok=True)
-        local_path = os.path.join(local_dir, unique_filename.split("/")[-1])
-        
-        contents = await file.read()
-        with open(local_path, "wb") as f:
-            f.write(contents)
-        await file.seek(0)
-        backend_url = os.getenv("BACKEND_URL", "http://localhost:8000").rstrip("/")
-        return f"{backend_url}/static/{folder}/{unique_filename.split('/')[-1]}"
-    
-    try:
-        contents = await file.read()
-        
-        # Build Supabase REST URL
-        # URL format: {SUPABASE_URL}/storage/v1/object/{bucket}/{filename}
-        base_url = SUPABASE_URL.rstrip("/")
-        upload_url = f"{base_url}/storage/v1/object/{SUPABASE_BUCKET_NAME}/{unique_filename}"
-        
-        # Dynamically map correct MIME types to bypass browser omissions causing Supabase 415 Rejections
-        ext = file_extension.lower()
-        if ext == 'ttf':
-            mime_type = 'font/ttf'
-        elif ext == 'otf':
-            mime_type = 'font/otf'
-        elif ext in ('png', 'jpeg', 'jpg', 'webp'):
-            mime_type = f'image/{ext}'
-        elif ext == 'svg':
-            mime_type = 'image/svg+xml'
+    key = f"{folder}/{uuid.uuid4()}.{file_extension}"
+    contents = await file.read()
+    url = await get_storage().put(key, contents, _content_type(file_extension, file.content_type))
+    # Ensure we can read the file again if needed downstream
+    await file.seek(0)
+    return url
+
+# --- Serving ----------------------------------------------------------------------------------------
+
+class _PathsendFileResponse(FileResponse):
+    """Hands the file path to the ASGI server (http.response.pathsend), which can sendfile(2) it."""
+
+    async def _handle_simple(self, send, send_header_only: bool) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
         else:
-            mime_type = file.content_type or 'application/octet-stream'
+            await send({"type": "http.response.pathsend", "path": str(self.path)})
 
-        headers = {
-            "Authorization": f"Bearer {SUPABASE_KEY}",
-            "apikey": SUPABASE_KEY,
-            "Content-Type": mime_type
-        }
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.post(upload_url, headers=headers, data=contents) as response:
-                if response.status not in (200, 201):
-                    error_msg = await response.text()
-                    raise Exception(f"Supabase error {response.status}: {error_msg}")
-        
-        # Ensure we can read the file again if needed downstream
-        await file.seek(0)
-        
-        # Construct the public URL
-        public_url = f"{base_url}/storage/v1/object/public/{SUPABASE_BUCKET_NAME}/{unique_filename}"
-        return public_url
-        
-    except Exception as e:
-        raise Exception(f"Supabase Storage Upload Failed: {str(e)}")
+
+class StorageStaticFiles(StaticFiles):
+    """
+    /static for the local backend. Adds an immutable Cache-Control to Starlette's ETag/Last-Modified
+    handling (a matching If-None-Match gets a 304), and leaves copying the body to whoever can sendfile it:
+    nginx with LOCAL_STORAGE_ACCEL_REDIRECT set, else ASGI servers supporting http.response.pathsend.
+    Otherwise the file is streamed from a worker thread in 1 MiB reads.
+    """
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if isinstance(response, FileResponse):
+            if LOCAL_STORAGE_ACCEL_REDIRECT:
+                relative = os.path.relpath(full_path, self.directory).replace(os.sep, "/")
+                headers = {k: v for k, v in response.headers.items() if k != "content-length"}
+                headers["X-Accel-Redirect"] = LOCAL_STORAGE_ACCEL_REDIRECT.rstrip("/") + "/" + relative
+                response = Response(status_code=status_code, headers=headers)
+            elif "http.response.pathsend" in scope.get("extensions", {}):
+                response = _PathsendFileResponse(full_path, status_code=status_code, stat_result=stat_result)
+            else:
+                response.chunk_size = 1024 * 1024
+        response.headers["Cache-Control"] = STATIC_CACHE_CONTROL
+        return response
+
+
+def static_files() -> StorageStaticFiles:
+    os.makedirs(local_storage.root, exist_ok=True)
+    return StorageStaticFiles(directory=local_storage.root)
@@ -0,0 +1,168 @@
+"""
+Template ingestion pipeline.
+
+Uploaded templates are decoded once, normalized to RGB (which also drops EXIF/ICC/text metadata and
+alpha) and written as a raw, headerless raster to TEMPLATE_STORE_DIR/<sha256>_<w>x<h>.rgb, next to the
+original upload in storage. The raster key and dimensions are recorded on Project, and render workers
+map the file with Image.frombuffer, so each job starts from the base image with no PNG/JPEG decode.
+
+Each template is also stored as a small pyramid of downscaled levels (1/2, 1/4) so the editor's /preview
+can render at roughly the size it is displayed, while dispatch keeps using the full-resolution level.
+"""
+import io
+import os
+import math
+import mmap
+import asyncio
+import hashlib
+from typing import Optional, TYPE_CHECKING
+
+from cache import TTLCache
+from storage import atomic_write_file, local_path_for_url, fetch_stored_file
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+TEMPLATE_STORE_DIR = os.getenv("TEMPLATE_STORE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "template_store"))
+
+# Downscale factors stored per template; factor 1 is the full-resolution raster used by dispatch
+PYRAMID_FACTORS = (1, 2, 4)
+
+# Template URLs are immutable (uuid file names), so URL -> raster key aliases never need invalidating; the
+# in-memory copy is bounded, older entries are read back from the alias files on disk
+URL_ALIAS_CACHE_SIZE = int(os.getenv("TEMPLATE_URL_ALIAS_CACHE_SIZE", "10000"))
+_url_aliases = TTLCache(maxsize=URL_ALIAS_CACHE_SIZE, ttl=math.inf)
+
+
+def _raster_path(key: str) -> str:
+    return os.path.join(TEMPLATE_STORE_DIR, f"{key}.rgb")
+
+
+def _alias_path(url: str) -> str:
+    return os.path.join(TEMPLATE_STORE_DIR, "urls", hashlib.sha256(url.encode()).hexdigest())
+
+
+def parse_raster_key(key: str) -> tuple[int, int]:
+    """(width, height) encoded in a raster key."""
+    width, height = key.rsplit("_", 1)[1].split("x")
+    return int(width), int(height)
+
+
+def level_key(key: str, factor: int) -> str:
+    """Raster key of a pyramid level (Image.reduce rounds dimensions up)."""
+    digest = key.rsplit("_", 1)[0]
+    width, height = parse_raster_key(key)
+    return f"{digest}_{-(-width // factor)}x{-(-height // factor)}"
+
+
+def select_level(key: str, display_width: Optional[int]) -> tuple[str, float]:
+    """
+    Smallest stored pyramid level that is still at least display_width wide.
+    Returns (level key, scale relative to the full-resolution template).
+    """
+    full_width, _ = parse_raster_key(key)
+    if not display_width:
+        return key, 1.0
+    for factor in sorted(PYRAMID_FACTORS, reverse=True):
+        candidate = level_key(key, factor)
+        width, _ = parse_raster_key(candidate)
+        if width >= display_width and os.path.exists(_raster_path(candidate)):
+            return candidate, width / full_width
+    return key, 1.0
+
+
+def ingest_template(image_bytes: bytes, url: Optional[str] = None) -> dict:
+    """
+    Decode and normalize a template image and store its raw RGB raster pyramid.
+    Returns {"key", "width", "height"} of the full-resolution level. Raises if the bytes are not a decodable image.
+    """
+    from PIL import Image
+    img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    width, height = img.size
+    key = f"{hashlib.sha256(image_bytes).hexdigest()}_{width}x{height}"
+
+    for factor in PYRAMID_FACTORS:
+        path = _raster_path(level_key(key, factor))
+        if not os.path.exists(path):
+            level = img if factor == 1 else img.reduce(factor)
+            atomic_write_file(path, level.tobytes())
+    if url:
+        record_template_url(url, key)
+    return {"key": key, "width": width, "height": height}
+
+
+def record_template_url(url: str, key: str):
+    """Remember which raster an uploaded template URL was ingested as (see lookup_raster_key)."""
+    atomic_write_file(_alias_path(url), key.encode())
+    _url_aliases.set(url, key)
+
+
+def lookup_raster_key(url: str) -> Optional[str]:
+    """Raster key of an already-ingested template URL, or None."""
+    key = _url_aliases.get(url)
+    if key is None:
+        try:
+            with open(_alias_path(url), "rb") as f:
+                key = f.read().decode().strip()
+        except OSError:
+            return None
+        _url_aliases.set(url, key)
+    return key if os.path.exists(_raster_path(key)) else None
+
+
+def open_template_raster(key: str) -> Optional["Image.Image"]:
+    """
+    Read-only RGB image backed by an mmap of the stored raster, or None if it isn't on this machine.
+    Callers must .copy() it before drawing.
+    """
+    width, height = parse_raster_key(key)
+    try:
+        with open(_raster_path(key), "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    if len(mapped) != width * height * 3:
+        mapped.close()
+        return None
+    from PIL import Image
+    return Image.frombuffer("RGB", (width, height), mapped, "raw", "RGB", 0, 1)
+
+
+async def _download(url: str) -> bytes:
+    # Templates kept by the local storage backend are read from disk rather than fetched over HTTP
+    if local_path_for_url(url):
+        return await fetch_stored_file(url)
+    import aiohttp
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url) as resp:
+            if resp.status != 200:
+                raise Exception(f"Template download failed with status {resp.status}: {url}")
+            return await resp.read()
+
+
+async def decode_template(template_url: str) -> "Image.Image":
+    """Downloads and decodes a template for a one-off render, without writing anything to the store."""
+    image_bytes = await _download(template_url)
+
+    def _decode():
+        from PIL import Image
+        return Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    return await asyncio.to_thread(_decode)
+
+
+async def ensure_template_raster(template_url: str, key: Optional[str] = None) -> dict:
+    """
+    Make sure the raster for a template exists locally, downloading and ingesting the original if needed
+    (e.g. projects created before ingestion existed, or another machine's local store).
+    """
+    if key and os.path.exists(_raster_path(key)):
+        width, height = parse_raster_key(key)
+        return {"key": key, "width": width, "height": height}
+
+    key = lookup_raster_key(template_url)
+    if key:
+        width, height = parse_raster_key(key)
+        return {"key": key, "width": width, "height": height}
+
+    image_bytes = await _download(template_url)
+    return await asyncio.to_thread(ingest_template, image_bytes, template_url)
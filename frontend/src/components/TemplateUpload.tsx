@@ -19,6 +19,8 @@ export default function TemplateUpload({ onUpload }: TemplateUploadProps) {
                 const token = localStorage.getItem("token") || "mock_token";
                 const formData = new FormData();
                 formData.append("file", file);
+                // Lets the backend pre-decode the template into a raster for rendering
+                formData.append("kind", "template");
 
                 const res = await axios.post(`${API_BASE_URL}/api/projects/upload`, formData, {
                     headers: {
@@ -15,6 +15,9 @@ export default function Dashboard() {
     const [initialMappingData, setInitialMappingData] = useState<any[] | null>(null);
     const [kpiData, setKpiData] = useState<any>(null);
     const [jobsList, setJobsList] = useState<any[]>([]);
+    // Job history is paginated: X-Next-Cursor is set while older jobs remain
+    const [jobsCursor, setJobsCursor] = useState<string | null>(null);
+    const [isLoadingJobs, setIsLoadingJobs] = useState(false);
 
     useEffect(() => {
         const fetchProjects = async () => {
@@ -29,6 +32,7 @@ export default function Dashboard() {
                 setProjectsList(projRes.data);
                 setKpiData(kpiRes.data);
                 setJobsList(jobsRes.data);
+                setJobsCursor(jobsRes.headers["x-next-cursor"] ?? null);
             } catch (err) {
                 console.error("Failed to fetch projects list", err);
             }
@@ -36,6 +40,24 @@ export default function Dashboard() {
         fetchProjects();
     }, []);
 
+    const loadMoreJobs = async () => {
+        if (!jobsCursor) return;
+        setIsLoadingJobs(true);
+        try {
+            const token = localStorage.getItem("token") || "mock_token";
+            const res = await axios.get(`${API_BASE_URL}/api/projects/jobs`, {
+                params: { cursor: jobsCursor },
+                headers: { Authorization: `Bearer ${token}` }
+            });
+            setJobsList(prev => [...prev, ...res.data]);
+            setJobsCursor(res.headers["x-next-cursor"] ?? null);
+        } catch (err) {
+            console.error("Failed to fetch dispatch history", err);
+        } finally {
+            setIsLoadingJobs(false);
+        }
+    };
+
     const handleUploadComplete = async (url: string) => {
         // Just set the template URL to enter "Editor Mode" without creating a DB record yet
         setTemplateUrl(url);
@@ -164,6 +186,17 @@ export default function Dashboard() {
                                                     </tbody>
                                                 </table>
                                             </div>
+                                            {jobsCursor && (
+                                                <div className="px-6 py-4 border-t border-slate-100 flex justify-center">
+                                                    <button
+                                                        onClick={loadMoreJobs}
+                                                        disabled={isLoadingJobs}
+                                                        className="px-4 py-2 rounded-lg text-sm font-bold text-indigo-600 hover:bg-indigo-50 transition-colors disabled:opacity-50 disabled:cursor-wait"
+                                                    >
+                                                        {isLoadingJobs ? "Loading..." : "Load older jobs"}
+                                                    </button>
+                                                </div>
+                                            )}
                                         </div>
                                     )}
                                 </div>
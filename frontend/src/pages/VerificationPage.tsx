@@ -40,12 +40,26 @@ export default function VerificationPage() {
         fetchCertificate();
     }, [id]);
 
+    const isPdfCertificate = !!cert?.image_url?.toLowerCase().endsWith('.pdf');
+
     const handleDownloadPDF = async () => {
         if (!cert?.image_url) return;
         setIsDownloading(true);
         try {
             const response = await fetch(cert.image_url);
             const blob = await response.blob();
+            const fileName = `${cert.recipient_name.replace(/\s+/g, '_')}_Certificate.pdf`;
+
+            // PDF-mode certificates are already vector PDFs — save them as-is
+            if (isPdfCertificate) {
+                const link = document.createElement('a');
+                link.href = URL.createObjectURL(blob);
+                link.download = fileName;
+                link.click();
+                URL.revokeObjectURL(link.href);
+                return;
+            }
+
             const imgData = await new Promise<string>((resolve) => {
                 const reader = new FileReader();
                 reader.onloadend = () => resolve(reader.result as string);
@@ -59,7 +73,7 @@ export default function VerificationPage() {
             });
 
             pdf.addImage(imgData, 'PNG', 0, 0, 800, 600);
-            pdf.save(`${cert.recipient_name.replace(/\s+/g, '_')}_Certificate.pdf`);
+            pdf.save(fileName);
         } catch (err) {
             console.error("PDF Download failed:", err);
             alert("Failed to generate PDF. Please try again.");
@@ -161,11 +175,20 @@ export default function VerificationPage() {
                         <div className="p-10 lg:p-12 flex flex-col justify-center items-center bg-white min-h-[400px]">
                             {cert.image_url ? (
                                 <div className="w-full space-y-6">
-                                    <img
-                                        src={cert.image_url}
-                                        alt="Certificate"
-                                        className="w-full h-auto rounded-xl shadow-lg border border-slate-200 object-contain"
-                                    />
+                                    {isPdfCertificate ? (
+                                        <object
+                                            data={cert.image_url}
+                                            type="application/pdf"
+                                            aria-label="Certificate"
+                                            className="w-full aspect-[1.414] rounded-xl shadow-lg border border-slate-200"
+                                        />
+                                    ) : (
+                                        <img
+                                            src={cert.image_url}
+                                            alt="Certificate"
+                                            className="w-full h-auto rounded-xl shadow-lg border border-slate-200 object-contain"
+                                        />
+                                    )}
                                     <div className="flex justify-center pb-4">
                                         <button
                                             onClick={handleDownloadPDF}